@@ -1,18 +1,37 @@
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from jose import jwt, JWTError
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 import os
-from scripts.crud import SECRET_KEY, ALGORITHM
-from routers import auth, upload, history, result, download, decisions, requirements_stats, process_analysis, export_csv, admin_panel, errors
+from scripts.crud import SECRET_KEY, ALGORITHM, backfill_occurrences
+from routers import auth, upload, history, result, download, decisions, requirements_stats, process_analysis, export_csv, admin_panel, errors, metrics, violations
 from scripts.models import Base
-from scripts.db import engine
+from scripts.db import engine, SessionLocal
+from scripts.jobs import start_inline_recovery
 
 load_dotenv()
 
-app = FastAPI()
+
+def _backfill_occurrences():
+    with SessionLocal() as db:
+        backfill_occurrences(db)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # версии, проанализированные до таблицы occurrences, индексируются один раз (отметка в data_migrations)
+    await run_in_threadpool(_backfill_occurrences)
+    # ANALYSIS_WORKER_MODE=inline: задачи, прерванные прошлым запуском API, выполняет само API
+    stop_jobs = start_inline_recovery()
+    yield
+    if stop_jobs is not None:
+        stop_jobs.set()
+
+app = FastAPI(lifespan=lifespan)
 
 Base.metadata.create_all(bind=engine)
 
@@ -26,7 +45,8 @@ app.add_middleware(
 
 PUBLIC_PATHS = {
     "/login",
-    "/reg"
+    "/reg",
+    "/metrics",   # своя проверка: METRICS_TOKEN или localhost (routers/metrics.py)
 }
 
 def _strip_bearer(auth_header: str | None):
@@ -43,14 +63,21 @@ async def jwt_auth_middleware(request: Request, call_next):
 
     raw = request.headers.get("Authorization")
     token = _strip_bearer(raw)
-    if not token:
+    # ссылка, открытая в новой вкладке: токен в query, действует только для своего пути (crud.sign_link)
+    link_token = None if token else request.query_params.get("token")
+    if not token and not link_token:
         return JSONResponse(status_code=401, content={"detail": "Authorization header is missing or invalid"})
 
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token or link_token, SECRET_KEY, algorithms=[ALGORITHM])
         exp = payload.get("exp")
         if exp is not None and datetime.fromtimestamp(exp, tz=timezone.utc) < datetime.now(tz=timezone.utc):
             return JSONResponse(status_code=401, content={"detail": "Token expired"})
+        if link_token:
+            if payload.get("scope") != "link" or payload.get("path") != request.url.path:
+                raise JWTError("Link token is not valid for this path")
+        elif payload.get("scope") == "link":
+            raise JWTError("Link token used as access token")
         username: str = payload.get("sub")
         if username is None:
             raise JWTError("No sub in token")
@@ -70,4 +97,6 @@ app.include_router(requirements_stats.router)
 app.include_router(process_analysis.router)
 app.include_router(errors.router)
 app.include_router(export_csv.router)
-app.include_router(admin_panel.router)
\ No newline at end of file
+app.include_router(admin_panel.router)
+app.include_router(metrics.router)
+app.include_router(violations.router)
\ No newline at end of file
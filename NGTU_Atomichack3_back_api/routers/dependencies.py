@@ -1,7 +1,8 @@
 from fastapi import Request, HTTPException, Depends
 from sqlalchemy.orm import Session
 from scripts.db import get_db
-from scripts.crud import get_user_by_login
+from scripts.crud import get_document, get_user_by_login
+from scripts.models import User
 
 def get_current_user(request: Request):
     user = getattr(request.state, "user", None)
@@ -9,6 +10,25 @@ def get_current_user(request: Request):
         raise HTTPException(status_code=401, detail="Could not validate credentials")
     return user
 
+def get_accessible_document(db: Session, doc_id: int, current_user: str):
+    """
+    Документ, доступный пользователю, — как в /result: нормоконтроллер видит документы
+    разработчиков, остальные — только свои.
+    """
+    user = get_user_by_login(db, current_user)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    doc = get_document(db, doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if user.role == "norm_controller":
+        doc_user = db.query(User).filter(User.id == doc.user_id).first()
+        if not doc_user or doc_user.role != "developer":
+            raise HTTPException(status_code=403, detail="Norm controller can only access developer documents")
+    elif doc.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return doc
+
 class RoleGuard:
     """
     Простой guard по ролям. Использование:
@@ -1,10 +1,11 @@
 import os
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 from scripts.db import get_db
-from scripts.crud import get_document, get_user_by_login
-from routers.dependencies import get_current_user
+from scripts.crud import get_document, get_user_by_login, list_versions_for_document
+from scripts.analysis import artifacts
+from routers.dependencies import get_accessible_document, get_current_user
 
 router = APIRouter()
 
@@ -22,17 +23,81 @@ def download_original(doc_id: int, db: Session = Depends(get_db), current_user:
     return FileResponse(file_path, filename=doc.filename)
 
 @router.get("/download_annotated/{doc_id}")
-def download_annotated(doc_id: int, db: Session = Depends(get_db), current_user: str = Depends(get_current_user)):
-    user = get_user_by_login(db, current_user)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    doc = get_document(db, doc_id)
-    if not doc or doc.user_id != user.id:
-        raise HTTPException(status_code=404, detail="Document not found")
-    if not doc.ann_pdf_path:
-        raise HTTPException(status_code=404, detail="Annotated file not available")
-    file_path = doc.ann_pdf_path
+def download_annotated(doc_id: int, version: int | None = None, layer: str | None = None,
+                       db: Session = Depends(get_db), current_user: str = Depends(get_current_user)):
+    """
+    Аннотированный PDF (последней версии или ?version=N). ?layer=1.1.3 — копия, в которой
+    по умолчанию включён только слой этого критерия.
+    """
+    doc = get_accessible_document(db, doc_id, current_user)
+    if version is None and layer is None:
+        if not doc.ann_pdf_path:
+            raise HTTPException(status_code=404, detail="Annotated file not available")
+        file_path = doc.ann_pdf_path
+        versions = [v for v in list_versions_for_document(db, doc.id) if v.ann_pdf_path == doc.ann_pdf_path]
+    else:
+        versions = list_versions_for_document(db, doc.id)
+        if version is not None:
+            versions = [v for v in versions if v.version_number == version]
+        if not versions or not versions[0].ann_pdf_path:
+            raise HTTPException(status_code=404, detail="Annotated file not available")
+        file_path = versions[0].ann_pdf_path
+
+    if layer is not None:
+        src = artifacts.version_source_pdf(versions[0])
+        view = artifacts.layer_pdf(file_path, src, layer)
+        if view is not None:
+            return FileResponse(view, filename=artifacts.view_filename(src, layer),
+                                media_type="application/pdf")
+        # версия без violations.json (до слоёв) — аннотированный PDF как есть
+
     if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="Annotated file not found")
+        # WRITE_ANNOTATED_PDF=0: анализ сохранил только список нарушений — строим PDF по запросу
+        lazy = artifacts.annotated_pdf(artifacts.version_source_pdf(versions[0])) if versions else None
+        if lazy is None:
+            raise HTTPException(status_code=404, detail="Annotated file not found")
+        return FileResponse(lazy, filename=os.path.basename(file_path), media_type="application/pdf")
     annotated_filename = os.path.basename(file_path)
-    return FileResponse(file_path, filename=annotated_filename)
\ No newline at end of file
+    return FileResponse(file_path, filename=annotated_filename)
+
+def _version_source_pdf(db: Session, doc, version: int | None) -> str:
+    """Исходный PDF версии (последней, если version не указан), рядом с ним — violations.json."""
+    versions = list_versions_for_document(db, doc.id)
+    if version is not None:
+        versions = [v for v in versions if v.version_number == version]
+    if not versions or not versions[0].ann_pdf_path:
+        raise HTTPException(status_code=404, detail="Annotated file not available")
+    return artifacts.version_source_pdf(versions[0])
+
+
+@router.get("/download_annotated/{doc_id}/error/{error_num}")
+def download_error_pdf(doc_id: int, error_num: int, version: int | None = None, mode: str | None = None,
+                       db: Session = Depends(get_db), current_user: str = Depends(get_current_user)):
+    """
+    PDF с одной ошибкой из отчёта; строится при первом запросе (кэш артефактов).
+    mode: crop — лист, обрезанный по ошибке; page — лист целиком; full — весь документ
+    (по умолчанию ERROR_EXTRACT_MODE).
+    """
+    doc = get_accessible_document(db, doc_id, current_user)
+    if mode is not None and mode not in artifacts.ERROR_EXTRACT_MODES:
+        raise HTTPException(status_code=400, detail="Unknown mode")
+    src = _version_source_pdf(db, doc, version)
+    path = artifacts.error_pdf(src, error_num, mode)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Error not found")
+    return FileResponse(path, filename=artifacts.view_filename(src, f"error_{error_num:03d}"),
+                        media_type="application/pdf")
+
+
+@router.get("/download_annotated/{doc_id}/error/{error_num}/png")
+def download_error_png(doc_id: int, error_num: int, version: int | None = None,
+                       dpi: int | None = Query(None, ge=36, le=600),
+                       db: Session = Depends(get_db), current_user: str = Depends(get_current_user)):
+    """PNG области ошибки (по умолчанию ERROR_PNG_DPI)."""
+    doc = get_accessible_document(db, doc_id, current_user)
+    src = _version_source_pdf(db, doc, version)
+    path = artifacts.error_png(src, error_num, dpi)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Error not found")
+    return FileResponse(path, filename=artifacts.view_filename(src, f"error_{error_num:03d}", ".png"),
+                        media_type="image/png")
@@ -3,9 +3,8 @@ import os
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from scripts.db import get_db
-from scripts.crud import get_user_by_login, get_document, list_versions_for_document
+from scripts.crud import get_user_by_login, get_document, list_versions_for_document, version_report
 from routers.dependencies import get_current_user
-from scripts.parse_report import parse_report
 
 router = APIRouter()
 
@@ -36,9 +35,6 @@ def list_error_occurrences(
     if not report_path or not os.path.exists(report_path):
         return {"occurrences": []}
 
-    with open(report_path, "r", encoding="utf-8") as f:
-        report_content = f.read()
-
-    parsed = parse_report(report_content, doc_id=doc.id)
+    parsed = version_report(db, latest, doc_id=doc.id)
     # вернём только ID/point/description для таргетинга
     return {"occurrences": parsed.get("occurrences", [])}
@@ -1,61 +1,173 @@
-import os
+import base64
+import json
+from datetime import date, datetime, timedelta
+
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, case, func, or_, select
+from sqlalchemy.orm import Session, aliased
 
 from scripts.db import get_db
 from scripts.crud import (
-    get_documents_for_user,
     get_user_by_login,
-    list_versions_for_document,
+    list_versions_for_documents,
+    version_reports,
+    version_violation_counts,
 )
-from scripts.parse_report import parse_report
+from scripts.models import Document, DocumentVersion, Occurrence, User
 from routers.dependencies import get_current_user
 
 router = APIRouter()
 
-@router.get("/history")
-def get_history(db: Session = Depends(get_db), current_user: str = Depends(get_current_user)):
-    user = get_user_by_login(db, current_user)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+HISTORY_DEFAULT_LIMIT = 50
+HISTORY_MAX_LIMIT = 500
+
+# поля элемента истории (fields=); developer_* — только для нормоконтроллера
+HISTORY_FIELDS = (
+    "id", "filename", "upload_date", "status", "status_author", "processing_status",
+    "total_violations", "error_points", "error_counts", "versions",
+    "developer_login", "developer_full_name", "developer_id",
+)
+# поля, для которых нужны срабатывания первой версии
+REPORT_FIELDS = {"total_violations", "error_points", "error_counts"}
+
+# сортировка: имя -> (столбец, значение для NULL); "-" в начале — по убыванию, при равенстве — по id
+SORT_KEYS = {
+    "id": (Document.id, None),
+    "upload_date": (Document.upload_date, datetime(1, 1, 1)),
+    "filename": (Document.filename, ""),
+}
+# статус файла, как его показывает _history_items: вердикт последней версии, иначе по завершённому
+# анализу (есть срабатывания — rejected, нет — approved); processing — анализ не завершён (статус "")
+FILE_STATUSES = ("approved", "rejected", "removed", "processing")
+
 
-    # Для нормоконтроллера возвращаем историю всех разработчиков
+def _file_status_expr(latest):
+    """SQL-выражение статуса файла для последней версии latest (aliased DocumentVersion)."""
+    has_violations = select(Occurrence.id).where(Occurrence.version_id == latest.id).exists()
+    return case(
+        (latest.verdict_status.in_(FILE_STATUSES[:3]), latest.verdict_status),
+        (and_(latest.report_path.isnot(None), latest.report_path != ""),
+         case((has_violations, "rejected"), else_="approved")),
+        else_="processing",
+    )
+
+
+def _encode_cursor(sort: str, key, doc_id: int) -> str:
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    raw = json.dumps({"s": sort, "k": key, "id": doc_id}, ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw.decode("utf-8"))
+        key, doc_id = data["k"], int(data["id"])
+        if data["s"] != sort:
+            raise ValueError("sort mismatch")
+        if sort.lstrip("-") == "upload_date":
+            key = datetime.fromisoformat(key)
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor (or sort changed since it was issued)")
+    return key, doc_id
+
+
+def _parse_fields(fields: str | None, summary: bool) -> set[str]:
+    if fields:
+        wanted = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = wanted - set(HISTORY_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        return wanted | {"id"}
+    if summary:
+        # без массивов по срабатываниям
+        return set(HISTORY_FIELDS) - {"error_points"}
+    return set(HISTORY_FIELDS)
+
+
+def _history_rows(db: Session, user: User, *, status=None, developer_id=None, date_from=None, date_to=None,
+                  q=None, sort="id", after=None, limit=None):
+    """(Document, владелец) с фильтрами в SQL; after — (ключ, id) курсора, limit — размер страницы + 1."""
+    query = db.query(Document, User)
     if user.role == "norm_controller":
-        # Получаем все документы всех пользователей-разработчиков
-        from scripts.models import Document, User
-        docs = db.query(Document).join(User).filter(User.role == "developer").all()
+        # Все документы всех пользователей-разработчиков
+        query = query.join(User, User.id == Document.user_id).filter(User.role == "developer")
+        if developer_id is not None:
+            query = query.filter(Document.user_id == developer_id)
     else:
-        # Для обычного пользователя возвращаем только его документы
-        docs = get_documents_for_user(db, user.id)
-    history = []
+        # Для обычного пользователя — только его документы
+        query = query.outerjoin(User, User.id == Document.user_id).filter(Document.user_id == user.id)
 
-    for doc in docs:
-        versions = list_versions_for_document(db, doc.id)
+    if status:
+        # статус по последней версии (наибольший version_number)
+        latest_num = db.query(DocumentVersion.document_id, func.max(DocumentVersion.version_number).label("num")) \
+                       .group_by(DocumentVersion.document_id).subquery()
+        latest = aliased(DocumentVersion)
+        query = query.outerjoin(latest_num, latest_num.c.document_id == Document.id) \
+                     .outerjoin(latest, and_(latest.document_id == Document.id,
+                                             latest.version_number == latest_num.c.num))
+        query = query.filter(_file_status_expr(latest) == status)
+    if date_from:
+        query = query.filter(Document.upload_date >= datetime.combine(date_from, datetime.min.time()))
+    if date_to:
+        query = query.filter(Document.upload_date < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    if q:
+        pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        query = query.filter(Document.filename.ilike(pattern, escape="\\"))
+
+    desc = sort.startswith("-")
+    column, null_value = SORT_KEYS[sort.lstrip("-")]
+    key = func.coalesce(column, null_value) if null_value is not None else column
+    if after is not None:
+        after_key, after_id = after
+        if column is Document.id:
+            query = query.filter(Document.id < after_id if desc else Document.id > after_id)
+        elif desc:
+            query = query.filter(or_(key < after_key, and_(key == after_key, Document.id < after_id)))
+        else:
+            query = query.filter(or_(key > after_key, and_(key == after_key, Document.id > after_id)))
+    if column is Document.id:
+        query = query.order_by(Document.id.desc() if desc else Document.id)
+    else:
+        query = query.order_by(key.desc(), Document.id.desc()) if desc else query.order_by(key, Document.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def _history_items(db: Session, user: User, rows, fields: set[str]) -> list[dict]:
+    """Элементы истории для строк (Document, владелец): версии, срабатывания и счётчики — по одному запросу."""
+    versions_by_doc = list_versions_for_documents(db, [doc.id for doc, _ in rows])
+    first_reports = {}
+    if fields & REPORT_FIELDS:
+        first_reports = version_reports(db, [vs[-1] for vs in versions_by_doc.values() if vs])
+    counts = version_violation_counts(db, [v.id for vs in versions_by_doc.values() for v in vs])
+
+    history = []
+    for doc, doc_user in rows:
+        versions = versions_by_doc[doc.id]
 
         latest = versions[0] if versions else None
-        first_v = versions[-1]
+        first_v = versions[-1] if versions else None
         processing_status = "processing"
         file_status = ""   # по умолчанию пустой статус до появления отчёта
-        
+        status_author = "Цифровой помощник конструктора"
+
         # ---- ОТЧЁТ ПО ПЕРВОЙ ВЕРСИИ (замороженные error_points/error_counts) ----
-        first_report_content = ""
-        if getattr(first_v, "report_path", None) and os.path.exists(first_v.report_path):
-            with open(first_v.report_path, "r", encoding="utf-8") as f:
-                first_report_content = f.read()
-        parsed_first = parse_report(first_report_content, doc_id=doc.id)
+        parsed_first = first_reports.get(first_v.id, {}) if first_v else {}
         frozen_error_points = parsed_first.get("error_points", []) or []
         frozen_error_counts = parsed_first.get("error_counts", {}) or {}
         frozen_total = int(parsed_first.get("total_violations", 0) or 0)
 
         if latest:
-            # обработка / парсинг отчёта последней версии
-            if getattr(latest, "report_path", None) and os.path.exists(latest.report_path):
+            # анализ последней версии завершён — отчёт сохранён
+            total_violations = 0
+            if getattr(latest, "report_path", None):
                 processing_status = "complete"
-                with open(latest.report_path, "r", encoding="utf-8") as f:
-                    report_content = f.read()
-                parsed = parse_report(report_content, doc_id=doc.id)
-                total_violations = int(parsed.get("total_violations", 0) or 0)
-                
+                total_violations = counts.get(latest.id, 0)
+            elif getattr(latest, "verdict_status", None) == "failed":
+                processing_status = "error"   # анализ не удался после JOB_MAX_ATTEMPTS попыток
 
             # статус файла (approved/rejected/removed) — как в /result
             allowed = {"approved", "rejected", "removed"}
@@ -71,18 +183,18 @@ def get_history(db: Session = Depends(get_db), current_user: str = Depends(get_c
         # краткая сводка по всем версиям
         versions_summary = []
         for v in versions:
-            v_processing = "complete" if (getattr(v, "report_path", None) and os.path.exists(v.report_path)) else "processing"
+            v_processing = "complete" if getattr(v, "report_path", None) else \
+                "error" if getattr(v, "verdict_status", None) == "failed" else "processing"
             versions_summary.append({
                 "version_id": v.id,
                 "version_number": getattr(v, "version_number", None),
                 "upload_date": v.upload_date.isoformat() if v.upload_date else "",
                 "status": getattr(v, "verdict_status", "processing"),
                 "processing_status": v_processing,
+                "total_violations": counts.get(v.id, 0),
             })
 
-        # Получаем информацию о пользователе, который загрузил документ
-        from scripts.models import User
-        doc_user = db.query(User).filter(User.id == doc.user_id).first()
+        # пользователь, который загрузил документ
         user_full_name = doc_user.full_name or doc_user.login if doc_user else "Unknown"
 
         item = {
@@ -104,6 +216,62 @@ def get_history(db: Session = Depends(get_db), current_user: str = Depends(get_c
             item["developer_full_name"] = user_full_name
             item["developer_id"] = doc.user_id
 
+        if fields != set(HISTORY_FIELDS):
+            item = {k: v for k, v in item.items() if k in fields}
         history.append(item)
-
     return history
+
+
+@router.get("/history")
+def get_history(
+    limit: int = None,
+    cursor: str = None,
+    sort: str = "id",
+    status: str = None,
+    developer_id: int = None,
+    date_from: date = None,
+    date_to: date = None,
+    q: str = None,
+    fields: str = None,
+    summary: bool = False,
+    db: Session = Depends(get_db),
+    current_user: str = Depends(get_current_user),
+):
+    """
+    История документов. Без limit/cursor — весь список (как раньше), иначе страница
+    {"items", "next_cursor"}: следующий запрос — с тем же sort и cursor=next_cursor.
+    Фильтры (status, developer_id, date_from/date_to, q — подстрока имени файла) и сортировка
+    (id, upload_date, filename; "-" — по убыванию) выполняются в БД; fields= — список полей
+    элемента, summary=true — без error_points. Число запросов не зависит от объёма истории.
+    """
+    user = get_user_by_login(db, current_user)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    if sort.lstrip("-") not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort: {sort}")
+    if status is not None and status not in FILE_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Unknown status: {status}")
+    paged = limit is not None or cursor is not None
+    if paged:
+        limit = HISTORY_DEFAULT_LIMIT if limit is None else limit
+        if not 1 <= limit <= HISTORY_MAX_LIMIT:
+            raise HTTPException(status_code=400, detail=f"limit must be between 1 and {HISTORY_MAX_LIMIT}")
+    wanted = _parse_fields(fields, summary)
+    after = _decode_cursor(cursor, sort) if cursor else None
+
+    rows = _history_rows(
+        db, user, status=status, developer_id=developer_id, date_from=date_from, date_to=date_to,
+        q=q, sort=sort, after=after, limit=limit + 1 if paged else None,
+    )
+    if not paged:
+        return _history_items(db, user, rows, wanted)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0]
+        column, null_value = SORT_KEYS[sort.lstrip("-")]
+        key = getattr(last, column.key)
+        next_cursor = _encode_cursor(sort, key if key is not None else null_value, last.id)
+    return {"items": _history_items(db, user, rows, wanted), "next_cursor": next_cursor}
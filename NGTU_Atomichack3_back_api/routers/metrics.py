@@ -0,0 +1,38 @@
+# routers/metrics.py
+import hmac
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.orm import Session
+
+from scripts.db import get_db
+from scripts.metrics import REPORT_CACHE_HITS, REPORT_CACHE_MISSES, get_counters, render_prometheus
+from scripts.parse_report import report_cache_stats
+
+router = APIRouter()
+
+# /metrics не требует JWT пользователя (путь исключён в app.py): Prometheus передаёт
+# "Authorization: Bearer <METRICS_TOKEN>". Без METRICS_TOKEN — только запросы с localhost.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+LOCAL_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
+
+def require_metrics_access(request: Request):
+    if METRICS_TOKEN:
+        auth = request.headers.get("Authorization", "")
+        token = auth[len("Bearer "):] if auth.startswith("Bearer ") else ""
+        if not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    elif not request.client or request.client.host not in LOCAL_HOSTS:
+        raise HTTPException(status_code=403, detail="Set METRICS_TOKEN to scrape /metrics remotely")
+
+
+@router.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_metrics_access)])
+def metrics(db: Session = Depends(get_db)):
+    """Счётчики в текстовом формате Prometheus (кэш результатов анализа, кэш отчётов и т.п.)."""
+    counters = get_counters(db)
+    stats = report_cache_stats()
+    counters[REPORT_CACHE_HITS] = stats["hits"]
+    counters[REPORT_CACHE_MISSES] = stats["misses"]
+    return render_prometheus(counters)
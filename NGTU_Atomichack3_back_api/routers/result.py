@@ -1,10 +1,12 @@
 import os
+from urllib.parse import quote
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from scripts.db import get_db
-from scripts.crud import get_document, get_user_by_login, list_versions_for_document, list_decisions_for_version, set_verdict, add_decision, update_decision, get_decision_by_id, get_decision_by_occ_id, get_decisions_by_version_and_point
+from scripts.crud import get_document, get_user_by_login, list_versions_for_document, list_versions_with_decisions, list_decisions_for_version, set_verdict, add_decision, update_decision, get_decision_by_id, get_decision_by_occ_id, get_decisions_by_version_and_point, version_reports, sign_link
 from routers.dependencies import get_current_user
-from scripts.parse_report import parse_report
+from scripts.parse_report import report_text
+from scripts.analysis import artifacts
 from .result_models import DetailedResult, ErrorPoint
 from typing import List, Dict, Optional
 
@@ -33,7 +35,8 @@ def get_result(doc_id: int, db: Session = Depends(get_db), current_user: str = D
         if doc.user_id != user.id:
             raise HTTPException(status_code=404, detail="Document not found")
 
-    versions = list_versions_for_document(db, doc.id)
+    # версии с решениями и срабатывания всех версий — по одному запросу, дальше всё из памяти
+    versions = list_versions_with_decisions(db, doc.id)
     if not versions:
         return {
             "id": str(doc.id),
@@ -77,16 +80,27 @@ def get_result(doc_id: int, db: Session = Depends(get_db), current_user: str = D
     first_ann_name = os.path.splitext(first_v.filename or "document")[0] + ".annotated.pdf"
     file_url_annotated = first_v.ann_pdf_path if first_v and first_v.ann_pdf_path else ""
 
-    # ---- helper: парсер отчёта версии -> (occurrences, counts, full_report, error_points) ----
-    def _parse_version(v):
+    reports = version_reports(db, versions)
+    decisions_by_version = {v.id: sorted(v.decisions, key=lambda d: d.id) for v in versions}
+    final_pdf_for = _final_pdf_by_point(doc.id, versions, decisions_by_version, current_user)
+
+    # PDF ошибки: одна проверка файлов на (версия, номер ошибки); ссылка открывается без заголовка
+    pdf_urls = {}
+    def _error_pdf_url(v, error_num):
+        key = (v.id, error_num)
+        if key not in pdf_urls:
+            pdf_urls[key] = sign_link(artifacts.error_pdf_url(doc.id, v, error_num), current_user)
+        return pdf_urls[key]
+
+    # ---- helper: срабатывания версии -> (occurrences, counts, full_report, error_points) ----
+    def _parse_version(v, with_full: bool = False):
+        parsed = reports[v.id]
         txt = ""
-        if getattr(v, "report_path", None) and os.path.exists(v.report_path):
-            with open(v.report_path, "r", encoding="utf-8") as f:
-                txt = f.read()
-        parsed = parse_report(txt, doc_id=doc.id)
+        if with_full and getattr(v, "report_path", None) and os.path.exists(v.report_path):
+            txt = report_text(v.report_path)
         occs = parsed.get("occurrences", []) or []
         counts = parsed.get("error_counts", {}) or {}
-        full = parsed.get("full_report", txt or "")
+        full = txt
         error_points = parsed.get("error_points", []) or []
         return occs, counts, full, error_points
 
@@ -105,35 +119,15 @@ def get_result(doc_id: int, db: Session = Depends(get_db), current_user: str = D
         if not pt:
             continue
         # элемент списка
-        # Формируем путь к специфичному PDF файлу для этой ошибки
-        specific_pdf_url = ""
-        if first_v and first_v.ann_pdf_path and error_num:
-            # Получаем базовую директорию
-            base_dir = os.path.dirname(first_v.ann_pdf_path)
-            # Получаем имя файла без расширения
-            base_name = os.path.splitext(os.path.basename(first_v.ann_pdf_path))[0]
-            # Убираем суффикс ".annotated" из base_name, чтобы получить корректное имя файла
-            if base_name.endswith('.annotated'):
-                base_name = base_name[:-len('.annotated')]
-            # Формируем имя специфичного PDF файла с номером ошибки
-            specific_pdf_name = f"{base_name}.error_{error_num}.pdf"
-            specific_pdf_url = os.path.join(base_dir, specific_pdf_name)
-            # Проверяем, существует ли такой файл
-            if not os.path.exists(specific_pdf_url):
-                # Если специфичный файл не существует, используем общий аннотированный PDF
-                specific_pdf_url = first_v.ann_pdf_path
-        elif first_v and first_v.ann_pdf_path:
-            # Если номер ошибки не доступен, используем общий аннотированный PDF
-            specific_pdf_url = first_v.ann_pdf_path
-        else:
-            specific_pdf_url = ""
-            
+        # PDF с этой ошибкой (строится по запросу), иначе общий аннотированный PDF
+        specific_pdf_url = _error_pdf_url(first_v, error_num)
+
         frozen_error_points.append({
             "point": pt,
             "description": desc,
             "pdf_url": specific_pdf_url,
             "occ_id": oid,
-            "final_pdf_url": _get_final_pdf_for_criterion(db, doc.id, pt)  # Финальный PDF для критерия
+            "final_pdf_url": final_pdf_for(pt)  # Финальный PDF для критерия
         })
         seen_occ_ids.add(oid)
         # счётчики
@@ -158,35 +152,14 @@ def get_result(doc_id: int, db: Session = Depends(get_db), current_user: str = D
             desc = error_point.get("description") or ""
             error_num = error_point.get("error_num")  # Номер ошибки из отчета
             # добавим запись в список (чтобы фронт видел «ещё одну ошибку по этому пункту»)
-            # Формируем путь к специфичному PDF файлу для этой ошибки
-            specific_pdf_url = ""
-            if v and v.ann_pdf_path and error_num:
-                # Получаем базовую директорию
-                base_dir = os.path.dirname(v.ann_pdf_path)
-                # Получаем имя файла без расширения
-                base_name = os.path.splitext(os.path.basename(v.ann_pdf_path))[0]
-                # Убираем суффикс ".annotated" из base_name, чтобы получить корректное имя файла
-                if base_name.endswith('.annotated'):
-                    base_name = base_name[:-len('.annotated')]
-                # Формируем имя специфичного PDF файла с номером ошибки
-                specific_pdf_name = f"{base_name}.error_{error_num}.pdf"
-                specific_pdf_url = os.path.join(base_dir, specific_pdf_name)
-                # Проверяем, существует ли такой файл
-                if not os.path.exists(specific_pdf_url):
-                    # Если специфичный файл не существует, используем общий аннотированный PDF
-                    specific_pdf_url = v.ann_pdf_path
-            elif v and v.ann_pdf_path:
-                # Если номер ошибки не доступен, используем общий аннотированный PDF
-                specific_pdf_url = v.ann_pdf_path
-            else:
-                specific_pdf_url = ""
-                
+            specific_pdf_url = _error_pdf_url(v, error_num)
+
             frozen_error_points.append({
                 "point": pt,
                 "description": desc,
                 "pdf_url": specific_pdf_url,
                 "occ_id": oid,
-                "final_pdf_url": _get_final_pdf_for_criterion(db, doc.id, pt)  # Финальный PDF для критерия
+                "final_pdf_url": final_pdf_for(pt)  # Финальный PDF для критерия
             })
             seen_occ_ids.add(oid)
             # обновим счётчик для пункта
@@ -207,8 +180,10 @@ def get_result(doc_id: int, db: Session = Depends(get_db), current_user: str = D
     frozen_total = sum(int(v or 0) for v in frozen_error_counts.values())
 
     # ---- live (последняя версия) — нужен для статусов и full_report ----
-    latest_occs, latest_counts, latest_full, _ = _parse_version(latest)
+    latest_occs, latest_counts, latest_full, _ = _parse_version(latest, with_full=True)
     processing_status = "complete" if latest_occs or (getattr(latest, "report_path", None) and os.path.exists(latest.report_path)) else "processing"
+    if processing_status == "processing" and getattr(latest, "verdict_status", None) == "failed":
+        processing_status = "error"   # анализ не удался после JOB_MAX_ATTEMPTS попыток
 
     # ---- статус файла (approved / rejected / removed) ----
     allowed = {"approved", "rejected", "removed"}
@@ -226,19 +201,15 @@ def get_result(doc_id: int, db: Session = Depends(get_db), current_user: str = D
         m = re.search(r"\[occ:([0-9a-fA-F]{6,64})\]|\(occ:([0-9a-fA-F]{6,64})\)", comment)
         return (m.group(1) or m.group(2)) if m else None
 
-    def _occ_point_map_for_version(v) -> dict:
-        mp = {}
-        occs, _, _, _ = _parse_version(v)
-        for o in occs:
-            if o.get("id") and o.get("point"):
-                mp[o["id"]] = o["point"]
-        return mp
-
     all_decisions = []
     seen_decision_ids = set()
     for ver in versions:
-        rows = list_decisions_for_version(db, ver.id)
-        occ_point_map = _occ_point_map_for_version(ver)
+        rows = decisions_by_version[ver.id]
+        occ_point_map = {o["id"]: o["point"] for o in reports[ver.id]["occurrences"]}
+        # occ_id -> номер ошибки (первое срабатывание в порядке отчёта)
+        occ_error_num = {}
+        for error_point in reports[ver.id]["error_points"]:
+            occ_error_num.setdefault(error_point.get("occ_id"), error_point.get("error_num"))
 
         base_dir = f"data/original/{doc.id}/v{ver.version_number}"
         # original_path должен указывать на исходный PDF файл, а не на отчет
@@ -259,38 +230,11 @@ def get_result(doc_id: int, db: Session = Depends(get_db), current_user: str = D
             occ_id = _extract_occ_id(d.comment)
             ep = d.error_point or (occ_point_map.get(occ_id, "") if occ_id else "")
 
-            # Получаем номер ошибки из решения, если он есть
-            # Для этого нужно получить информацию об ошибке из результата парсинга
-            error_num = None
-            # Получаем все ошибки для текущей версии, чтобы найти error_num для текущего occ_id
-            _, _, _, version_error_points = _parse_version(ver)
-            for error_point in version_error_points:
-                if error_point.get("occ_id") == occ_id:
-                    error_num = error_point.get("error_num")
-                    break
-
-            # Формируем путь к специфичному PDF файлу для этой ошибки
-            specific_pdf_url = ""
-            if ver and ver.ann_pdf_path and error_num:
-                # Получаем базовую директорию
-                base_dir = os.path.dirname(ver.ann_pdf_path)
-                # Получаем имя файла без расширения
-                base_name = os.path.splitext(os.path.basename(ver.ann_pdf_path))[0]
-                # Убираем суффикс ".annotated" из base_name, чтобы получить корректное имя файла
-                if base_name.endswith('.annotated'):
-                    base_name = base_name[:-len('.annotated')]
-                # Формируем имя специфичного PDF файла с номером ошибки
-                specific_pdf_name = f"{base_name}.error_{error_num}.pdf"
-                specific_pdf_url = os.path.join(base_dir, specific_pdf_name)
-                # Проверяем, существует ли такой файл
-                if not os.path.exists(specific_pdf_url):
-                    # Если специфичный файл не существует, используем общий аннотированный PDF
-                    specific_pdf_url = ver.ann_pdf_path
-            elif ver and ver.ann_pdf_path:
-                # Если номер ошибки не доступен, используем общий аннотированный PDF
-                specific_pdf_url = ver.ann_pdf_path
-            else:
-                specific_pdf_url = ""
+            # номер ошибки по occ_id решения
+            error_num = occ_error_num.get(occ_id) if occ_id else None
+
+            # PDF с этой ошибкой (строится по запросу), иначе общий аннотированный PDF
+            specific_pdf_url = _error_pdf_url(ver, error_num)
 
             is_dev = (d.author_role == "developer")
             file_fix_url = original_path if is_dev else ""
@@ -333,7 +277,7 @@ def get_result(doc_id: int, db: Session = Depends(get_db), current_user: str = D
         # вся история решений
         "decisions": all_decisions,
         # Финальные PDF файлы
-        "final_approved_pdf": _get_final_approved_pdf(db, doc.id),
+        "final_approved_pdf": (latest.ann_pdf_path or "") if doc.status == "approved" else "",
     }
 
 
@@ -500,70 +444,35 @@ def update_criterion_status(
     }
 
 
-def _get_final_pdf_for_criterion(db: Session, doc_id: int, criterion_point: str) -> str:
+def _final_pdf_by_point(doc_id: int, versions, decisions_by_version: dict, login: str):
     """
-    Получает путь к финальному PDF для конкретного критерия ошибки
-    Возвращает путь к PDF последней версии, где данный критерий был исправлен
+    Функция point -> ссылка на финальный PDF критерия: аннотированный PDF версии с последним
+    решением 'fixed' по этому пункту (иначе последней версии), в котором включён только слой
+    пункта (/download_annotated/{doc_id}?version=N&layer=1.1.3, подписана для login).
+    Решения уже загружены; карта строится за один проход по ним.
     """
-    try:
-        # Получаем все версии документа
-        versions = list_versions_for_document(db, doc_id)
-        if not versions:
-            return ""
-        
-        # Ищем последнюю версию, где есть решения для этого критерия
-        latest_applicable_version = None
-        latest_decision_date = None
-        
-        for version in versions:
-            decisions = list_decisions_for_version(db, version.id)
-            # Ищем решения для данного критерия с статусом 'fixed'
-            applicable_decisions = [
-                d for d in decisions 
-                if d.error_point == criterion_point and d.status == 'fixed'
-            ]
-            
-            if applicable_decisions:
-                # Если нашли решения для этого критерия, проверяем дату
-                for decision in applicable_decisions:
-                    decision_time = decision.timestamp
-                    if latest_decision_date is None or decision_time > latest_decision_date:
-                        latest_decision_date = decision_time
-                        latest_applicable_version = version
-        
-        # Если не нашли версию с исправлениями для этого критерия, используем последнюю
-        if latest_applicable_version is None:
-            latest_applicable_version = versions[0]  # берем последнюю версию
-        
-        # Возвращаем путь к аннотированному PDF этой версии
-        if latest_applicable_version and latest_applicable_version.ann_pdf_path:
-            return latest_applicable_version.ann_pdf_path
-            
-        return ""
-    except Exception:
-        return ""
-
-
-def _get_final_approved_pdf(db: Session, doc_id: int) -> str:
-    """
-    Получает путь к финальному утвержденному PDF документа
-    """
-    try:
-        doc = get_document(db, doc_id)
-        if not doc or doc.status != "approved":
+    latest_fixed = {}   # point -> (timestamp, версия)
+    broken = set()      # пункты, где время решений несравнимо (None рядом с датой) — пустой путь
+    for version in versions:
+        for d in decisions_by_version.get(version.id, []):
+            if d.status != "fixed" or d.error_point is None or d.error_point in broken:
+                continue
+            prev = latest_fixed.get(d.error_point)
+            try:
+                if prev is None or prev[0] is None or d.timestamp > prev[0]:
+                    latest_fixed[d.error_point] = (d.timestamp, version)
+            except TypeError:
+                broken.add(d.error_point)
+
+    urls = {}
+    def final_pdf(point: str) -> str:
+        if point in broken or not versions:
             return ""
-        
-        # Получаем последнюю версию
-        versions = list_versions_for_document(db, doc_id)
-        if not versions:
+        version = latest_fixed[point][1] if point in latest_fixed else versions[0]
+        if not version.ann_pdf_path:
             return ""
-        
-        latest_version = versions[0]  # самая последняя версия
-        
-        # Используем путь из БД
-        if latest_version and latest_version.ann_pdf_path:
-            return latest_version.ann_pdf_path
-            
-        return ""
-    except Exception:
-        return ""
+        if point not in urls:
+            url = f"/download_annotated/{doc_id}?version={version.version_number}&layer={quote(point)}"
+            urls[point] = sign_link(url, login)
+        return urls[point]
+    return final_pdf
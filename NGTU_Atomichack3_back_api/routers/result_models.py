@@ -6,6 +6,7 @@ class ErrorPoint(BaseModel):
     description: str
     pdf_url: str
     occ_id: Optional[str] = None
+    final_pdf_url: Optional[str] = None      # аннотированный PDF со слоем критерия: "...pdf#layer=1.1.3"
 
 class Decision(BaseModel):
     id: str
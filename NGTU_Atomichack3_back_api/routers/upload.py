@@ -2,8 +2,6 @@
 from fastapi import APIRouter, UploadFile, File, Depends, BackgroundTasks, HTTPException, Query
 from sqlalchemy.orm import Session
 from scripts.db import get_db
-from scripts.db import SessionLocal
-from scripts.crud import update_version_analysis
 from scripts.crud import (
     create_document,
     get_user_by_login,
@@ -11,77 +9,18 @@ from scripts.crud import (
     list_versions_for_document,
     get_document,
     add_decision,
+    version_occ_points,
 )
-from scripts.analysis.main import make_report_files, pipeline
+from scripts.jobs import ANALYSIS_WORKER_MODE, enqueue_analysis_job, run_job_inline
 from scripts.analysis.drawing_comparator import compare_drawings
-from scripts.parse_report import parse_report
 from datetime import datetime
-import os, glob
-import shutil
+import os
+import hashlib
 
 from routers.dependencies import get_current_user
 
 router = APIRouter()
 
-def _normalize_analysis_result(result, original_path: str):
-    """
-    Возвращает (ann_pdf_path, report_path) из результата make_report_files.
-    Поддерживает tuple/list, dict с разными ключами и fallback-поиск рядом с файлом.
-    """
-    # tuple/list
-    if isinstance(result, (list, tuple)) and len(result) >= 2:
-        return str(result[0]), str(result[1])
-
-    # dict
-    if isinstance(result, dict):
-        ann_keys = ("ann_pdf_path", "annotated_path", "annotated_pdf", "annotated")
-        rep_keys = ("report_path", "report", "report_txt", "analysis_report", "txt")
-        ann = next((result[k] for k in ann_keys if k in result), None)
-        rep = next((result[k] for k in rep_keys if k in result), None)
-        if ann and rep:
-            return str(ann), str(rep)
-
-    # fallback: ищем *.annotated.pdf и *.report.* в каталоге исходника
-    base_dir = os.path.dirname(original_path)
-    base_name = os.path.splitext(os.path.basename(original_path))[0]
-
-    cand_ann = os.path.join(base_dir, f"{base_name}.annotated.pdf")
-    if not os.path.exists(cand_ann):
-        found = glob.glob(os.path.join(base_dir, "*.annotated.pdf"))
-        cand_ann = found[0] if found else ""
-
-    rep_glob = glob.glob(os.path.join(base_dir, f"{base_name}.report.*")) or \
-               glob.glob(os.path.join(base_dir, "*.report.*")) or \
-               glob.glob(os.path.join(base_dir, "*.txt"))
-    cand_rep = rep_glob[0] if rep_glob else ""
-
-    return cand_ann, cand_rep
-
-def _run_analysis_and_update(version_id: int, original_path: str):
-    """
-    Фоновая задача: запускает анализ и сохраняет результаты в БД.
-    ВАЖНО: открываем собственную сессию БД — фоновые задачи не получают Depends(get_db).
-    """
-    # 1) запускаем анализатор: сначала pipeline, затем make_report_files
-    try:
-        # Запускаем анализ
-        pipeline_out = pipeline(original_path)
-        # Затем создаем отчеты
-        result = make_report_files(original_path, pipeline_out)
-    except TypeError:
-        # на случай, если анализатор ожидает (path, out_dir=None)
-        pipeline_out = pipeline(original_path)
-        result = make_report_files(original_path, pipeline_out, None)
-
-    ann_pdf_path, report_path = _normalize_analysis_result(result, original_path)
-
-    # 2) сохраняем в БД и перекладываем файлы в правильную папку v{version_number}
-    db = SessionLocal()
-    try:
-        update_version_analysis(db, version_id, ann_pdf_path, report_path)
-    finally:
-        db.close()
-
 def _version_dir(doc_id: int, ver_number: int) -> str:
     return f"data/original/{doc_id}/v{ver_number}"
 
@@ -93,11 +32,7 @@ def _collect_occ_map_for_validation(db: Session, doc_id: int) -> dict:
     for v in versions:  # от свежей к старой
         rp = getattr(v, "report_path", None)
         if rp and os.path.exists(rp):
-            with open(rp, "r", encoding="utf-8") as f:
-                report_content = f.read()
-            parsed = parse_report(report_content, doc_id=doc_id)
-            occs = parsed.get("occurrences", []) or []
-            return {o["id"]: o["point"] for o in occs if o.get("id") and o.get("point")}
+            return version_occ_points(db, v.id)
     return {}
 
 @router.post("/upload")
@@ -160,8 +95,13 @@ async def upload_file(
     os.makedirs(doc_dir, exist_ok=True)
 
     file_path = f"{doc_dir}/{file.filename}"
+    # sha256 считаем на лету при записи — ключ кэша результатов анализа
+    hasher = hashlib.sha256()
     with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+        while chunk := file.file.read(1024 * 1024):
+            hasher.update(chunk)
+            buffer.write(chunk)
+    content_sha256 = hasher.hexdigest()
 
     # === СРАВНЕНИЕ ЧЕРТЕЖЕЙ С ПРЕДЫДУЩЕЙ ВЕРСИЕЙ ===
     # Если это не первая версия (есть предыдущие версии), сравниваем с предыдущей версией
@@ -233,10 +173,12 @@ async def upload_file(
                 timestamp=datetime.utcnow(),
             )
 
-    # === Запускаем анализ (analysis-скрипты НЕ трогаем) ===
-    # Вызов остаётся совместимым с вашими скриптами: передаём doc.id
+    # === Ставим анализ в очередь (analysis_jobs) ===
+    # Выполняет воркер (python -m worker); в режиме inline — само API в фоне
     if similar:
-        background_tasks.add_task(_run_analysis_and_update, ver.id, file_path)
+        job = enqueue_analysis_job(db, ver.id, file_path, content_sha256)
+        if ANALYSIS_WORKER_MODE == "inline":
+            background_tasks.add_task(run_job_inline, job.id)
 
     return {
         "document_id": doc.id,
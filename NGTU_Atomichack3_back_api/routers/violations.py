@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from scripts.db import get_db
+from scripts.crud import list_versions_for_document
+from scripts.analysis import artifacts
+from routers.dependencies import get_accessible_document, get_current_user
+
+router = APIRouter()
+
+
+@router.get("/violations/{doc_id}")
+def get_violations(doc_id: int, version: int | None = None,
+                   db: Session = Depends(get_db), current_user: str = Depends(get_current_user)):
+    """
+    Нарушения версии для подсветки поверх исходного PDF (по умолчанию последняя версия):
+    {"version", "pages": [{"page", "width", "height"}], "violations": [{"num", "page", "bbox", "criteria", "items"}]}.
+    bbox — x0, y0, x1, y1 в пунктах PDF от левого верхнего угла листа.
+    """
+    doc = get_accessible_document(db, doc_id, current_user)
+
+    versions = list_versions_for_document(db, doc.id)
+    if version is not None:
+        versions = [v for v in versions if v.version_number == version]
+    if not versions or not versions[0].ann_pdf_path:
+        raise HTTPException(status_code=404, detail="Analysis result not available")
+    ver = versions[0]
+
+    overlay = artifacts.load_overlay(artifacts.version_source_pdf(ver))
+    if overlay is None:
+        raise HTTPException(status_code=404, detail="Violations not available for this version")
+    return {"version": ver.version_number, **overlay}
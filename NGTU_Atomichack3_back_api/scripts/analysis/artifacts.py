@@ -0,0 +1,375 @@
+"""
+Аннотированный PDF со слоями и PDF-просмотры отдельных ошибок ({stem}.error_007.pdf) по запросу.
+
+Раньше make_report_files сразу сохранял копию всего документа на каждый критерий и на
+каждый кластер нарушений — на чертеже с сотнями находок это сотни полных PDF до того,
+как версия получит результат. Теперь анализ пишет один аннотированный PDF и объединённый
+список нарушений ({stem}.violations.json), а PDF ошибок строятся при первом обращении.
+
+Вместо отдельных {stem}.1.1.3.pdf в аннотированном PDF у каждого критерия свой слой
+(optional content group, имя слоя — номер пункта) с подписями "No 007: 1.1.3".
+По умолчанию виден только слой LAYER_ALL — он выглядит как прежний аннотированный PDF;
+слои критериев включаются в панели слоёв просмотрщика. Для ссылок на критерий сервер отдаёт
+копию, в которой по умолчанию включён только его слой (layer_pdf): фрагменты вида #layer=
+просмотрщики PDF не понимают.
+
+Готовые просмотры лежат в кэше артефактов (ARTIFACT_CACHE_DIR). Ключ — имя просмотра,
+хэш violations.json и размер/время изменения исходного PDF, поэтому повторный анализ
+не отдаст устаревший файл. Когда общий размер кэша превышает ARTIFACT_CACHE_MAX_MB,
+удаляются давно не запрошенные файлы (время изменения обновляется при каждом попадании).
+
+PDF ошибки по умолчанию — один лист (insert_pdf с диапазоном страниц) с cropbox по рамке
+ошибки и подписи с отступом: в файл не попадают остальные листы документа. Режим задаёт
+ERROR_EXTRACT_MODE: full — весь документ (как раньше), page — лист целиком, crop — обрезка.
+Для предпросмотра есть PNG той же области (ERROR_PNG_DPI).
+
+violations.json — это и данные для подсветки нарушений поверх исходного PDF во фронтенде
+(GET /violations/{doc_id}): размеры листов, номера, bbox, пункты и описания. При
+WRITE_ANNOTATED_PDF=0 анализ не пишет аннотированный PDF вовсе, а /download_annotated
+строит его из violations.json при первом запросе (annotated_pdf), как и PDF ошибок.
+"""
+import hashlib
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+ARTIFACT_CACHE_DIR = os.getenv("ARTIFACT_CACHE_DIR", "data/cache/artifacts")
+ARTIFACT_CACHE_MAX_MB = float(os.getenv("ARTIFACT_CACHE_MAX_MB", "512"))
+ERROR_EXTRACT_MODE = os.getenv("ERROR_EXTRACT_MODE", "crop")
+ERROR_CROP_PADDING_PT = float(os.getenv("ERROR_CROP_PADDING_PT", "72"))
+ERROR_PNG_DPI = int(os.getenv("ERROR_PNG_DPI", "150"))
+
+ERROR_EXTRACT_MODES = ("full", "page", "crop")
+
+# слой аннотированного PDF со всеми нарушениями (виден по умолчанию)
+LAYER_ALL = "Все нарушения"
+
+VIOLATIONS_SUFFIX = ".violations.json"
+
+_evict_lock = threading.Lock()
+
+
+# ---------- отрисовка ----------
+def draw_violation(page, r: fitz.Rect, label: str, oc: int = 0) -> fitz.Rect:
+    """
+    Красная рамка и подпись над ней (под ней, если сверху не хватает места).
+    oc — xref слоя (optional content group), 0 — без слоя.
+    Возвращает область, занятую рамкой и подписью.
+    """
+    color = (1, 0, 0)  # Красный
+    page.draw_rect(r, color=color, width=3, oc=oc)
+
+    text_height = 12  # Высота текста
+    text_rect = page.rect  # Границы страницы
+
+    # Проверяем, достаточно ли места над прямоугольником для текста
+    if r.y0 - text_height >= 0:
+        text_pos = (r.x0, r.y0 - 2)
+    else:
+        text_pos = (r.x0, r.y1 + text_height + 2)
+
+    # Дополнительная проверка: если текст выходит за пределы страницы, сдвигаем его внутрь
+    if text_pos[1] < 0:
+        text_pos = (r.x0, r.y1 + text_height + 2)
+    elif text_pos[1] > text_rect.height:
+        text_pos = (r.x0, r.y0 - 2)
+
+    page.insert_text(text_pos, label, fontsize=12, color=color, fontname="helv", oc=oc)
+    label_width = fitz.get_text_length(label, fontname="helv", fontsize=12)
+    return r | fitz.Rect(text_pos[0], text_pos[1] - text_height, text_pos[0] + label_width, text_pos[1] + 3)
+
+
+def _render(pdf_path, violations: list[dict], label_of, out_path: Path) -> None:
+    doc = fitz.open(pdf_path)
+    try:
+        for v in violations:
+            draw_violation(doc[v["page"] - 1], fitz.Rect(*v["bbox"]), label_of(v))
+        doc.save(out_path)
+    finally:
+        doc.close()
+
+
+def _render_error_page(pdf_path, v: dict, label: str) -> tuple[fitz.Document, fitz.Rect]:
+    """Новый документ из одного листа с ошибкой и нарисованной рамкой; (документ, область рамки с подписью)."""
+    src = fitz.open(pdf_path)
+    try:
+        doc = fitz.open()
+        doc.insert_pdf(src, from_page=v["page"] - 1, to_page=v["page"] - 1)
+    finally:
+        src.close()
+    area = draw_violation(doc[0], fitz.Rect(*v["bbox"]), label)
+    return doc, area
+
+
+def _crop_rect(page, area: fitz.Rect, padding: float) -> fitz.Rect:
+    """Область ошибки с отступом padding (pt), в пределах листа."""
+    return fitz.Rect(area.x0 - padding, area.y0 - padding, area.x1 + padding, area.y1 + padding) & page.rect
+
+
+def draw_layered(doc, merged: list[dict]) -> None:
+    """
+    Рисует пронумерованные нарушения (v["num"]) в аннотированном PDF:
+    слой LAYER_ALL (виден) — "No 7: n.1.1.3, 1.1.5", слой каждого критерия (скрыт) — "No 007: 1.1.3".
+    """
+    all_layer = doc.add_ocg(LAYER_ALL, on=True)
+    layers = {
+        c: doc.add_ocg(c, on=False)
+        for c in sorted({c for v in merged for c in v["criteria"]})
+    }
+    for v in merged:
+        page = doc[v["page"] - 1]
+        r = fitz.Rect(*v["bbox"])
+        draw_violation(page, r, f"No {v['num']}: n." + ", ".join(v["criteria"]), oc=all_layer)
+        for c in v["criteria"]:
+            draw_violation(page, r, f"No {v['num']:03d}: {c}", oc=layers[c])
+
+
+# ---------- список нарушений ----------
+def violations_path(pdf_path) -> Path:
+    return Path(pdf_path).with_suffix(VIOLATIONS_SUFFIX)
+
+
+def save_violations(pdf_path, merged: list[dict]) -> Path:
+    """
+    Сохраняет объединённые нарушения (с номерами "num") рядом с исходным PDF:
+    {"pages": [{"page", "width", "height"}], "violations": [{"num", "page", "bbox", "criteria", "items"}]}.
+    Координаты — в пунктах PDF, начало в левом верхнем углу листа (как page.rect в PyMuPDF).
+    """
+    path = violations_path(pdf_path)
+    doc = fitz.open(pdf_path)
+    try:
+        pages = [
+            {"page": i, "width": round(page.rect.width, 2), "height": round(page.rect.height, 2)}
+            for i, page in enumerate(doc, start=1)
+        ]
+    finally:
+        doc.close()
+    data = {
+        "pages": pages,
+        "violations": [
+            {
+                "num": v["num"],
+                "page": v["page"],
+                "bbox": [round(float(c), 2) for c in v["bbox"]],
+                "criteria": list(v["criteria"]),
+                "items": [{"criterion": it["criterion"], "note": it["note"]} for it in v.get("items", [])],
+            }
+            for v in merged
+        ],
+    }
+    path.write_text(json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str), encoding="utf-8")
+    return path
+
+
+def load_overlay(pdf_path) -> dict | None:
+    """Содержимое violations.json или None, если анализ его не сохранил (версии до ленивых просмотров)."""
+    try:
+        data = json.loads(violations_path(pdf_path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if isinstance(data, list):  # ранний формат: только список нарушений
+        data = {"pages": [], "violations": data}
+    return data
+
+
+def load_violations(pdf_path) -> list[dict] | None:
+    data = load_overlay(pdf_path)
+    return data["violations"] if data is not None else None
+
+
+# ---------- кэш артефактов ----------
+def _cache_key(pdf_path, view: str) -> str:
+    src = Path(pdf_path)
+    st = src.stat()
+    h = hashlib.sha256()
+    h.update(f"{view}:{st.st_size}:{st.st_mtime_ns}:".encode("utf-8"))
+    h.update(violations_path(src).read_bytes())
+    return h.hexdigest()
+
+
+def _evict() -> None:
+    """Удаляет самые давно запрошенные файлы, пока кэш больше ARTIFACT_CACHE_MAX_MB."""
+    limit = ARTIFACT_CACHE_MAX_MB * 1024 * 1024
+    with _evict_lock:
+        entries = []
+        for p in Path(ARTIFACT_CACHE_DIR).glob("*/*"):
+            if p.suffix not in (".pdf", ".png"):
+                continue  # в том числе недописанные .tmp
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in sorted(entries, key=lambda e: e[0]):
+            if total <= limit:
+                break
+            try:
+                p.unlink()
+            except OSError:
+                continue
+            total -= size
+
+
+def _cached_view(pdf_path, view: str, ext: str, render) -> Path:
+    """Файл просмотра из кэша; при промахе render(path) записывает его заново."""
+    key = _cache_key(pdf_path, view)
+    path = Path(ARTIFACT_CACHE_DIR) / key[:2] / f"{key}{ext}"
+    if path.exists():
+        try:
+            os.utime(path)  # отметка «недавно запрошен» для вытеснения
+            return path
+        except OSError:
+            pass  # файл успели вытеснить — строим заново
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{key}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        render(tmp)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    _evict()
+    return path
+
+
+def annotated_pdf(pdf_path) -> Path | None:
+    """Аннотированный PDF со слоями, построенный из violations.json (для WRITE_ANNOTATED_PDF=0)."""
+    violations = load_violations(pdf_path)
+    if violations is None:
+        return None
+
+    def render(out):
+        doc = fitz.open(pdf_path)
+        try:
+            draw_layered(doc, violations)
+            doc.save(out)
+        finally:
+            doc.close()
+
+    return _cached_view(pdf_path, "annotated", ".pdf", render)
+
+
+def layer_pdf(ann_path, pdf_path, criterion: str) -> Path | None:
+    """
+    Аннотированный PDF, в котором по умолчанию виден только слой критерия criterion
+    (остальные слои выключены; критерия без нарушений — лист без разметки).
+    ann_path — сохранённый аннотированный PDF (если его нет — строится из violations.json).
+    None — у версии нет violations.json (проанализирована до слоёв).
+    """
+    if load_violations(pdf_path) is None:
+        return None
+    if not ann_path or not os.path.exists(ann_path):
+        ann_path = annotated_pdf(pdf_path)
+
+    def render(out):
+        doc = fitz.open(ann_path)
+        try:
+            layers = {info["name"]: xref for xref, info in doc.get_ocgs().items()}
+            on = [layers[criterion]] if criterion in layers else []
+            off = [xref for name, xref in layers.items() if name != criterion]
+            doc.set_layer(-1, on=on, off=off)
+            doc.save(out)
+        finally:
+            doc.close()
+
+    return _cached_view(pdf_path, f"layer:{criterion}", ".pdf", render)
+
+
+def _find_error(pdf_path, num: int) -> dict | None:
+    for v in load_violations(pdf_path) or []:
+        if v["num"] == num:
+            return v
+    return None
+
+
+def _error_label(v: dict) -> str:
+    return f"No {v['num']:03d}: {', '.join(v['criteria'])}"
+
+
+def error_pdf(pdf_path, num: int, mode: str | None = None) -> Path | None:
+    """
+    PDF с одной ошибкой (номер из отчёта); None — такой ошибки нет.
+    mode — full / page / crop (по умолчанию ERROR_EXTRACT_MODE).
+    """
+    mode = mode or ERROR_EXTRACT_MODE
+    if mode not in ERROR_EXTRACT_MODES:
+        raise ValueError(f"Неизвестный режим PDF ошибки: {mode}")
+    v = _find_error(pdf_path, num)
+    if v is None:
+        return None
+    label = _error_label(v)
+
+    if mode == "full":
+        return _cached_view(
+            pdf_path, f"error_{num:03d}", ".pdf", lambda out: _render(pdf_path, [v], lambda _: label, out)
+        )
+
+    def render(out):
+        doc, area = _render_error_page(pdf_path, v, label)
+        try:
+            if mode == "crop":
+                page = doc[0]
+                page.set_cropbox(_crop_rect(page, area, ERROR_CROP_PADDING_PT) * page.derotation_matrix)
+            # шрифты чертежа встроены целиком и занимают большую часть листа — оставляем только нужные глифы
+            try:
+                doc.subset_fonts()
+            except Exception:
+                pass
+            doc.save(out, garbage=3, deflate=True)
+        finally:
+            doc.close()
+
+    return _cached_view(pdf_path, f"error_{num:03d}:{mode}:{ERROR_CROP_PADDING_PT}", ".pdf", render)
+
+
+def error_png(pdf_path, num: int, dpi: int | None = None) -> Path | None:
+    """PNG области ошибки (рамка, подпись и ERROR_CROP_PADDING_PT вокруг); None — такой ошибки нет."""
+    dpi = int(dpi or ERROR_PNG_DPI)
+    v = _find_error(pdf_path, num)
+    if v is None:
+        return None
+
+    def render(out):
+        doc, area = _render_error_page(pdf_path, v, _error_label(v))
+        try:
+            page = doc[0]
+            page.get_pixmap(dpi=dpi, clip=_crop_rect(page, area, ERROR_CROP_PADDING_PT)).save(out, output="png")
+        finally:
+            doc.close()
+
+    return _cached_view(pdf_path, f"error_{num:03d}:png:{dpi}:{ERROR_CROP_PADDING_PT}", ".png", render)
+
+
+def view_filename(pdf_path, view: str, ext: str = ".pdf") -> str:
+    """Имя файла для скачивания — как у прежних заранее созданных PDF."""
+    return f"{Path(pdf_path).stem}.{view}{ext}"
+
+
+# ---------- ссылки для API ----------
+def version_source_pdf(version) -> str:
+    """Исходный PDF версии (DocumentVersion): лежит в одном каталоге с аннотированным."""
+    return os.path.join(os.path.dirname(version.ann_pdf_path), version.filename or "")
+
+
+def error_pdf_url(doc_id: int, version, error_num) -> str:
+    """
+    Ссылка на PDF с одной ошибкой (/download_annotated/{doc_id}/error/{num}, строится по запросу).
+    Версии, проанализированные раньше, — заранее созданный {stem}.error_NNN.pdf, если он есть,
+    иначе общий аннотированный PDF.
+    """
+    if not version or not version.ann_pdf_path:
+        return ""
+    if error_num:
+        src = version_source_pdf(version)
+        if violations_path(src).exists():
+            return f"/download_annotated/{doc_id}/error/{int(error_num)}?version={version.version_number}"
+        legacy = Path(src).with_name(f"{Path(src).stem}.error_{error_num}.pdf")
+        if legacy.exists():
+            return str(legacy)
+    return version.ann_pdf_path
@@ -0,0 +1,716 @@
+"""
+Замеры производительности анализа.
+
+Запуск из корня бэкенда:
+    python -m scripts.analysis.bench extraction path/to/drawing.pdf -n 5
+    python -m scripts.analysis.bench parallel path/to/drawing.pdf -w 4
+    python -m scripts.analysis.bench pages path/to/drawing.pdf
+    python -m scripts.analysis.bench doctype path/to/drawing.pdf
+    python -m scripts.analysis.bench merge --sizes 10 100 1000 10000
+    python -m scripts.analysis.bench geometry --sizes 100 1000 5000
+    python -m scripts.analysis.bench arrows --lines 5000
+    python -m scripts.analysis.bench rows --spans 5000
+    python -m scripts.analysis.bench bases path/to/drawing.pdf
+    python -m scripts.analysis.bench search path/to/drawing.pdf
+    python -m scripts.analysis.bench orientation path/to/drawing.pdf
+    python -m scripts.analysis.bench patterns path/to/drawing.pdf --random 20000
+    python -m scripts.analysis.bench artifacts path/to/drawing.pdf
+"""
+import argparse
+import random
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from statistics import median
+
+from .config_registry import get_config
+from .criterion_1_1_1 import _norm_text, extract_pdf_text_as_dict
+from .criterion_1_1_2_n import run_check as run_check_1_1_2
+from .criterion_1_1_3_n import (
+    _arrow_index, _extract_letters_from_field, _is_near_arrow, _is_single_letter_token,
+    check_letter_designations, extract_lines_with_bbox,
+)
+from .criterion_1_1_4_n import check_stars
+from .criterion_1_1_5 import check as check_1_1_5
+from .criterion_1_1_6 import check as check_1_1_6
+from .orientation import check as check_orientation
+from .criterion_1_1_8 import (
+    _extract_bases, _extract_frame_letters, _group_rows, check_bases_vs_frames,
+)
+from .document import DrawingDocument
+from .page_cache import PageCache
+from . import patterns
+from .main import LOCAL_CHECKS as PIPELINE_CHECKS, _run_local_checks, _run_local_checks_parallel
+from .main import _cluster_page, _iou, _rect_distance
+from .main import make_report_files
+from . import artifacts
+import fitz
+
+
+# локальные критерии в том же порядке, что и в pipeline() + повторное извлечение строк из collect_violations
+LOCAL_CHECKS = [
+    ("1.1.1", extract_pdf_text_as_dict),
+    ("1.1.2", run_check_1_1_2),
+    ("1.1.3", check_letter_designations),
+    ("1.1.4", check_stars),
+    ("1.1.5", check_1_1_5),
+    ("1.1.6", check_1_1_6),
+    ("1.1.8", check_bases_vs_frames),
+    ("lines", extract_lines_with_bbox),
+]
+
+
+def _timeit(fn, repeat: int) -> float:
+    """Медиана времени выполнения fn() в секундах."""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return median(samples)
+
+
+def _print_row(name: str, before: float, after: float):
+    speedup = before / after if after > 0 else float("inf")
+    print(f"{name:<28} {before * 1000:>10.1f} ms {after * 1000:>10.1f} ms {speedup:>7.2f}x")
+
+
+def bench_extraction(pdf_path: str, repeat: int):
+    """Каждый критерий открывает PDF сам vs. все критерии на одном DrawingDocument."""
+    def per_path():
+        for _, fn in LOCAL_CHECKS:
+            fn(pdf_path)
+
+    def shared():
+        with DrawingDocument(pdf_path) as drawing:
+            for _, fn in LOCAL_CHECKS:
+                fn(drawing)
+
+    with DrawingDocument(pdf_path) as drawing:
+        pages = len(drawing)
+    print(f"{Path(pdf_path).name}: страниц {pages}, повторов {repeat}")
+    print(f"{'':<28} {'по пути':>13} {'общий':>13} {'ускор.':>8}")
+    _print_row("extraction (все критерии)", _timeit(per_path, repeat), _timeit(shared, repeat))
+
+
+def bench_parallel(pdf_path: str, repeat: int, max_workers: int | None):
+    """Локальные критерии pipeline(): последовательно vs пул процессов (без VLM-шага)."""
+    def sequential():
+        _run_local_checks(pdf_path, PIPELINE_CHECKS, use_page_cache=False)
+
+    def parallel():
+        _run_local_checks_parallel(pdf_path, max_workers, use_page_cache=False)
+
+    # первый вызов поднимает пул процессов — в замер не входит
+    parallel()
+    print(f"{Path(pdf_path).name}: воркеров {max_workers or 'по CPU'}, повторов {repeat}")
+    print(f"{'':<28} {'послед.':>13} {'пул':>13} {'ускор.':>8}")
+    _print_row("local criteria", _timeit(sequential, repeat), _timeit(parallel, repeat))
+
+
+def _with_page_cache(pdf_path: str, cache: PageCache):
+    with DrawingDocument(pdf_path, page_cache=cache) as drawing:
+        _run_local_checks(drawing, PIPELINE_CHECKS)
+
+
+def bench_pages(pdf_path: str, repeat: int):
+    """
+    Локальные критерии pipeline() с постраничным кэшем: без кэша, холодный кэш
+    и тёплый (новая версия чертежа с теми же листами). Кэш — во временном каталоге.
+    """
+    root = tempfile.mkdtemp(prefix="page_cache_bench_")
+    try:
+        def cold():
+            shutil.rmtree(root, ignore_errors=True)
+            _with_page_cache(pdf_path, PageCache(root, salt="bench"))
+
+        warm_cache = PageCache(root, salt="bench")
+
+        def warm():
+            _with_page_cache(pdf_path, warm_cache)
+
+        no_cache = _timeit(lambda: _run_local_checks(pdf_path, PIPELINE_CHECKS, use_page_cache=False), repeat)
+        cold_time = _timeit(cold, repeat)
+        warm_time = _timeit(warm, repeat)
+        print(f"{Path(pdf_path).name}: повторов {repeat}, попаданий {warm_cache.stats['hits']}, "
+              f"промахов {warm_cache.stats['misses']}")
+        print(f"{'':<28} {'без кэша':>13} {'с кэшем':>13} {'ускор.':>8}")
+        _print_row("cold cache", no_cache, cold_time)
+        _print_row("warm cache", no_cache, warm_time)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def _match_doc_type_scan(cc, text: str) -> str | None:
+    """Прежний CompiledConfig.match_doc_type: перебор всех регексов по порядку."""
+    s = _norm_text(text)
+    for name, rx in cc.DOC_TYPE_PATTERNS.items():
+        if rx.search(s):
+            return name
+    return None
+
+
+def bench_doctype(pdf_path: str, repeat: int):
+    """match_doc_type на span-ах первого листа: перебор регексов vs индекс основ + мемо."""
+    cc = get_config()
+    texts = [it["text"] for it in extract_pdf_text_as_dict(pdf_path)[1]]
+    mismatched = [t for t in texts if cc.match_doc_type(t) != _match_doc_type_scan(cc, t)]
+    if mismatched:
+        raise SystemExit(f"Индекс расходится с перебором: {mismatched[:5]}")
+
+    def scan():
+        # filter_titleblock_items спрашивает про каждый span до трёх раз
+        for _ in range(3):
+            for t in texts:
+                _match_doc_type_scan(cc, t)
+
+    def indexed():
+        cc._match_memo.clear()
+        for _ in range(3):
+            for t in texts:
+                cc.match_doc_type(t)
+
+    print(f"{Path(pdf_path).name}: span-ов {len(texts)}, имён {len(cc.DOC_TYPE_PATTERNS)}, повторов {repeat}")
+    print(f"{'':<28} {'перебор':>13} {'индекс':>13} {'ускор.':>8}")
+    _print_row("match_doc_type x3", _timeit(scan, repeat), _timeit(indexed, repeat))
+
+
+def _cluster_page_scan(items, iou_threshold, dist_threshold):
+    """Прежняя кластеризация merge_violations: полный перебор на каждом проходе."""
+    used = [False] * len(items)
+    clusters = []
+    for i, v in enumerate(items):
+        if used[i]:
+            continue
+        cluster_rect = fitz.Rect(*v["bbox"])
+        cluster_idx = [i]
+        changed = True
+        while changed:
+            changed = False
+            for j, w in enumerate(items):
+                if used[j] or j in cluster_idx:
+                    continue
+                r2 = fitz.Rect(*w["bbox"])
+                is_113_or_118_v = v["criterion"] in ["1.1.3", "1.1.8"]
+                is_113_or_118_w = w["criterion"] in ["1.1.3", "1.1.8"]
+                if is_113_or_118_v and is_113_or_118_w and v["criterion"] != w["criterion"]:
+                    continue
+                if _iou(cluster_rect, r2) >= iou_threshold or _rect_distance(cluster_rect, r2) < dist_threshold:
+                    cluster_idx.append(j)
+                    cluster_rect = cluster_rect | r2
+                    changed = True
+        for idx in cluster_idx:
+            used[idx] = True
+        clusters.append((cluster_idx, cluster_rect))
+    return clusters
+
+
+def _random_violations(n: int, seed: int = 0) -> list[dict]:
+    """n нарушений на листе A1 (2384x1684 pt): мелкие надписи, часть — плотными группами."""
+    rnd = random.Random(seed)
+    crits = ["1.1.2", "1.1.3", "1.1.4", "1.1.5", "1.1.6", "1.1.8"]
+    items = []
+    for _ in range(n):
+        x = rnd.uniform(0, 2384)
+        y = rnd.uniform(0, 1684)
+        w = rnd.uniform(4, 60)
+        h = rnd.uniform(4, 14)
+        items.append({"page": 1, "criterion": rnd.choice(crits), "bbox": [x, y, x + w, y + h]})
+    return items
+
+
+def bench_merge(sizes: list[int], repeat: int, max_ref: int):
+    """Кластеризация merge_violations на одном листе: полный перебор vs сетка."""
+    print(f"{'':<28} {'перебор':>13} {'сетка':>13} {'ускор.':>8}")
+    for n in sizes:
+        items = _random_violations(n)
+        fast = _timeit(lambda: _cluster_page(items, 0.30, 8.0), repeat)
+        if n > max_ref:
+            print(f"{f'{n} bbox':<28} {'—':>13} {fast * 1000:>10.1f} ms")
+            continue
+        expected = _cluster_page_scan(items, 0.30, 8.0)
+        got = _cluster_page(items, 0.30, 8.0)
+        if [(idx, tuple(r)) for idx, r in got] != [(idx, tuple(r)) for idx, r in expected]:
+            raise SystemExit(f"{n} bbox: кластеры отличаются от полного перебора")
+        _print_row(f"{n} bbox", _timeit(lambda: _cluster_page_scan(items, 0.30, 8.0), repeat), fast)
+
+
+def _random_lines(n: int, seed: int = 0) -> list[dict]:
+    """n строк текста на листе A1: буквы, допуски, размеры, обозначения видов."""
+    rnd = random.Random(seed)
+    texts = ["А", "Б", "В", "0,1 А", "0,05 Б", "⌀20 +0,2 Г", "No 3", "Вид Д", "12", "Ra 3,2", "1 Текст ТТ"]
+    lines = []
+    for _ in range(n):
+        x = rnd.uniform(0, 2384)
+        y = rnd.uniform(0, 1684)
+        lines.append({"text": rnd.choice(texts), "bbox": [x, y, x + rnd.uniform(4, 60), y + rnd.uniform(4, 14)],
+                      "size": 3.5})
+    lines.sort(key=lambda it: (it["bbox"][1], it["bbox"][0]))
+    return lines
+
+
+def bench_geometry(sizes: list[int], repeat: int):
+    """Поиск соседей в 1.1.3 (стрелки) и 1.1.8 (рамки допусков) на плотных синтетических листах."""
+    print(f"{'':<28} {'1.1.3 поле':>13} {'1.1.8 рамки':>13} {'мкс/строку':>12}")
+    for n in sizes:
+        lines = _random_lines(n)
+        t3 = _timeit(lambda: _extract_letters_from_field(lines), repeat)
+        t8 = _timeit(lambda: _extract_frame_letters(lines), repeat)
+        print(f"{f'{n} строк':<28} {t3 * 1000:>10.1f} ms {t8 * 1000:>10.1f} ms {(t3 + t8) / n * 1e6:>12.1f}")
+
+
+def _is_near_arrow_scan(lines, letter_bbox, distance_threshold=50.0) -> bool:
+    """Прежний _is_near_arrow: все строки страницы и три регекса на каждую букву."""
+    x1, y1, x2, y2 = letter_bbox
+    center_x = (x1 + x2) / 2
+    center_y = (y1 + y2) / 2
+    for it in lines:
+        s = it["text"].strip()
+        if bool(re.match(r"^No\s+\d+\s*:\s*n\.\d+\.\d+\.\d+", s, re.IGNORECASE)) or \
+           bool(re.match(r"^No\s+\d+\s*:\s*n\.\d+\.\d+", s, re.IGNORECASE)) or \
+           bool(re.match(r"^No\s+\d+", s, re.IGNORECASE)):
+            ax1, ay1, ax2, ay2 = it["bbox"]
+            distance = ((center_x - (ax1 + ax2) / 2) ** 2 + (center_y - (ay1 + ay2) / 2) ** 2) ** 0.5
+            if distance <= distance_threshold:
+                return True
+    return False
+
+
+def bench_arrows(n_lines: int, repeat: int):
+    """1.1.3: близость букв к обозначениям стрелок — перебор строк vs индекс центров стрелок."""
+    lines = _random_lines(n_lines)
+    letters = [it["bbox"] for it in lines if _is_single_letter_token(it["text"].strip())]
+
+    def scan():
+        return [_is_near_arrow_scan(lines, b) for b in letters]
+
+    def indexed():
+        arrows = _arrow_index(lines)
+        return [_is_near_arrow(lines, b, arrows=arrows) for b in letters]
+
+    if scan() != indexed():
+        raise SystemExit("Индекс стрелок расходится с перебором")
+    print(f"{n_lines} строк, букв {len(letters)}, стрелок {len(_arrow_index(lines))}, повторов {repeat}")
+    print(f"{'':<28} {'перебор':>13} {'индекс':>13} {'ускор.':>8}")
+    _print_row("_is_near_arrow", _timeit(scan, repeat), _timeit(indexed, repeat))
+
+
+def _group_rows_scan(raw_spans: list[dict]) -> list[dict]:
+    """Прежняя сборка строк 1.1.8: каждый спан сравнивается со всеми строками."""
+    rows = []
+    for sp in sorted(raw_spans, key=lambda it: (it["bbox"][1], it["bbox"][0])):
+        placed = False
+        cy = (sp["bbox"][1] + sp["bbox"][3]) / 2
+        for row in rows:
+            rcy = (row["bbox"][1] + row["bbox"][3]) / 2
+            if abs(cy - rcy) < 3:
+                row["text"] += " " + sp["text"]
+                x0, y0, x1, y1 = row["bbox"]
+                sx0, sy0, sx1, sy1 = sp["bbox"]
+                row["bbox"] = (min(x0, sx0), min(y0, sy0), max(x1, sx1), max(y1, sy1))
+                placed = True
+                break
+        if not placed:
+            rows.append({"text": sp["text"], "bbox": sp["bbox"]})
+    return rows
+
+
+def _spec_table_spans(n: int, seed: int = 0) -> list[dict]:
+    """Спаны таблицы спецификации: строки через ~8 pt, по 6 колонок, небольшой разброс по Y."""
+    rnd = random.Random(seed)
+    spans = []
+    for k in range(n):
+        row, col = divmod(k, 6)
+        y = 20 + row * 8.5 + rnd.uniform(-0.6, 0.6)
+        x = 30 + col * 120 + rnd.uniform(0, 10)
+        spans.append({"text": rnd.choice(["А", "0,1 Б", "Поз.", "12", "Болт М8"]),
+                      "bbox": (x, y, x + rnd.uniform(10, 90), y + 7.0)})
+    return spans
+
+
+def bench_rows(n_spans: int, repeat: int):
+    """1.1.8: сборка строк из спанов и поиск букв у рамок на таблице спецификации."""
+    spans = _spec_table_spans(n_spans)
+    if _group_rows(spans) != _group_rows_scan(spans):
+        raise SystemExit("Строки расходятся с прежней сборкой")
+    rows = _group_rows(spans)
+    print(f"{n_spans} спанов → {len(rows)} строк, повторов {repeat}")
+    print(f"{'':<28} {'перебор':>13} {'корзины':>13} {'ускор.':>8}")
+    _print_row("сборка строк", _timeit(lambda: _group_rows_scan(spans), repeat),
+               _timeit(lambda: _group_rows(spans), repeat))
+    t = _timeit(lambda: _extract_frame_letters(rows), repeat)
+    print(f"{'_extract_frame_letters':<28} {'':>13} {t * 1000:>10.1f} ms")
+
+
+def _check_page_1_1_8_baseline(page: fitz.Page) -> dict:
+    """
+    1.1.8 на листе так, как считала исходная версия: спаны из page.get_text("dict"),
+    сборка строк перебором, без имени документа (импорт конфигурации в ней не срабатывал).
+    """
+    spans = []
+    for block in page.get_text("dict")["blocks"]:
+        if block["type"] != 0:
+            continue
+        for line in block["lines"]:
+            for span in line["spans"]:
+                if span["text"].strip():
+                    spans.append({"text": span["text"].strip(), "bbox": tuple(span["bbox"])})
+    lines = _group_rows_scan(spans)
+    bases = sorted(set(_extract_bases(lines)))
+    frames = sorted(set(_extract_frame_letters(lines)))
+    missing = sorted(set(frames) - set(bases))
+    return {
+        "bases_found": bases,
+        "frames_found": frames,
+        "missing_bases": missing,
+        "extra_bases": sorted(set(bases) - set(frames)),
+        "page_ok": not missing,
+    }
+
+
+def _bases_sample_pdf(path: Path):
+    """Лист с базами А, Б, рамками допусков "0,1 А" / "0,05 Б" и именем "Габаритный чертеж"."""
+    doc = fitz.open()
+    page = doc.new_page(width=842, height=595)
+    font = {"fontname": "cyr", "fontfile": _cyr_fontfile()} if _cyr_fontfile() else {}
+    for text, point in [("А", (100, 100)), ("Б", (300, 140)),
+                        ("0,1 А", (100, 200)), ("0,05 Б", (300, 240)),
+                        ("Габаритный чертеж", (600, 560))]:
+        page.insert_text(point, text, fontsize=10, **font)
+    doc.save(path)
+    doc.close()
+
+
+def _cyr_fontfile() -> str | None:
+    """TTF с кириллицей для синтетического листа (встроенные шрифты PyMuPDF её не содержат)."""
+    for name in ("DejaVuSans.ttf", "LiberationSans-Regular.ttf", "FreeSans.ttf"):
+        for root in ("/usr/share/fonts", "/usr/local/share/fonts", "C:/Windows/Fonts"):
+            found = next(Path(root).rglob(name), None) if Path(root).exists() else None
+            if found:
+                return str(found)
+    return None
+
+
+def bench_bases(pdfs: list[str], repeat: int):
+    """
+    1.1.8: сверка check_bases_vs_frames с исходной версией критерия (на синтетическом листе
+    с именем документа, содержащим буквы баз, и на переданных PDF) и замер времени.
+    """
+    root = Path(tempfile.mkdtemp(prefix="bases_bench_"))
+    try:
+        sample = root / "bases_sample.pdf"
+        _bases_sample_pdf(sample)
+        for pdf in [str(sample)] + list(pdfs):
+            with fitz.open(pdf) as doc:
+                expected = {page.number + 1: _check_page_1_1_8_baseline(page) for page in doc}
+            got = check_bases_vs_frames(pdf)["pages"]
+            if got != expected:
+                diff = {n: (expected[n], got.get(n)) for n in expected if got.get(n) != expected[n]}
+                raise SystemExit(f"{Path(pdf).name}: 1.1.8 расходится с исходной версией: {diff}")
+            print(f"{Path(pdf).name}: 1.1.8 совпадает с исходной версией, базы по листам "
+                  f"{ {n: p['bases_found'] for n, p in got.items()} }")
+            if pdf == str(sample) and got[1]["bases_found"] != ["А", "Б"]:
+                raise SystemExit(f"базы синтетического листа: {got[1]['bases_found']}, ожидались ['А', 'Б']")
+
+            def baseline():
+                with fitz.open(pdf) as doc:
+                    return [_check_page_1_1_8_baseline(page) for page in doc]
+
+            _print_row("check_bases_vs_frames", _timeit(baseline, repeat),
+                       _timeit(lambda: check_bases_vs_frames(pdf), repeat))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def bench_search(pdf_path: str, repeat: int):
+    """
+    Поиск bbox текстов в collect_violations: page.search_for на каждый запрос
+    vs PageTextIndex.search (один TextPage на лист + мемо по тексту запроса).
+    Запросы — звёздочки и строки каждого листа, каждая по два раза (токен и строка поля).
+    """
+    with DrawingDocument(pdf_path) as drawing:
+        needles = {
+            page.number: ["*", "**", "***"] + [t for t in page.line_texts if "\n" not in t] * 2
+            for page in drawing
+        }
+        for page in drawing:
+            for nd in needles[page.number]:
+                if [tuple(r) for r in page.page.search_for(nd)] != [tuple(r) for r in page.search(nd)]:
+                    raise SystemExit(f"Лист {page.number}: search расходится с search_for на {nd!r}")
+
+    total = sum(len(v) for v in needles.values())
+
+    def per_call():
+        with DrawingDocument(pdf_path) as drawing:
+            for page in drawing:
+                for nd in needles[page.number]:
+                    page.page.search_for(nd)
+
+    def indexed():
+        with DrawingDocument(pdf_path) as drawing:
+            for page in drawing:
+                for nd in needles[page.number]:
+                    page.search(nd)
+
+    print(f"{Path(pdf_path).name}: листов {len(needles)}, запросов {total}, повторов {repeat}")
+    print(f"{'':<28} {'search_for':>13} {'индекс':>13} {'ускор.':>8}")
+    _print_row("поиск bbox", _timeit(per_call, repeat), _timeit(indexed, repeat))
+
+
+def bench_orientation(pdf_path: str, repeat: int):
+    """1.1.5 и 1.1.6: каждый критерий на своём документе (два прохода) vs общий этап orientation."""
+    def two_pass():
+        check_1_1_5(pdf_path)
+        check_1_1_6(pdf_path)
+
+    def fused():
+        check_orientation(pdf_path)
+
+    print(f"{Path(pdf_path).name}: повторов {repeat}")
+    print(f"{'':<28} {'2 прохода':>13} {'1 проход':>13} {'ускор.':>8}")
+    _print_row("1.1.5 + 1.1.6", _timeit(two_pass, repeat), _timeit(fused, repeat))
+
+
+# Прежние поштучные проверки (регекс-строки в цикле) и их замены из patterns.py.
+# Каждая пара должна давать одинаковый ответ на любой строке.
+_DIMENSION_LITERALS = list(patterns.DIMENSION_PATTERNS)
+_TB_KEYWORDS_LITERAL = list(patterns.TB_KEYWORDS)
+
+
+def _is_dimension_note_scan(text: str) -> bool:
+    t = (text or "").strip()
+    if len(t) > 60 or len(t) < 1:
+        return False
+    if not re.search(r"\d", t):
+        return False
+    for pat in _DIMENSION_LITERALS:
+        if re.search(pat, t, flags=re.IGNORECASE):
+            return True
+    return False
+
+
+def _groups(m):
+    return m.groups() if m else None
+
+
+_CLASSIFIERS = [
+    ("размерная надпись", _is_dimension_note_scan, patterns.is_dimension_note),
+    ("пункт ТТ (1.1.2/1.1.3)",
+     lambda t: bool(re.match(r"^\s*\d+\s*[.)-]?\s+", t)),
+     lambda t: bool(patterns.TT_NUMBERED_RE.match(t))),
+    ("пункт ТТ (1.1.4)",
+     lambda t: bool(re.match(r"^\s*\d+\s*[.)-]\s+", t) or re.match(r"^\s*\d+\s*\*{1,3}\s+.+", t)
+                    or (re.match(r"^\s*\d+\s+.+", t) and not re.match(r"^\s*\d+\s*$", t))),
+     lambda t: bool(patterns.TT_STAR_LINE_RE.match(t))),
+    ("звёздочки",
+     lambda t: re.findall(r"\d+\s*(\*{1,3})|(\b\*{1,3}\b)", t),
+     lambda t: patterns.STARS_RE.findall(t)),
+    ("основная надпись",
+     lambda t: any(k.lower() in t.lower().replace("ё", "е") for k in _TB_KEYWORDS_LITERAL),
+     lambda t: patterns.has_tb_keyword(t.lower().replace("ё", "е"))),
+    ("текст пункта ТТ",
+     lambda t: _groups(re.match(r"^\s*\d+\s*[.)-]?\s*(.*)", t)),
+     lambda t: _groups(patterns.TT_ITEM_RE.match(t))),
+    ("поверхность",
+     lambda t: _groups(re.search(r"поверхн(?:ость|ности|.)?\.?\s*([A-Za-zА-Яа-я,\s]+?)(?:\s+(?:не\s+|покр|штамп|шлиф|окраш|лакир|фосф|грунт|и\s+т\.д\.|и\s+др\.|и\s+т\.п\.|[,;\.]\s*|$))", t + " ", flags=re.IGNORECASE)),
+     lambda t: _groups(patterns.SURFACE_RE.search(t + " "))),
+    ("поверхность (альт.)",
+     lambda t: _groups(re.search(r"поверхн(?:ость|ности|.)?\.?\s+([A-Za-zА-Яа-я]+(?:\s*,\s*[A-Za-zА-Яа-я]+)*)", t, flags=re.IGNORECASE)),
+     lambda t: _groups(patterns.SURFACE_ALT_RE.search(t))),
+    ("перечни букв в ТТ",
+     lambda t: [re.findall(r"(?:Размеры|Поверхности|Обозначения|Обозначение)\s+([A-Za-zА-Яа-я]+(?:\s*,\s*[A-Za-zА-Яа-я]+)*)", t, flags=re.IGNORECASE),
+                re.findall(r"([A-Za-zА-Яа-я])\s*,\s*([A-Za-zА-Яа-я](?:\s*,\s*[A-Za-zА-Яа-я])*)\s+(?:в|на|по)\s+\w", t, flags=re.IGNORECASE)],
+     lambda t: [rx.findall(t) for rx in patterns.TT_LETTER_LIST_RES]),
+    ("обозначение сечения",
+     lambda t: bool(re.match(r"^[А-Яа-яA-Za-z]\s*[-]?\s*[А-Яа-яA-Za-z]$", t)),
+     lambda t: bool(patterns.SECTION_DESIGNATION_RE.match(t))),
+    ("сечение в строке",
+     lambda t: bool(re.search(r"(?:[Сс]ечение\s+)?[А-Яа-яA-Za-z]\s*[-]?\s*[А-Яа-яA-Za-z](?:\s+[Сс]ечение)?", t)),
+     lambda t: bool(patterns.SECTION_IN_TEXT_RE.search(t))),
+    ("шероховатость",
+     lambda t: bool(re.match(r"(?i)^(Ra|Rz|Rt)\b", t)),
+     lambda t: bool(patterns.ROUGHNESS_RE.match(t))),
+    ("буква в конце",
+     lambda t: _groups(re.search(r"\s([A-Za-zА-Яа-я])$", t)),
+     lambda t: _groups(patterns.TRAILING_LETTER_RE.search(t))),
+    ("метка базы",
+     lambda t: bool(re.fullmatch(r"[A-Za-zА-Яа-я]{1,2}", t)),
+     lambda t: bool(patterns.BASE_TOKEN_RE.fullmatch(t))),
+    ("нормализация названия",
+     lambda t: [w for w in re.split(r"[^\w\-]+", re.sub(r"\s+", " ", t)) if w],
+     lambda t: [w for w in patterns.NAME_SPLIT_RE.split(patterns.WHITESPACE_RE.sub(" ", t)) if w]),
+]
+
+_RANDOM_PIECES = [
+    "1", "2", "12", "0,1", "0.05", "20", " ", "  ", ".", ")", "-", "*", "**", "***", "±", "°", "мм", "mm",
+    "⌀", "Ø", "R", "M", "x", "×", "+", "−", "А", "Б", "В", "а", "A", "b", "Ra", "Rz", "Сечение", "сечение",
+    "поверхн.", "поверхность", "поверхности", "Размеры", "Обозначения", ",", ";", " в ", " на ", "покр",
+    "Лист", "Листов", "Масса", "т.контр", "Изм.", "№ докум", "ё", "Ё", "No ", "\t",
+]
+
+
+def _random_texts(n: int, seed: int = 0) -> list[str]:
+    rnd = random.Random(seed)
+    return ["".join(rnd.choice(_RANDOM_PIECES) for _ in range(rnd.randint(1, 10))) for _ in range(n)]
+
+
+def bench_patterns(pdfs: list[str], n_random: int, repeat: int):
+    """
+    Золотая сверка patterns.py с прежними регекс-строками (строки и спаны PDF + случайные строки)
+    и замер времени классификации на том же корпусе.
+    """
+    texts = _random_texts(n_random)
+    for pdf in pdfs:
+        with DrawingDocument(pdf) as drawing:
+            for page in drawing:
+                texts.extend(page.line_texts)
+                texts.extend(it["text"] for it in page.spans)
+    print(f"строк в корпусе: {len(texts)}, повторов {repeat}")
+
+    for name, before, after in _CLASSIFIERS:
+        diff = [t for t in texts if before(t) != after(t)]
+        if diff:
+            raise SystemExit(f"{name}: классификация изменилась на {len(diff)} строках, например {diff[:3]!r}")
+    print("классификация совпадает со строковыми регексами на всём корпусе")
+
+    print(f"{'':<28} {'строки':>13} {'patterns':>13} {'ускор.':>8}")
+    for name, before, after in _CLASSIFIERS:
+        _print_row(name, _timeit(lambda: [before(t) for t in texts], repeat),
+                   _timeit(lambda: [after(t) for t in texts], repeat))
+
+
+def bench_artifacts(pdf_path: str, limit: int | None):
+    """
+    PDF отдельных ошибок: весь документ (full, как раньше) vs один лист (page),
+    лист с обрезкой (crop) и PNG-предпросмотр. Время построения и суммарный размер файлов.
+    Нарушения — по локальным критериям (без VLM), кэш артефактов во временном каталоге.
+    """
+    root = Path(tempfile.mkdtemp(prefix="artifacts_bench_"))
+    cache_dir = artifacts.ARTIFACT_CACHE_DIR
+    try:
+        artifacts.ARTIFACT_CACHE_DIR = str(root / "cache")
+        pdf = root / Path(pdf_path).name
+        shutil.copyfile(pdf_path, pdf)
+        with DrawingDocument(str(pdf)) as drawing:
+            out = _run_local_checks(drawing, PIPELINE_CHECKS, use_page_cache=False)
+            make_report_files(str(pdf), out, drawing=drawing)
+        nums = [v["num"] for v in artifacts.load_violations(pdf) or []][:limit]
+        print(f"{Path(pdf_path).name}: ошибок {len(nums)}")
+        print(f"{'':<28} {'время':>13} {'размер':>13} {'на ошибку':>12}")
+        for mode in artifacts.ERROR_EXTRACT_MODES + ("png",):
+            t0 = time.perf_counter()
+            paths = [
+                artifacts.error_png(pdf, n) if mode == "png" else artifacts.error_pdf(pdf, n, mode)
+                for n in nums
+            ]
+            elapsed = time.perf_counter() - t0
+            size = sum(p.stat().st_size for p in paths)
+            per = size / len(paths) / 1024 if paths else 0.0
+            print(f"{mode:<28} {elapsed * 1000:>10.1f} ms {size / 1024:>10.0f} KB {per:>9.1f} KB")
+    finally:
+        artifacts.ARTIFACT_CACHE_DIR = cache_dir
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности анализа чертежей")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_ext = sub.add_parser("extraction", help="Извлечение текста: отдельные открытия PDF vs общий DrawingDocument")
+    p_ext.add_argument("pdf", nargs="+", help="PDF-файлы чертежей")
+    p_ext.add_argument("-n", "--repeat", type=int, default=3, help="Число повторов (берётся медиана)")
+
+    p_par = sub.add_parser("parallel", help="Локальные критерии: последовательно vs пул процессов")
+    p_par.add_argument("pdf", nargs="+", help="PDF-файлы чертежей")
+    p_par.add_argument("-n", "--repeat", type=int, default=3, help="Число повторов (берётся медиана)")
+    p_par.add_argument("-w", "--workers", type=int, default=None, help="Размер пула процессов")
+
+    p_pages = sub.add_parser("pages", help="Локальные критерии: без кэша vs холодный/тёплый постраничный кэш")
+    p_pages.add_argument("pdf", nargs="+", help="PDF-файлы чертежей")
+    p_pages.add_argument("-n", "--repeat", type=int, default=3, help="Число повторов (берётся медиана)")
+
+    p_dt = sub.add_parser("doctype", help="match_doc_type: перебор регексов vs индекс основ")
+    p_dt.add_argument("pdf", nargs="+", help="PDF-файлы чертежей")
+    p_dt.add_argument("-n", "--repeat", type=int, default=20, help="Число повторов (берётся медиана)")
+
+    p_merge = sub.add_parser("merge", help="merge_violations: полный перебор vs сетка (синтетические bbox)")
+    p_merge.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000], help="Число bbox на листе")
+    p_merge.add_argument("-n", "--repeat", type=int, default=3, help="Число повторов (берётся медиана)")
+    p_merge.add_argument("--max-ref", type=int, default=2000,
+                         help="Полный перебор (и сверка кластеров) только до этого числа bbox")
+
+    p_geo = sub.add_parser("geometry", help="Поиск соседних bbox в 1.1.3/1.1.8 (синтетические листы)")
+    p_geo.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000], help="Число строк на листе")
+    p_geo.add_argument("-n", "--repeat", type=int, default=3, help="Число повторов (берётся медиана)")
+
+    p_arr = sub.add_parser("arrows", help="1.1.3: поиск стрелок рядом с буквами (синтетический лист)")
+    p_arr.add_argument("--lines", type=int, default=5000, help="Число строк на листе")
+    p_arr.add_argument("-n", "--repeat", type=int, default=3, help="Число повторов (берётся медиана)")
+
+    p_rows = sub.add_parser("rows", help="1.1.8: сборка строк из спанов (синтетическая спецификация)")
+    p_rows.add_argument("--spans", type=int, default=5000, help="Число спанов на листе")
+    p_rows.add_argument("-n", "--repeat", type=int, default=3, help="Число повторов (берётся медиана)")
+
+    p_bases = sub.add_parser("bases", help="1.1.8: сверка с исходной версией критерия (базы и рамки) и замер")
+    p_bases.add_argument("pdf", nargs="*", help="PDF-файлы чертежей (кроме синтетического листа)")
+    p_bases.add_argument("-n", "--repeat", type=int, default=3, help="Число повторов (берётся медиана)")
+
+    p_search = sub.add_parser("search", help="collect_violations: page.search_for vs поиск по общему TextPage")
+    p_search.add_argument("pdf", nargs="+", help="PDF-файлы чертежей")
+    p_search.add_argument("-n", "--repeat", type=int, default=3, help="Число повторов (берётся медиана)")
+
+    p_or = sub.add_parser("orientation", help="1.1.5/1.1.6: отдельные проходы vs общий этап orientation")
+    p_or.add_argument("pdf", nargs="+", help="PDF-файлы чертежей")
+    p_or.add_argument("-n", "--repeat", type=int, default=3, help="Число повторов (берётся медиана)")
+
+    p_pat = sub.add_parser("patterns", help="Классификаторы текста: сверка patterns.py с прежними регексами и замер")
+    p_pat.add_argument("pdf", nargs="*", help="PDF-файлы чертежей (их строки добавляются в корпус)")
+    p_pat.add_argument("--random", type=int, default=20000, help="Число случайных строк в корпусе")
+    p_pat.add_argument("-n", "--repeat", type=int, default=3, help="Число повторов (берётся медиана)")
+
+    p_art = sub.add_parser("artifacts", help="PDF ошибок: весь документ vs один лист / обрезка / PNG")
+    p_art.add_argument("pdf", nargs="+", help="PDF-файлы чертежей")
+    p_art.add_argument("--limit", type=int, default=None, help="Не больше стольких ошибок на файл")
+
+    args = parser.parse_args(argv)
+    if args.cmd == "patterns":
+        bench_patterns(args.pdf, args.random, args.repeat)
+        return
+    if args.cmd == "bases":
+        bench_bases(args.pdf, args.repeat)
+        return
+    if args.cmd == "rows":
+        bench_rows(args.spans, args.repeat)
+        return
+    if args.cmd == "arrows":
+        bench_arrows(args.lines, args.repeat)
+        return
+    if args.cmd == "merge":
+        bench_merge(args.sizes, args.repeat, args.max_ref)
+        return
+    if args.cmd == "geometry":
+        bench_geometry(args.sizes, args.repeat)
+        return
+    for pdf in args.pdf:
+        if not Path(pdf).exists():
+            raise SystemExit(f"Файл не найден: {pdf}")
+        if args.cmd == "extraction":
+            bench_extraction(pdf, args.repeat)
+        elif args.cmd == "parallel":
+            bench_parallel(pdf, args.repeat, args.workers)
+        elif args.cmd == "pages":
+            bench_pages(pdf, args.repeat)
+        elif args.cmd == "doctype":
+            bench_doctype(pdf, args.repeat)
+        elif args.cmd == "search":
+            bench_search(pdf, args.repeat)
+        elif args.cmd == "orientation":
+            bench_orientation(pdf, args.repeat)
+        elif args.cmd == "artifacts":
+            bench_artifacts(pdf, args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Общий на процесс реестр конфигов анализа (config.yaml → CompiledConfig).
+
+Конфиг парсится и компилируется один раз; при каждом обращении проверяется
+stat() файла, и только если изменились mtime/размер — файл перечитывается.
+Перекомпиляция происходит лишь при изменении содержимого (sha256), этот же
+digest используется в ключах кэшей результатов.
+"""
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+import yaml
+
+from .criterion_1_1_1 import CompiledConfig
+
+CONFIG_PATH = "./scripts/analysis/config.yaml"
+
+_lock = threading.Lock()
+_entries: dict[str, dict] = {}  # путь -> {"stat", "digest", "config"}
+
+
+def _stat_key(path: str):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def _entry(path: str) -> dict:
+    key = str(Path(path).resolve())
+    stat = _stat_key(path)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry["stat"] == stat:
+            return entry
+
+        raw = Path(path).read_bytes()
+        digest = hashlib.sha256(raw).hexdigest()
+        if entry is not None and entry["digest"] == digest:
+            # файл «тронули», но содержимое то же — компилировать заново не нужно
+            entry["stat"] = stat
+            return entry
+
+        cfg = yaml.safe_load(raw.decode("utf-8"))
+        entry = {"stat": stat, "digest": digest, "config": CompiledConfig(cfg)}
+        _entries[key] = entry
+        return entry
+
+
+def get_config(path: str = CONFIG_PATH) -> CompiledConfig:
+    """Скомпилированный конфиг; FileNotFoundError, если файла нет."""
+    return _entry(path)["config"]
+
+
+def config_digest(path: str = CONFIG_PATH) -> str:
+    """sha256 содержимого конфига ("no-config", если файла нет)."""
+    try:
+        return _entry(path)["digest"]
+    except OSError:
+        return "no-config"
@@ -1,9 +1,10 @@
 import json
 from pathlib import Path
 import re
-import fitz  # PyMuPDF
 from rich import print
 import yaml
+from .document import as_drawing
+from .patterns import NAME_SPLIT_RE, WHITESPACE_RE
 
 # =========================
 # Генератор регексов по русскому названию
@@ -17,7 +18,7 @@ _RU_SUFFIXES = [
 ]
 
 def _norm_text(s: str) -> str:
-    return re.sub(r"\s+", " ", s.lower().replace("ё", "е")).strip()
+    return WHITESPACE_RE.sub(" ", s.lower().replace("ё", "е")).strip()
 
 def _strip_suffix(token: str) -> str:
     for suf in sorted(_RU_SUFFIXES, key=len, reverse=True):
@@ -34,7 +35,7 @@ def generate_ru_regex(name: str) -> str:
       -> r'\\bведомост\\w*\\s+эксплуатацион\\w*\\s+документ\\w*\\b'
     """
     s = _norm_text(name)
-    words = [w for w in re.split(r"[^\w\-]+", s) if w]
+    words = [w for w in NAME_SPLIT_RE.split(s) if w]
     parts = []
     for w in words:
         if "-" in w:
@@ -54,6 +55,26 @@ def generate_ru_regex(name: str) -> str:
     return r"\b" + r"\s+".join(parts) + r"\b"
 
 
+def _first_stem(name: str) -> str | None:
+    """
+    Первая основа из generate_ru_regex(name): регекс начинается с \bоснова\w*,
+    значит совпасть он может, только если какое-то слово текста начинается с неё.
+    """
+    s = _norm_text(name)
+    for w in (w for w in NAME_SPLIT_RE.split(s) if w):
+        segs = w.split("-") if "-" in w else [w]
+        for seg in segs:
+            seg = _strip_suffix(seg)
+            if seg:
+                return seg
+    return None
+
+
+_WORD_RE = re.compile(r"\w+")
+_MATCH_MEMO_SIZE = 4096
+_MISS = object()
+
+
 # =========================
 # Конфиг и компиляция
 # =========================
@@ -93,13 +114,55 @@ class CompiledConfig:
             rx = regex_overrides.get(name) or generate_ru_regex(name)
             self.DOC_TYPE_PATTERNS[name] = re.compile(rx, re.IGNORECASE | re.UNICODE)
 
+        # 8) индекс «первая основа -> имена»: вместо перебора всех регексов проверяются
+        #    только имена, чья первая основа — префикс одного из слов текста
+        #    (для overrides основа неизвестна — они проверяются всегда)
+        self._name_order = {name: i for i, name in enumerate(self.DOC_TYPE_PATTERNS)}
+        self._names_by_stem: dict[str, list[str]] = {}
+        self._always_check: list[str] = []
+        for name in self.DOC_TYPE_PATTERNS:
+            stem = None if regex_overrides.get(name) else _first_stem(name)
+            if stem:
+                self._names_by_stem.setdefault(stem, []).append(name)
+            else:
+                self._always_check.append(name)
+        self._stem_lengths = sorted({len(stem) for stem in self._names_by_stem})
+        self._match_memo: dict[str, str | None] = {}
+
+        # 9) нормализованное имя -> каноническое (для canonicalize_doc_type_name)
+        self.canonical_names: dict[str, str] = {}
+        for name in sorted(set(self.DOC_TYPE_PATTERNS) | set(self.code_suffix_map.values())):
+            self.canonical_names.setdefault(_norm_text(name), name)
+
     # служебные
+    def _doc_type_candidates(self, s: str) -> list[str]:
+        found = set(self._always_check)
+        for word in set(_WORD_RE.findall(s)):
+            for n in self._stem_lengths:
+                if n > len(word):
+                    break
+                names = self._names_by_stem.get(word[:n])
+                if names:
+                    found.update(names)
+        return sorted(found, key=self._name_order.__getitem__)
+
     def match_doc_type(self, text: str) -> str | None:
+        """Первое (в порядке DOC_TYPE_PATTERNS) имя, чей регекс находится в тексте."""
+        # конфиг общий на процесс (config_registry) — читаем мемо одной операцией
+        cached = self._match_memo.get(text, _MISS)
+        if cached is not _MISS:
+            return cached
         s = _norm_text(text)
-        for name, rx in self.DOC_TYPE_PATTERNS.items():
-            if rx.search(s):
-                return name
-        return None
+        result = None
+        for name in self._doc_type_candidates(s):
+            if self.DOC_TYPE_PATTERNS[name].search(s):
+                result = name
+                break
+        # filter_titleblock_items спрашивает про один и тот же span до трёх раз
+        if len(self._match_memo) >= _MATCH_MEMO_SIZE:
+            self._match_memo.clear()
+        self._match_memo[text] = result
+        return result
 
 
 # =========================
@@ -139,11 +202,7 @@ def canonicalize_doc_type_name(doc_type_text: str | None, cc: CompiledConfig) ->
     if not doc_type_text:
         return ""
     s = doc_type_text.strip()
-    known = set(cc.DOC_TYPE_PATTERNS.keys()) | set(cc.code_suffix_map.values())
-    for v in known:
-        if _norm_text(s) == _norm_text(v):
-            return v
-    return s
+    return cc.canonical_names.get(_norm_text(s), s)
 
 def code_suffix_matches_doc_type(doc_code_text: str, doc_type_text: str | None, cc: CompiledConfig):
     suffix = extract_code_suffix(doc_code_text)
@@ -158,35 +217,22 @@ def code_suffix_matches_doc_type(doc_code_text: str, doc_type_text: str | None,
 # Извлечение и фильтрация
 # =========================
 
-def extract_pdf_text_as_dict(pdf_path: str) -> dict:
-    pdf_path = str(pdf_path)
-    doc = fitz.open(pdf_path)
+def extract_pdf_text_as_dict(pdf_path) -> dict:
+    """pdf_path — путь к PDF или уже открытый DrawingDocument."""
     data: dict[int, list[dict]] = {}
-    try:
+    with as_drawing(pdf_path) as drawing:
         # Обрабатываем только первую страницу для критерия 1.1.1
         page_index = 1
-        page = doc[page_index - 1]  # PyMuPDF использует 0-based индексацию
-        page_dict = page.get_text("dict")
         items = []
-        for block in page_dict.get("blocks", []):
-            if block.get("type", 0) != 0:
-                continue
-            for line in block.get("lines", []):
-                for span in line.get("spans", []):
-                    text = (span.get("text") or "").strip()
-                    if not text:
-                        continue
-                    bbox = [round(float(v), 2) for v in span.get("bbox", (0, 0, 0, 0))]
-                    items.append({
-                        "text": text,
-                        "bbox": bbox,
-                        "font": span.get("font"),
-                        "size": round(float(span.get("size", 0.0)), 2),
-                    })
+        for span in drawing.page(page_index).spans:
+            items.append({
+                "text": span["text"],
+                "bbox": [round(v, 2) for v in span["bbox"]],
+                "font": span["font"],
+                "size": round(span["size"], 2),
+            })
         items.sort(key=lambda it: (it["bbox"][1], it["bbox"][0]))
         data[page_index] = items
-    finally:
-        doc.close()
     return data
 
 def filter_titleblock_items(extracted: dict, cc: CompiledConfig) -> dict:
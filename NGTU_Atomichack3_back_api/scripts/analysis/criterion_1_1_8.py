@@ -1,7 +1,11 @@
 import json
+import math
 import re
 from pathlib import Path
-import fitz  # PyMuPDF
+from . import geometry
+from .document import as_drawing, text_index
+from .patterns import BASE_TOKEN_RE, CYR_LETTER_RE
+import numpy as np
 
 # ------------------------
 # Константы и перевод единиц
@@ -37,37 +41,59 @@ RE_FRAME_TAIL = re.compile(r"\b\d{1,2}[.,]\d{1,3}\s+([А-Я]{1,2})\s*$")
 # ------------------------
 # Вытягивание строк с bbox
 # ------------------------
+ROW_Y_TOL_PT = 3  # допуск по Y при сборке строк из спанов
+
+
 def _page_lines_with_bbox(page) -> list[dict]:
-    pd = page.get_text("dict")
-    raw_spans = []
-    for block in pd["blocks"]:
-        if block["type"] != 0:
-            continue
-        for line in block["lines"]:
-            for span in line["spans"]:
-                txt = span["text"].strip()
-                if not txt:
-                    continue
-                x0, y0, x1, y1 = span["bbox"]
-                raw_spans.append({"text": txt, "bbox": (x0, y0, x1, y1)})
-
-    # группировка спанов по строкам (Y)
-    rows = []
+    raw_spans = [{"text": sp["text"], "bbox": sp["bbox"]} for sp in text_index(page).spans]
+    return _group_rows(raw_spans)
+
+
+def _group_rows(raw_spans: list[dict]) -> list[dict]:
+    """
+    Группирует спаны в строки по Y: спан (в порядке y0, x0) попадает в первую
+    по порядку создания строку, чей текущий центр ближе ROW_Y_TOL_PT, иначе открывает новую.
+    Строки разложены по корзинам высотой ROW_Y_TOL_PT по текущему центру, поэтому
+    для спана проверяются только строки из трёх соседних корзин, а не все.
+    """
+    rows = []          # {"bbox"}; текст копится в row_texts
+    row_texts = []     # части текста строки, склеиваются в конце
+    row_cy = []        # текущий центр строки по Y
+    buckets: dict[int, set[int]] = {}
+
+    def bucket(cy: float) -> int:
+        return math.floor(cy / ROW_Y_TOL_PT)
+
     for sp in sorted(raw_spans, key=lambda it: (it["bbox"][1], it["bbox"][0])):
-        placed = False
         cy = (sp["bbox"][1] + sp["bbox"][3]) / 2
-        for row in rows:
-            rcy = (row["bbox"][1] + row["bbox"][3]) / 2
-            if abs(cy - rcy) < 3:  # допуск по Y ~3pt
-                row["text"] += " " + sp["text"]
-                x0, y0, x1, y1 = row["bbox"]
-                sx0, sy0, sx1, sy1 = sp["bbox"]
-                row["bbox"] = (min(x0, sx0), min(y0, sy0),
-                               max(x1, sx1), max(y1, sy1))
-                placed = True
-                break
-        if not placed:
-            rows.append({"text": sp["text"], "bbox": sp["bbox"]})
+        b = bucket(cy)
+        found = None
+        for nb in (b - 1, b, b + 1):
+            for r in buckets.get(nb, ()):
+                if abs(cy - row_cy[r]) < ROW_Y_TOL_PT and (found is None or r < found):
+                    found = r
+        if found is None:
+            rows.append({"text": None, "bbox": sp["bbox"]})
+            row_texts.append([sp["text"]])
+            row_cy.append(cy)
+            buckets.setdefault(b, set()).add(len(rows) - 1)
+            continue
+
+        row = rows[found]
+        row_texts[found].append(sp["text"])
+        x0, y0, x1, y1 = row["bbox"]
+        sx0, sy0, sx1, sy1 = sp["bbox"]
+        row["bbox"] = (min(x0, sx0), min(y0, sy0),
+                       max(x1, sx1), max(y1, sy1))
+        new_cy = (row["bbox"][1] + row["bbox"][3]) / 2
+        old_b, new_b = bucket(row_cy[found]), bucket(new_cy)
+        row_cy[found] = new_cy
+        if new_b != old_b:
+            buckets[old_b].discard(found)
+            buckets.setdefault(new_b, set()).add(found)
+
+    for row, parts in zip(rows, row_texts):
+        row["text"] = " ".join(parts)
     return rows
 
 # ------------------------
@@ -78,7 +104,7 @@ def _is_base_token(text: str) -> bool:
     Отдельная короткая метка-база: 1–2 буквы (лат/кирилл), без цифр/прочего.
     """
     s = text.strip().strip(".:,;()[]{}<>«»'\"")
-    return bool(1 <= len(s) <= 2 and re.fullmatch(r"[A-Za-zА-Яа-я]{1,2}", s))
+    return bool(1 <= len(s) <= 2 and BASE_TOKEN_RE.fullmatch(s))
 
 def _extract_bases(lines: list[dict], doc_name: str = None) -> list[str]:
     bases = []
@@ -87,7 +113,7 @@ def _extract_bases(lines: list[dict], doc_name: str = None) -> list[str]:
     # Если у нас есть имя документа, извлекаем из него буквы
     if doc_name:
         # Извлекаем все кириллические буквы из имени документа
-        doc_name_letters = set(re.findall(r'[А-Яа-я]', doc_name.upper()))
+        doc_name_letters = set(CYR_LETTER_RE.findall(doc_name.upper()))
     
     for it in lines:
         txt = _to_cyr_upper(it["text"])
@@ -99,6 +125,25 @@ def _extract_bases(lines: list[dict], doc_name: str = None) -> list[str]:
             bases.append(txt)
     return bases
 
+class _XIndex:
+    """bbox, упорядоченные по x0: кандидаты с x0 в окне — бинарным поиском."""
+
+    def __init__(self, bboxes):
+        self.boxes = geometry.as_boxes(bboxes)
+        self.cy = geometry.center_y(self.boxes)
+        self._order = np.argsort(self.boxes[:, 0], kind="stable")
+        self._x0 = self.boxes[self._order, 0]
+
+    def x0_between(self, lo: float, hi: float) -> np.ndarray:
+        """
+        Индексы (по возрастанию) bbox с x0 примерно в [lo, hi]; окно расширено на 1 pt,
+        точное условие проверяет вызывающий.
+        """
+        a = np.searchsorted(self._x0, lo - 1.0, side="left")
+        b = np.searchsorted(self._x0, hi + 1.0, side="right")
+        return np.sort(self._order[a:b])
+
+
 def _extract_frame_letters(lines: list[dict], doc_name: str = None) -> list[str]:
     letters = []
     doc_name_letters = set()
@@ -106,10 +151,11 @@ def _extract_frame_letters(lines: list[dict], doc_name: str = None) -> list[str]
     # Если у нас есть имя документа, извлекаем из него буквы
     if doc_name:
         # Извлекаем все кириллические буквы из имени документа
-        doc_name_letters = set(re.findall(r'[А-Яа-я]', doc_name.upper()))
+        doc_name_letters = set(CYR_LETTER_RE.findall(doc_name.upper()))
 
-    # кандидаты буквенных меток (1–2 буквы)
+    # кандидаты буквенных меток (1–2 буквы), отсортированные по x0 для поиска соседей справа
     letter_tokens = [it for it in lines if _is_base_token(it["text"])]
+    tokens = _XIndex([lt["bbox"] for lt in letter_tokens])
 
     for it in lines:
         txt = _to_cyr_upper(it["text"].strip())
@@ -128,13 +174,18 @@ def _extract_frame_letters(lines: list[dict], doc_name: str = None) -> list[str]
             # ищем соседей справа (например отдельное "Б")
             x0, y0, x1, y1 = it["bbox"]
             cy = (y0 + y1) / 2
-            for lt in letter_tokens:
-                lx0, ly0, lx1, ly1 = lt["bbox"]
-                lcy = (ly0 + ly1) / 2
-                if lx0 >= x1 and (lx0 - x1) <= HORIZ_PT and abs(lcy - cy) <= VERT_PT:
-                    for ch in _to_cyr_upper(lt["text"]):
-                        if "А" <= ch <= "Я":
-                            letters.append(ch)
+            idx = tokens.x0_between(x1, x1 + HORIZ_PT)
+            lx0 = tokens.boxes[idx, 0]
+            near = (lx0 >= x1) & ((lx0 - x1) <= HORIZ_PT) & (np.abs(tokens.cy[idx] - cy) <= VERT_PT)
+            for k in idx[near]:
+                for ch in _to_cyr_upper(letter_tokens[k]["text"]):
+                    if "А" <= ch <= "Я":
+                        letters.append(ch)
+
+    # строки с допуском — для проверки соседства отдельных букв
+    tol_lines = _XIndex([
+        line["bbox"] for line in lines if RE_TOL_DECIMAL.search(_to_cyr_upper(line["text"].strip()))
+    ])
 
     # Дополнительная проверка: если в строке есть только буква и она находится рядом с допуском
     for it in lines:
@@ -147,15 +198,13 @@ def _extract_frame_letters(lines: list[dict], doc_name: str = None) -> list[str]
             # Проверяем, находится ли эта буква рядом с допуском
             x0, y0, x1, y1 = it["bbox"]
             cy = (y0 + y1) / 2
-            for line in lines:
-                line_txt = _to_cyr_upper(line["text"].strip())
-                if RE_TOL_DECIMAL.search(line_txt):
-                    lx0, ly0, lx1, ly1 = line["bbox"]
-                    lcy = (ly0 + ly1) / 2
-                    if lx0 <= x1 and (x1 - lx0) <= HORIZ_PT and abs(lcy - cy) <= VERT_PT:
-                        for ch in txt:
-                            if "А" <= ch <= "Я":
-                                letters.append(ch)
+            idx = tol_lines.x0_between(x1 - HORIZ_PT, x1)
+            lx0 = tol_lines.boxes[idx, 0]
+            near = (lx0 <= x1) & ((x1 - lx0) <= HORIZ_PT) & (np.abs(tol_lines.cy[idx] - cy) <= VERT_PT)
+            for _ in range(int(near.sum())):
+                for ch in txt:
+                    if "А" <= ch <= "Я":
+                        letters.append(ch)
 
     return letters
 
@@ -163,58 +212,39 @@ def _extract_frame_letters(lines: list[dict], doc_name: str = None) -> list[str]
 # ------------------------
 # Основная проверка
 # ------------------------
-def check_bases_vs_frames(pdf_path: str) -> dict:
-    # Импортируем необходимые функции из критерия 1.1.1
-    try:
-        from criterions.criterion_1_1_1 import extract_pdf_text_as_dict, filter_titleblock_items, load_config
-        # Загружаем конфигурацию
-        config_path = "./config.yaml"
-        cc = load_config(config_path) if Path(config_path).exists() else None
-        
-        # Извлекаем информацию о документе
-        extracted = extract_pdf_text_as_dict(pdf_path)
-        filtered = filter_titleblock_items(extracted, cc) if cc else {}
-        
-        # Получаем имя документа из первой страницы
-        doc_name = None
-        if 1 in filtered:
-            items = filtered[1]
-            for item in items:
-                if "doc_type_name" in item:
-                    doc_name = item["doc_type_name"]
-                    break
-                elif "text" in item and "doc_type_name" not in item:
-                    # Это может быть название документа
-                    doc_name = item["text"]
-                    break
-    except Exception:
-        doc_name = None
-
-    doc = fitz.open(pdf_path)
-    report = {"pages": {}, "ok": True}
-    try:
-        for pageno, page in enumerate(doc, start=1):
-            lines = _page_lines_with_bbox(page)
+def _check_page(page, doc_name: str = None) -> dict:
+    lines = _page_lines_with_bbox(page)
 
-            bases_set  = sorted(set(_extract_bases(lines, doc_name)))
-            frames_set = sorted(set(_extract_frame_letters(lines, doc_name)))
+    bases_set  = sorted(set(_extract_bases(lines, doc_name)))
+    frames_set = sorted(set(_extract_frame_letters(lines, doc_name)))
 
-            missing = sorted(set(frames_set) - set(bases_set))  # в рамках есть, базы нет → ошибка
-            extra   = sorted(set(bases_set) - set(frames_set))  # база есть, не используется → не критично
+    missing = sorted(set(frames_set) - set(bases_set))  # в рамках есть, базы нет → ошибка
+    extra   = sorted(set(bases_set) - set(frames_set))  # база есть, не используется → не критично
 
-            page_ok = (len(missing) == 0)
-            if not page_ok:
-                report["ok"] = False
+    return {
+        "bases_found":  bases_set,
+        "frames_found": frames_set,
+        "missing_bases": missing,
+        "extra_bases":   extra,
+        "page_ok": len(missing) == 0,
+    }
 
-            report["pages"][pageno] = {
-                "bases_found":  bases_set,
-                "frames_found": frames_set,
-                "missing_bases": missing,
-                "extra_bases":   extra,
-                "page_ok": page_ok,
-            }
-    finally:
-        doc.close()
+
+def check_bases_vs_frames(pdf_path) -> dict:
+    """
+    pdf_path — путь к PDF или уже открытый DrawingDocument.
+
+    Имя документа в проверку не передаётся: фильтр _extract_bases/_extract_frame_letters
+    отбрасывает любые буквы из имени ("Габаритный чертеж" убирает базы А и Б), а исходная
+    версия критерия фактически работала без него (импорт конфигурации в ней не срабатывал).
+    """
+    report = {"pages": {}, "ok": True}
+    with as_drawing(pdf_path) as drawing:
+        for page in drawing:
+            page_info = drawing.page_result(page, "1.1.8", _check_page)
+            if not page_info["page_ok"]:
+                report["ok"] = False
+            report["pages"][page.number] = page_info
     return report
 
 # ------------------------
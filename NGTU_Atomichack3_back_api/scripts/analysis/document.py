@@ -0,0 +1,349 @@
+from contextlib import contextmanager
+from pathlib import Path
+import hashlib
+import re
+import fitz  # PyMuPDF
+
+
+# =========================
+# Кэш извлечений текста одной страницы
+# =========================
+
+def _line_bbox_and_size(spans):
+    x0s = [float(s["bbox"][0]) for s in spans]
+    y0s = [float(s["bbox"][1]) for s in spans]
+    x1s = [float(s["bbox"][2]) for s in spans]
+    y1s = [float(s["bbox"][3]) for s in spans]
+    bbox = [min(x0s), min(y0s), max(x1s), max(y1s)]
+    size = max(float(s.get("size", 0.0)) for s in spans)
+    return bbox, size
+
+
+_XREF_RE = re.compile(r"(\d+)\s+0\s+R")
+
+
+def _font_fingerprint(doc: fitz.Document, xref: int) -> bytes:
+    """Описание шрифта, влияющее на извлечение текста: объект шрифта, потомки Type0, ToUnicode."""
+    parts = [doc.xref_object(xref, compressed=True).encode("utf-8", "replace")]
+    kind, value = doc.xref_get_key(xref, "DescendantFonts")
+    for ref in _XREF_RE.findall(value if kind in ("array", "xref") else ""):
+        parts.append(doc.xref_object(int(ref), compressed=True).encode("utf-8", "replace"))
+    kind, value = doc.xref_get_key(xref, "ToUnicode")
+    if kind == "xref":
+        parts.append(doc.xref_stream(int(value.split()[0])) or b"")
+    return b"\0".join(parts)
+
+
+_XOBJECT_RE = re.compile(r"/([^\s/<>\[\]()]+)\s*(\d+)\s+0\s+R")
+
+
+def _xobject_fingerprint(doc: fitz.Document, h, name: str, xref: int, seen: set) -> None:
+    """
+    Добавляет в h XObject и всё, на что он ссылается: form — поток и (рекурсивно) его
+    ресурсы XObject, image — сырые данные и маску (SMask). Номера xref в хэш не входят,
+    чтобы одинаковые листы разных версий PDF давали одинаковый digest.
+    """
+    if xref in seen:
+        h.update(f"|seen|{name}|".encode("utf-8", "replace"))
+        return
+    seen.add(xref)
+    subtype = doc.xref_get_key(xref, "Subtype")[1]
+    h.update(f"|xobj|{name}|{subtype}|".encode("utf-8", "replace"))
+    if subtype == "/Image":
+        for key in ("Width", "Height", "BitsPerComponent", "ColorSpace", "Filter", "DecodeParms", "Decode"):
+            kind, value = doc.xref_get_key(xref, key)
+            if kind == "xref":
+                value = doc.xref_object(int(value.split()[0]), compressed=True)
+            h.update(f"|{key}={_XREF_RE.sub('R', value)}".encode("utf-8", "replace"))
+        h.update(doc.xref_stream_raw(xref) or b"")
+        kind, value = doc.xref_get_key(xref, "SMask")
+        if kind == "xref":
+            _xobject_fingerprint(doc, h, "SMask", int(value.split()[0]), seen)
+        return
+    h.update(doc.xref_stream(xref) or b"")
+    for child, child_xref in _xobject_refs(doc, xref):
+        _xobject_fingerprint(doc, h, child, child_xref, seen)
+
+
+def _xobject_refs(doc: fitz.Document, xref: int) -> list[tuple[str, int]]:
+    """(имя, xref) из /Resources/XObject объекта xref (страницы или form-XObject)."""
+    kind, value = doc.xref_get_key(xref, "Resources/XObject")
+    if kind == "xref":
+        value = doc.xref_object(int(value.split()[0]), compressed=True)
+    elif kind != "dict":
+        return []
+    return [(name, int(ref)) for name, ref in _XOBJECT_RE.findall(value)]
+
+
+# флаги, с которыми page.search_for строит TextPage по умолчанию
+_SEARCH_FLAGS = (
+    fitz.TEXT_DEHYPHENATE
+    | fitz.TEXT_PRESERVE_WHITESPACE
+    | fitz.TEXT_PRESERVE_LIGATURES
+    | fitz.TEXT_MEDIABOX_CLIP
+)
+
+
+class PageTextIndex:
+    """
+    Ленивый кэш всего, что критерии извлекают из одной страницы.
+    Каждое извлечение (dict / rawdict / words / textpage) выполняется не больше одного раза,
+    производные представления (спаны, строки) строятся из уже извлечённого dict.
+    Результаты общие для всех критериев — их нельзя модифицировать на месте.
+    """
+
+    def __init__(self, page: fitz.Page, number: int | None = None):
+        self.page = page
+        self.number = number if number is not None else page.number + 1
+        self._cache: dict = {}
+
+    def _cached(self, key: str, factory):
+        if key not in self._cache:
+            self._cache[key] = factory()
+        return self._cache[key]
+
+    @property
+    def rect(self) -> fitz.Rect:
+        return self.page.rect
+
+    @property
+    def rotation(self) -> int:
+        return self.page.rotation
+
+    @property
+    def content_digest(self) -> str:
+        """
+        sha256 содержимого страницы: поток(и) контента, XObject'ы (form — рекурсивно с их
+        ресурсами, image — данные и маска), шрифты (с ToUnicode), аннотации, размер и поворот.
+        Одинаковый digest — одинаковый результат проверок страницы (в т.ч. VLM-проверок по
+        растру), поэтому он служит ключом кэша постраничных результатов.
+        """
+        def build():
+            page, doc = self.page, self.page.parent
+            h = hashlib.sha256()
+            h.update(f"{tuple(page.rect)}|{page.rotation}|".encode())
+            h.update(page.read_contents() or b"")
+            seen = set()
+            roots = _xobject_refs(doc, page.xref)
+            if not roots:
+                # ресурсы унаследованы от дерева страниц — берём то, что видит PyMuPDF на уровне страницы
+                roots = [(x[1], x[0]) for x in page.get_xobjects() if x[2] == 0]
+                roots += [(x[7], x[0]) for x in page.get_images(full=True) if x[-1] == 0]
+            for name, xref in sorted(roots):
+                _xobject_fingerprint(doc, h, name, xref, seen)
+            for font in page.get_fonts():
+                h.update(f"|font|{font[1:]}|".encode("utf-8", "replace"))
+                h.update(_font_fingerprint(doc, font[0]))
+            annot = page.first_annot
+            while annot:
+                h.update(f"|annot|{annot.type}|{tuple(annot.rect)}|{annot.rotation}|{annot.info}".encode("utf-8", "replace"))
+                annot = annot.next
+            return h.hexdigest()
+        return self._cached("content_digest", build)
+
+    # --- сырые извлечения PyMuPDF ---
+    @property
+    def text_dict(self) -> dict:
+        return self._cached("dict", lambda: self.page.get_text("dict"))
+
+    @property
+    def rawdict(self) -> dict:
+        return self._cached("rawdict", lambda: self.page.get_text("rawdict"))
+
+    @property
+    def textpage_dict(self) -> dict:
+        """textpage.extractDICT() — используется критериями 1.1.5/1.1.6 как отдельный источник."""
+        return self._cached("textpage_dict", lambda: self.page.get_textpage().extractDICT())
+
+    @property
+    def words(self) -> list:
+        return self._cached("words", lambda: self.page.get_text("words"))
+
+    # --- поиск текста ---
+    @property
+    def search_textpage(self) -> fitz.TextPage:
+        """TextPage с флагами page.search_for по умолчанию — создаётся один раз на страницу."""
+        return self._cached("search_textpage", lambda: self.page.get_textpage(flags=_SEARCH_FLAGS))
+
+    @property
+    def search_chars(self) -> frozenset:
+        """
+        Все символы страницы в обоих регистрах (поиск MuPDF регистронезависимый).
+        Строится из уже извлечённого dict: extractText() на search_textpage меняет
+        результаты последующего поиска по нему.
+        """
+        def build():
+            text = "".join(
+                span.get("text") or ""
+                for block in self.text_dict.get("blocks", []) if block.get("type", 0) == 0
+                for line in block.get("lines", [])
+                for span in line.get("spans", [])
+            )
+            return frozenset(text) | frozenset(text.lower()) | frozenset(text.upper())
+        return self._cached("search_chars", build)
+
+    def search(self, needle: str) -> list[fitz.Rect]:
+        """
+        То же, что page.search_for(needle), но без повторного разбора страницы:
+        поиск идёт по общему TextPage, результат запоминается по тексту запроса.
+        Если какого-то символа запроса нет на странице — совпадений заведомо нет.
+        Возвращаемые прямоугольники общие — их нельзя модифицировать на месте.
+        """
+        memo = self._cached("search_memo", dict)
+        if needle not in memo:
+            chars = self.search_chars
+            if any(not c.isspace() and c != "-" and c not in chars for c in needle):
+                memo[needle] = []
+            else:
+                memo[needle] = self.page.search_for(needle, textpage=self.search_textpage) or []
+        return memo[needle]
+
+    # --- производные представления ---
+    @property
+    def spans(self) -> list[dict]:
+        """Непустые спаны в порядке документа: {text, bbox, font, size} (bbox — исходные float)."""
+        def build():
+            out = []
+            for block in self.text_dict.get("blocks", []):
+                if block.get("type", 0) != 0:
+                    continue
+                for line in block.get("lines", []):
+                    for span in line.get("spans", []):
+                        text = (span.get("text") or "").strip()
+                        if not text:
+                            continue
+                        out.append({
+                            "text": text,
+                            "bbox": tuple(float(v) for v in span.get("bbox", (0, 0, 0, 0))),
+                            "font": span.get("font"),
+                            "size": float(span.get("size", 0.0)),
+                        })
+            return out
+        return self._cached("spans", build)
+
+    def _dict_lines(self) -> list[tuple[str, list[float], float]]:
+        def build():
+            out = []
+            for block in self.text_dict.get("blocks", []):
+                if block.get("type", 0) != 0:
+                    continue
+                for line in block.get("lines", []):
+                    spans = line.get("spans", [])
+                    if not spans:
+                        continue
+                    text = "".join((s.get("text") or "") for s in spans).strip()
+                    if not text:
+                        continue
+                    bbox, size = _line_bbox_and_size(spans)
+                    out.append((text, bbox, size))
+            return out
+        return self._cached("dict_lines", build)
+
+    @property
+    def lines_raw(self) -> list[dict]:
+        """Строки {text, bbox, size} без округления, отсортированы по (y0, x0)."""
+        def build():
+            out = [{"text": t, "bbox": list(b), "size": s} for t, b, s in self._dict_lines()]
+            out.sort(key=lambda it: (it["bbox"][1], it["bbox"][0]))
+            return out
+        return self._cached("lines_raw", build)
+
+    @property
+    def lines(self) -> list[dict]:
+        """Строки {text, bbox, size} с округлением до 0.01, отсортированы по (y0, x0)."""
+        def build():
+            out = [
+                {"text": t, "bbox": [round(v, 2) for v in b], "size": round(s, 2)}
+                for t, b, s in self._dict_lines()
+            ]
+            out.sort(key=lambda it: (it["bbox"][1], it["bbox"][0]))
+            return out
+        return self._cached("lines", build)
+
+    @property
+    def line_texts(self) -> list[str]:
+        """Тексты строк в порядке блоков (без сортировки)."""
+        return self._cached("line_texts", lambda: [t for t, _, _ in self._dict_lines()])
+
+    @property
+    def layout(self):
+        """LayoutModel (layout.py): ТТ / поле / основная надпись, общие для всех критериев."""
+        from .layout import LayoutModel
+        return self._cached("layout", lambda: LayoutModel(self))
+
+
+def text_index(page) -> PageTextIndex:
+    """Принимает fitz.Page или PageTextIndex и всегда возвращает PageTextIndex."""
+    if isinstance(page, PageTextIndex):
+        return page
+    return PageTextIndex(page)
+
+
+# =========================
+# Документ: один fitz.open на весь анализ
+# =========================
+
+class DrawingDocument:
+    """
+    Открывает PDF один раз и раздаёт критериям PageTextIndex по номеру страницы (с 1).
+    Страницы индексируются лениво и кэшируются до закрытия документа.
+    """
+
+    def __init__(self, pdf_path: str, page_cache=None):
+        self.path = str(pdf_path)
+        self.doc = fitz.open(self.path)
+        self._pages: dict[int, PageTextIndex] = {}
+        # PageCache (page_cache.py) — постраничные результаты критериев; None — без кэша
+        self.page_cache = page_cache
+
+    @property
+    def name(self) -> str:
+        return Path(self.path).name
+
+    def __len__(self) -> int:
+        return len(self.doc)
+
+    def page(self, pageno: int) -> PageTextIndex:
+        if pageno not in self._pages:
+            self._pages[pageno] = PageTextIndex(self.doc[pageno - 1], pageno)
+        return self._pages[pageno]
+
+    def __iter__(self):
+        for pageno in range(1, len(self.doc) + 1):
+            yield self.page(pageno)
+
+    def page_result(self, page: PageTextIndex, criterion: str, compute):
+        """
+        Результат постраничной проверки criterion для page.
+        С page_cache берётся по digest содержимого страницы, иначе — compute(page).
+        """
+        if self.page_cache is None:
+            return compute(page)
+        return self.page_cache.get_or_compute(page, criterion, compute)
+
+    def close(self) -> None:
+        self._pages.clear()
+        if not self.doc.is_closed:
+            self.doc.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@contextmanager
+def as_drawing(src):
+    """
+    Контекст для функций, принимающих путь или DrawingDocument.
+    Чужой DrawingDocument не закрываем, открытый по пути — закрываем на выходе.
+    """
+    if isinstance(src, DrawingDocument):
+        yield src
+        return
+    drawing = DrawingDocument(src)
+    try:
+        yield drawing
+    finally:
+        drawing.close()
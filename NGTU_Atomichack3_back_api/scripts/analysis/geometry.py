@@ -0,0 +1,106 @@
+"""
+Векторные операции над bbox на NumPy.
+
+Прямоугольники хранятся массивом (N, 4) float64: x0, y0, x1, y1 (координаты PDF, pt).
+Формулы повторяют прежние поштучные версии (fitz.Rect, _iou, _rect_distance),
+поэтому пороговые сравнения дают те же ответы.
+"""
+import numpy as np
+
+
+def as_boxes(bboxes) -> np.ndarray:
+    """Список bbox / fitz.Rect → массив (N, 4)."""
+    if isinstance(bboxes, np.ndarray):
+        return bboxes.astype(np.float64, copy=False).reshape(-1, 4)
+    return np.array([tuple(b) for b in bboxes], dtype=np.float64).reshape(-1, 4)
+
+
+def centers(boxes: np.ndarray) -> np.ndarray:
+    """Центры прямоугольников, (N, 2)."""
+    return np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+
+
+def center_y(boxes: np.ndarray) -> np.ndarray:
+    return (boxes[:, 1] + boxes[:, 3]) / 2
+
+
+def union(boxes: np.ndarray) -> tuple[float, float, float, float] | None:
+    """Объединяющий прямоугольник (None для пустого набора)."""
+    if len(boxes) == 0:
+        return None
+    return (
+        float(boxes[:, 0].min()), float(boxes[:, 1].min()),
+        float(boxes[:, 2].max()), float(boxes[:, 3].max()),
+    )
+
+
+def is_empty(box) -> bool:
+    x0, y0, x1, y1 = box
+    return x0 >= x1 or y0 >= y1
+
+
+def include(box, other) -> tuple[float, float, float, float]:
+    """
+    box | other по правилам fitz.Rect: пустой other не расширяет, пустой box заменяется.
+    Объединение fitz считает в MuPDF (float32) — округляем так же, чтобы дальнейшие
+    пороговые сравнения совпадали с кодом на fitz.Rect бит в бит.
+    """
+    other = tuple(float(c) for c in other)
+    if is_empty(other):
+        return tuple(box)
+    if is_empty(box):
+        return other
+    return tuple(float(np.float32(c)) for c in (
+        min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3]),
+    ))
+
+
+def iou(box, boxes: np.ndarray) -> np.ndarray:
+    """IoU одного прямоугольника со всеми (0 при пустом пересечении)."""
+    x0, y0, x1, y1 = box
+    ix0 = np.maximum(boxes[:, 0], x0)
+    iy0 = np.maximum(boxes[:, 1], y0)
+    ix1 = np.minimum(boxes[:, 2], x1)
+    iy1 = np.minimum(boxes[:, 3], y1)
+    nonempty = (ix1 > ix0) & (iy1 > iy0)
+    inter = np.where(nonempty, (ix1 - ix0) * (iy1 - iy0), 0.0)
+    a1 = (x1 - x0) * (y1 - y0)
+    a2 = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    out = inter / (a1 + a2 - inter + 1e-9)
+    return np.where(nonempty, out, 0.0)
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Попарные IoU, (len(a), len(b))."""
+    return np.stack([iou(box, b) for box in a]) if len(a) else np.zeros((0, len(b)))
+
+
+def rect_distance(box, boxes: np.ndarray) -> np.ndarray:
+    """Евклидово расстояние между ближайшими точками (0 при пересечении/касании)."""
+    x0, y0, x1, y1 = box
+    dx = np.maximum(np.maximum(boxes[:, 0] - x1, x0 - boxes[:, 2]), 0.0)
+    dy = np.maximum(np.maximum(boxes[:, 1] - y1, y0 - boxes[:, 3]), 0.0)
+    return np.sqrt(dx * dx + dy * dy)
+
+
+def distance_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Попарные расстояния между прямоугольниками, (len(a), len(b))."""
+    dx = np.maximum(np.maximum(b[None, :, 0] - a[:, None, 2], a[:, None, 0] - b[None, :, 2]), 0.0)
+    dy = np.maximum(np.maximum(b[None, :, 1] - a[:, None, 3], a[:, None, 1] - b[None, :, 3]), 0.0)
+    return np.sqrt(dx * dx + dy * dy)
+
+
+def center_distance(box, boxes: np.ndarray) -> np.ndarray:
+    """Расстояния от центра box до центров boxes."""
+    cx = (box[0] + box[2]) / 2
+    cy = (box[1] + box[3]) / 2
+    c = centers(boxes)
+    dx = cx - c[:, 0]
+    dy = cy - c[:, 1]
+    return np.sqrt(dx * dx + dy * dy)
+
+
+def contains(box, boxes: np.ndarray) -> np.ndarray:
+    """Маска: boxes целиком внутри box (границы включительно)."""
+    x0, y0, x1, y1 = box
+    return (boxes[:, 0] >= x0) & (boxes[:, 1] >= y0) & (boxes[:, 2] <= x1) & (boxes[:, 3] <= y1)
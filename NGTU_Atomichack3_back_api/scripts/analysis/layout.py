@@ -0,0 +1,233 @@
+"""
+Разметка листа (LayoutModel): пункты ТТ и поле чертежа, столбцы ТТ, основная надпись,
+обозначения сечений и одиночные буквы на поле.
+
+Раньше страницу делил на ТТ и поле каждый критерий сам (1.1.2, 1.1.3, 1.1.4),
+а collect_violations пересобирал рамку ТТ из отчёта 1.1.2. Теперь разметка строится
+один раз на страницу (PageTextIndex.layout), и критерии берут из неё готовые части.
+
+Пункт ТТ — строка, начинающаяся с номера ("1 ", "2.", "3)"), правило общее для всех.
+Для звёздочек 1.1.4 своё уточнение: пунктом считается и сноска "2** текст",
+а строка из одного номера — нет; оно вынесено в отдельные поля star_*,
+чтобы отчёты 1.1.4 остались прежними.
+"""
+import fitz  # PyMuPDF
+
+from . import geometry
+from .patterns import (
+    CYR_LETTER_YO_RE, ROUGHNESS_RE, SECTION_DESIGNATION_RE, SECTION_IN_TEXT_RE, TT_NUMBERED_RE,
+    TT_STAR_LINE_RE, has_tb_keyword,
+)
+
+PT_PER_MM = 72.0 / 25.4
+COL_X_CLUSTER_PT = 14 * PT_PER_MM   # x0 distance to cluster lines into columns (~14 mm)
+
+_STRIP_CHARS = ".:,;()[]{}<>«»'\""
+
+
+# =========================
+# Правила разметки (на одной строке)
+# =========================
+
+def is_tt_line(text: str) -> bool:
+    return bool(TT_NUMBERED_RE.match(text.strip()))
+
+
+def is_tt_star_line(text: str) -> bool:
+    """Правило 1.1.4: номер + разделитель / звёздочки / текст, но не один номер."""
+    return bool(TT_STAR_LINE_RE.match(text))
+
+
+def is_section_designation(text: str) -> bool:
+    """Обозначение сечения целиком: "А-А", "А А", "A-A"."""
+    s = text.strip().strip(_STRIP_CHARS)
+    return bool(SECTION_DESIGNATION_RE.match(s))
+
+
+def is_single_letter_token(text: str) -> bool:
+    """Одиночная кириллическая буква (не обозначение сечения)."""
+    if is_section_designation(text):
+        return False
+    s = text.strip().strip(_STRIP_CHARS)
+    return bool(len(s) == 1 and CYR_LETTER_YO_RE.fullmatch(s))
+
+
+def split_tt_and_field(lines: list[dict]) -> tuple[list[dict], list[dict]]:
+    tt, field = [], []
+    for it in lines:
+        (tt if is_tt_line(it["text"]) else field).append(it)
+    return tt, field
+
+
+def split_tt_star(texts: list[str]) -> tuple[list[str], list[str]]:
+    """Тексты строк → (ТТ, поле) по правилу 1.1.4."""
+    tt, field = [], []
+    for t in texts:
+        (tt if is_tt_star_line(t) else field).append(t)
+    return tt, field
+
+
+def find_title_block(lines: list[dict], page_rect) -> tuple[list[dict], fitz.Rect, str]:
+    """Основная надпись: по ключевым словам, иначе по тексту в правом нижнем углу."""
+    matches = []
+    for it in lines:
+        low = it["text"].lower().replace("ё", "е")
+        if has_tb_keyword(low):
+            matches.append(it)
+
+    if len(matches) >= 2:
+        x0 = min(it["bbox"][0] for it in matches)
+        y0 = min(it["bbox"][1] for it in matches)
+        x1 = max(it["bbox"][2] for it in matches)
+        y1 = max(it["bbox"][3] for it in matches)
+        return matches, fitz.Rect(x0, y0, x1, y1), "keywords"
+
+    # Fallback: bottom-right zone text union
+    w, h = page_rect.width, page_rect.height
+    br_matches = [it for it in lines if it["bbox"][0] > 0.6 * w and it["bbox"][1] > 0.6 * h]
+    if not br_matches:
+        br_matches = [it for it in lines if it["bbox"][0] > 0.5 * w and it["bbox"][1] > 0.7 * h]
+    if br_matches:
+        x0 = min(it["bbox"][0] for it in br_matches)
+        y0 = min(it["bbox"][1] for it in br_matches)
+        x1 = max(it["bbox"][2] for it in br_matches)
+        y1 = max(it["bbox"][3] for it in br_matches)
+        return br_matches, fitz.Rect(x0, y0, x1, y1), "bottom-right"
+    return [], fitz.Rect(0, page_rect.height - 50, page_rect.width, page_rect.height), "default-bottom-strip"
+
+
+def cluster_columns(tt_lines: list[dict]) -> list[list[dict]]:
+    """Столбцы ТТ справа налево: строки с близким x0 (COL_X_CLUSTER_PT)."""
+    if not tt_lines:
+        return []
+    lines_sorted = sorted(tt_lines, key=lambda it: it["bbox"][0], reverse=True)
+    cols = [[lines_sorted[0]]]
+    for it in lines_sorted[1:]:
+        x0 = it["bbox"][0]
+        col = cols[-1]
+        mean_x0 = sum(e["bbox"][0] for e in col) / len(col)
+        if abs(mean_x0 - x0) <= COL_X_CLUSTER_PT:
+            col.append(it)
+        else:
+            cols.append([it])
+    for col in cols:
+        col.sort(key=lambda it: (it["bbox"][1], it["bbox"][0]))
+    return cols
+
+
+def column_bbox(col: list[dict]) -> fitz.Rect:
+    return fitz.Rect(*geometry.union(geometry.as_boxes([it["bbox"] for it in col])))
+
+
+# =========================
+# Разметка страницы
+# =========================
+
+class LayoutModel:
+    """
+    Ленивая разметка одной страницы поверх PageTextIndex; каждая часть считается один раз.
+    Строки — те же объекты, что в PageTextIndex (lines / lines_raw / line_texts),
+    их нельзя модифицировать на месте.
+    """
+
+    def __init__(self, page):
+        self.page = page  # PageTextIndex
+        self._cache: dict = {}
+
+    @classmethod
+    def from_lines(cls, lines: list[dict]) -> "LayoutModel":
+        """Разметка только по готовым строкам (без страницы): ТТ/поле и буквенные обозначения."""
+        model = cls(None)
+        model._cache["split:rounded"] = split_tt_and_field(lines)
+        return model
+
+    def _cached(self, key: str, factory):
+        if key not in self._cache:
+            self._cache[key] = factory()
+        return self._cache[key]
+
+    # --- ТТ и поле ---
+    @property
+    def tt_lines(self) -> list[dict]:
+        """Строки ТТ (page.lines, округлённые bbox)."""
+        return self._split("rounded", lambda: self.page.lines)[0]
+
+    @property
+    def field_lines(self) -> list[dict]:
+        return self._split("rounded", lambda: self.page.lines)[1]
+
+    @property
+    def tt_lines_raw(self) -> list[dict]:
+        """Строки ТТ (page.lines_raw, исходные bbox) — для геометрии столбцов."""
+        return self._split("raw", lambda: self.page.lines_raw)[0]
+
+    @property
+    def field_lines_raw(self) -> list[dict]:
+        return self._split("raw", lambda: self.page.lines_raw)[1]
+
+    def _split(self, key: str, lines):
+        return self._cached(f"split:{key}", lambda: split_tt_and_field(lines()))
+
+    @property
+    def star_tt_texts(self) -> list[str]:
+        """Тексты строк ТТ по правилу 1.1.4 (порядок блоков, как page.line_texts)."""
+        return self._star_split()[0]
+
+    @property
+    def star_field_texts(self) -> list[str]:
+        return self._star_split()[1]
+
+    def _star_split(self):
+        return self._cached("star_split", lambda: split_tt_star(self.page.line_texts))
+
+    # --- основная надпись и столбцы ТТ ---
+    @property
+    def title_block(self) -> tuple[list[dict], fitz.Rect, str]:
+        """(строки-признаки, bbox, способ определения)."""
+        return self._cached("title_block", lambda: find_title_block(self.page.lines_raw, self.page.rect))
+
+    @property
+    def tt_columns(self) -> list[list[dict]]:
+        return self._cached("tt_columns", lambda: cluster_columns(self.tt_lines_raw))
+
+    @property
+    def tt_column_rects(self) -> list[fitz.Rect]:
+        return self._cached("tt_column_rects", lambda: [column_bbox(c) for c in self.tt_columns])
+
+    @property
+    def tt_rect(self) -> fitz.Rect | None:
+        """
+        Рамка всех столбцов ТТ в координатах отчёта 1.1.2 (bbox столбцов округлены до 0.01);
+        None — ТТ на листе нет.
+        """
+        def build():
+            if not self.tt_column_rects:
+                return None
+            boxes = [[round(v, 2) for v in (r.x0, r.y0, r.x1, r.y1)] for r in self.tt_column_rects]
+            return fitz.Rect(*geometry.union(geometry.as_boxes(boxes)))
+        return self._cached("tt_rect", build)
+
+    # --- буквенные обозначения на поле ---
+    @property
+    def section_lines(self) -> list[dict]:
+        """
+        Строки поля с обозначением сечения ("А-А", "Сечение Б-Б", ...);
+        обозначения шероховатости Ra/Rz/Rt сюда не входят.
+        """
+        def build():
+            out = []
+            for it in self.field_lines:
+                text = it["text"].strip()
+                if ROUGHNESS_RE.match(text):
+                    continue
+                if is_section_designation(text) or SECTION_IN_TEXT_RE.search(text):
+                    out.append(it)
+            return out
+        return self._cached("section_lines", build)
+
+    @property
+    def single_letter_lines(self) -> list[dict]:
+        """Строки поля из одной кириллической буквы."""
+        return self._cached("single_letter_lines", lambda: [
+            it for it in self.field_lines if is_single_letter_token(it["text"].strip())
+        ])
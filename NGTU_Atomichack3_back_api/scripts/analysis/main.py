@@ -2,17 +2,30 @@ from pathlib import Path
 import fitz  # PyMuPDF
 from typing import List, Dict, Any
 from rich import print
-from .criterion_1_1_1 import extract_pdf_text_as_dict, filter_titleblock_items, load_config  # :contentReference[oaicite:2]{index=2}
+from .criterion_1_1_1 import extract_pdf_text_as_dict, filter_titleblock_items  # :contentReference[oaicite:2]{index=2}
 from .criterion_1_1_2_n import run_check as run_check_1_1_2                                   # :contentReference[oaicite:3]{index=3}
 from .criterion_1_1_3_n import check_letter_designations, extract_lines_with_bbox                                        # :contentReference[oaicite:4]{index=4}
 from .criterion_1_1_4_n import check_stars                                                       # :contentReference[oaicite:5]{index=5}
 from .criterion_1_1_5 import check as check_1_1_5                                              # :contentReference[oaicite:6]{index=6}
 from .criterion_1_1_6 import check as check_1_1_6                                              # :contentReference[oaicite:7]{index=7}
 from .criterion_1_1_8 import check_bases_vs_frames
+from .orientation import check as check_orientation
+from .artifacts import draw_layered, save_violations
+from ..parse_report import build_report, render_report_txt, report_json_path
+from .patterns import LETTER_RE, SECTION_PAIR_RE
+from .config_registry import CONFIG_PATH, config_digest, get_config
+from .document import DrawingDocument, as_drawing
+from .spatial import GridIndex
+from . import geometry
+import numpy as np
+import json
 import os
-import re
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import Optional
 from .multi_page_gost_checker import check_both_criteria_multi_page
+from .page_cache import PAGE_CACHE_DIR, PAGE_CACHE_ENABLED, PageCache
 
 def _pdf_first_page_to_png(pdf_path: str, dpi: int = 200) -> Optional[str]:
     """
@@ -33,27 +46,146 @@ def _pdf_first_page_to_png(pdf_path: str, dpi: int = 200) -> Optional[str]:
         return None
 
 
+# Версия логики проверок: поднимать при любом изменении, меняющем результат анализа
+# (ключ кэша результатов включает её, старые записи перестают находиться).
+CHECKER_VERSION = "2025.10.6"
+
+
 # ---------- PIPELINE ----------
-def pipeline(pdf_path: str) -> dict:
-    output: dict = {}
+# Параллельный режим: локальные критерии в пуле процессов, 1.1.7/1.1.9 (VLM) — параллельно в потоке
+ANALYSIS_PARALLEL = os.getenv("ANALYSIS_PARALLEL", "0").lower() in ("1", "true", "yes")
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "0")) or None  # None → по числу CPU
+
+# Критерии, группированные по задачам пула: внутри группы документ открывается один раз
+# и извлечения страниц переиспользуются. 1.1.3 — самый долгий, идёт отдельно;
+# 1.1.5/1.1.6 вместе — их считает один этап orientation; остальные — общий dict.
+LOCAL_CHECK_GROUPS = [
+    ("1.1.3",),
+    ("1.1.5", "1.1.6"),
+    ("1.1.1", "1.1.2", "1.1.4", "1.1.8"),
+]
+
+
+def _check_1_1_1(drawing) -> dict:
+    out_1_1_1 = extract_pdf_text_as_dict(drawing)
+    return filter_titleblock_items(out_1_1_1, get_config(CONFIG_PATH))
+
+
+LOCAL_CHECKS = {
+    "1.1.1": _check_1_1_1,
+    "1.1.2": run_check_1_1_2,
+    "1.1.3": check_letter_designations,
+    "1.1.4": check_stars,
+    "1.1.5": check_1_1_5,
+    "1.1.6": check_1_1_6,
+    "1.1.8": check_bases_vs_frames,
+}
+
+# Этапы, выдающие отчёты нескольких критериев за один проход по документу.
+# Используются, когда в группу входят все их критерии; по одному критерии считаются через LOCAL_CHECKS.
+FUSED_CHECKS = {
+    ("1.1.5", "1.1.6"): check_orientation,
+}
+
+_process_pool: ProcessPoolExecutor | None = None
+_process_pool_workers: int | None = None
+_process_pool_lock = threading.Lock()
+
+
+def _get_process_pool(max_workers: int | None) -> ProcessPoolExecutor:
+    """Пул процессов создаётся лениво и переиспользуется между загрузками."""
+    global _process_pool, _process_pool_workers
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool_workers != max_workers:
+            if _process_pool is not None:
+                _process_pool.shutdown(wait=False)
+            # spawn: сервер многопоточный, fork такого процесса небезопасен
+            _process_pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp.get_context("spawn"))
+            _process_pool_workers = max_workers
+        return _process_pool
+
+
+def make_page_cache() -> PageCache | None:
+    """Постраничный кэш (PAGE_CACHE_ENABLED); соль — версия проверок и digest конфига."""
+    if not PAGE_CACHE_ENABLED:
+        return None
+    return PageCache(PAGE_CACHE_DIR, salt=f"{CHECKER_VERSION}:{config_digest(CONFIG_PATH)}")
 
-    out_1_1_1 = extract_pdf_text_as_dict(pdf_path)
-    res_1_1_1 = filter_titleblock_items(out_1_1_1, load_config("./scripts/analysis/config.yaml"))
-    output["1.1.1"] = res_1_1_1
-
-    output["1.1.2"] = run_check_1_1_2(pdf_path)
-    output["1.1.3"] = check_letter_designations(pdf_path)
-    output["1.1.4"] = check_stars(pdf_path)
-    output["1.1.5"] = check_1_1_5(pdf_path)
-    output["1.1.6"] = check_1_1_6(pdf_path)
-    output["1.1.8"] = check_bases_vs_frames(pdf_path)
-        # --- 1.1.7 и 1.1.9: проверки без bbox (ok/comment) ---
+
+def _run_local_checks(pdf_path, names, use_page_cache: bool = True) -> dict:
+    """Выполняет группу локальных критериев на одном документе. Вызывается и в дочернем процессе."""
+    with as_drawing(pdf_path) as drawing:
+        if use_page_cache and drawing.page_cache is None:
+            drawing.page_cache = make_page_cache()
+        results: dict = {}
+        for name in names:
+            if name in results:
+                continue
+            fused = next((crits for crits in FUSED_CHECKS if name in crits and set(crits) <= set(names)), None)
+            if fused:
+                results.update(FUSED_CHECKS[fused](drawing))
+            else:
+                results[name] = LOCAL_CHECKS[name](drawing)
+        return {name: results[name] for name in names}
+
+
+def _run_local_checks_parallel(pdf_path: str, max_workers: int | None = None,
+                               use_page_cache: bool = True) -> dict:
+    """Раскладывает LOCAL_CHECK_GROUPS по пулу процессов и собирает результаты."""
+    pool = _get_process_pool(max_workers)
+    futures = [
+        pool.submit(_run_local_checks, pdf_path, names, use_page_cache)
+        for names in LOCAL_CHECK_GROUPS
+    ]
+    results: dict = {}
+    for fut in futures:
+        results.update(fut.result())
+    return results
+
+
+def _run_vlm_checks(pdf_path: str, page_cache: PageCache | None = None) -> dict:
+    # --- 1.1.7 и 1.1.9: проверки без bbox (ok/comment) ---
     # Берем API-ключ из переменной окружения, рендерим 1-ю страницу PDF в PNG.
     api_key = os.getenv("OPENROUTER_API_KEY")
     candidate_png = _pdf_first_page_to_png(pdf_path)
 
-    result = check_both_criteria_multi_page(pdf_path, api_key)
-    
+    return check_both_criteria_multi_page(pdf_path, api_key, page_cache=page_cache)
+
+
+def pipeline(pdf_path, parallel: bool | None = None, max_workers: int | None = None) -> dict:
+    """
+    pdf_path — путь к PDF или уже открытый DrawingDocument.
+    Последовательный режим: документ открывается один раз, все критерии читают текст из общего кэша.
+    Параллельный режим (parallel=True или ANALYSIS_PARALLEL=1): группы LOCAL_CHECK_GROUPS
+    выполняются в пуле процессов, VLM-проверки стартуют сразу же в отдельном потоке.
+    Результат в обоих режимах одинаковый.
+    """
+    if parallel is None:
+        parallel = ANALYSIS_PARALLEL
+    if max_workers is None:
+        max_workers = ANALYSIS_WORKERS
+
+    output: dict = {}
+    local_results: dict = {}
+    page_cache = make_page_cache()
+
+    if parallel:
+        path = pdf_path.path if isinstance(pdf_path, DrawingDocument) else str(pdf_path)
+        with ThreadPoolExecutor(max_workers=1) as vlm_executor:
+            vlm_future = vlm_executor.submit(_run_vlm_checks, path, page_cache)
+            local_results = _run_local_checks_parallel(path, max_workers)
+            result = vlm_future.result()
+    else:
+        with as_drawing(pdf_path) as drawing:
+            if drawing.page_cache is None:
+                drawing.page_cache = page_cache
+            local_results = _run_local_checks(drawing, LOCAL_CHECKS)
+            path = drawing.path
+        result = _run_vlm_checks(path, page_cache)
+
+    # порядок ключей как у последовательного запуска
+    for name in LOCAL_CHECKS:
+        output[name] = local_results[name]
     output["1.1.9"] = result["1.1.9"]
     output["1.1.7"] = result["1.1.7"]
     #output["1.1.3"] = _safe_check("1.1.3")
@@ -62,19 +194,6 @@ def pipeline(pdf_path: str) -> dict:
 
 
 # ---------- ВСПОМОГАТЕЛЬНОЕ ----------
-def _union_tt_bbox(report_1_1_2: dict, page_index: int):
-    try:
-        page = report_1_1_2["pages"][page_index]
-        cols = page.get("tt_columns") or []
-        if not cols:
-            return None
-        rects = [fitz.Rect(*c["bbox_pt"]) for c in cols]
-        x0 = min(r.x0 for r in rects); y0 = min(r.y0 for r in rects)
-        x1 = max(r.x1 for r in rects); y1 = max(r.y1 for r in rects)
-        return fitz.Rect(x0, y0, x1, y1)
-    except Exception:
-        return None
-
 # --- NEW: утилиты для группировки одинаковых объектов 1.1.5/1.1.6 ---
 _DIM_CRITS = {"1.1.5", "1.1.6"}
 
@@ -134,8 +253,13 @@ def _iou(r1: fitz.Rect, r2: fitz.Rect) -> float:
     return inter.get_area() / (a1 + a2 - inter.get_area() + 1e-9)
 
 
-def collect_violations(pdf_path: str, out: dict) -> list[dict]:
-    """Собирает все нарушения с bbox (без объединения)."""
+def collect_violations(pdf_path, out: dict) -> list[dict]:
+    """Собирает все нарушения с bbox (без объединения). pdf_path — путь к PDF или DrawingDocument."""
+    with as_drawing(pdf_path) as drawing:
+        return _collect_violations(drawing, out)
+
+
+def _collect_violations(drawing: DrawingDocument, out: dict) -> list[dict]:
     violations: list[dict] = []
 
     # --- 1.1.1 ---
@@ -162,133 +286,117 @@ def collect_violations(pdf_path: str, out: dict) -> list[dict]:
             })
 
     # --- 1.1.4: «на поле есть, в ТТ нет» — обводим найденное на поле ---
-    rep_112 = out.get("1.1.2") or {}
     rep_114 = out.get("1.1.4") or {}
     try:
-        doc = fitz.open(pdf_path)
-        try:
-            for page_idx, page_info in (rep_114.get("pages") or {}).items():
-                p = int(page_idx)
-                tokens = page_info.get("missing_in_tt") or []
-                page = doc[p - 1]
-                tt_rect = _union_tt_bbox(rep_112, p)
-                
-                # Проверяем, есть ли в ТТ элементы, содержащие "**"
-                has_double_stars = False
-                for page_info_check in (rep_114.get("pages") or {}).values():
-                    tt_lines = page_info_check.get("tt_lines", [])
-                    for line in tt_lines:
-                        if "**" in line:
-                            has_double_stars = True
-                            break
-                    if has_double_stars:
-                        break
+        # Проверяем, есть ли в ТТ (на любом листе) элементы, содержащие "**"
+        has_double_stars = any(
+            "**" in line
+            for page_info_check in (rep_114.get("pages") or {}).values()
+            for line in page_info_check.get("tt_lines", [])
+        )
+        # (страница, токен) уже добавленных нарушений 1.1.4
+        marked_114: set[tuple[int, str]] = set()
+
+        for page_idx, page_info in (rep_114.get("pages") or {}).items():
+            p = int(page_idx)
+            tokens = page_info.get("missing_in_tt") or []
+            page = drawing.page(p)
+            tt_rect = drawing.page(p).layout.tt_rect
+            
+            # Если в ТТ есть "**", то отдельный символ "*" не отмечаем как ошибку
+            tokens_to_process = [t for t in tokens if not (has_double_stars and t.strip() == "*")]
+            
+            for token in tokens_to_process:
+                token_text = token.strip()
                 
-                # Если в ТТ есть "**", то отдельный символ "*" не отмечаем как ошибку
-                tokens_to_process = [t for t in tokens if not (has_double_stars and t.strip() == "*")]
+                # Если в ТТ есть "**", то элементы, заканчивающиеся на "**", не отмечаем как ошибку
+                if has_double_stars and token_text.endswith("**"):
+                    continue
                 
-                for token in tokens_to_process:
-                    token_text = token.strip()
-                    
-                    # Если в ТТ есть "**", то элементы, заканчивающиеся на "**", не отмечаем как ошибку
-                    if has_double_stars and token_text.endswith("**"):
+                for r in page.search(token):
+                    if tt_rect and r.intersects(tt_rect):
                         continue
-                    
-                    for r in page.search_for(token) or []:
-                        if tt_rect and r.intersects(tt_rect):
-                            continue
-                        _add_violation(
-                            violations, p, [r.x0, r.y0, r.x1, r.y1],
-                            "1.1.4", f"На поле присутствует '{token}', но в ТТ отсутствует",
-                            {"token": token}
-                        )
+                    _add_violation(
+                        violations, p, [r.x0, r.y0, r.x1, r.y1],
+                        "1.1.4", f"На поле присутствует '{token}', но в ТТ отсутствует",
+                        {"token": token}
+                    )
+                    marked_114.add((p, token))
+            
+            # Дополнительно: если в ТТ есть "**", проверяем, есть ли на поле элементы с одиночной "*",
+            # которые не отмечены в missing_in_tt, но должны быть отмечены как ошибки
+            if has_double_stars:
+                field_lines = page_info.get("field_lines", [])
+                # Ищем элементы, содержащие "*", но не "**" (например, "20*", "40*", "10*")
+                single_star_elements = [line for line in field_lines if "*" in line and "**" not in line and line.count("*") == 1]
                 
-                # Дополнительно: если в ТТ есть "**", проверяем, есть ли на поле элементы с одиночной "*",
-                # которые не отмечены в missing_in_tt, но должны быть отмечены как ошибки
-                if has_double_stars:
-                    field_lines = page_info.get("field_lines", [])
-                    # Ищем элементы, содержащие "*", но не "**" (например, "20*", "40*", "10*")
-                    single_star_elements = [line for line in field_lines if "*" in line and "**" not in line and line.count("*") == 1]
-                    
-                    for element in single_star_elements:
-                        # Проверяем, есть ли уже нарушение для этого элемента
-                        element_exists = any(
-                            v.get("meta", {}).get("token") == element and v["page"] == p and v["criterion"] == "1.1.4"
-                            for v in violations
-                        )
-                        
-                        if not element_exists:
-                            # Ищем bbox для этого элемента на странице
-                            search_results = page.search_for(element) or []
-                            for r in search_results:
-                                if tt_rect and r.intersects(tt_rect):
-                                    continue
-                                _add_violation(
-                                    violations, p, [r.x0, r.y0, r.x1, r.y1],
-                                    "1.1.4", f"На поле присутствует '{element}', но в ТТ отсутствует",
-                                    {"token": element}
-                                )
-        finally:
-            doc.close()
+                for element in single_star_elements:
+                    # Проверяем, есть ли уже нарушение для этого элемента
+                    if (p, element) not in marked_114:
+                        # Ищем bbox для этого элемента на странице
+                        for r in page.search(element):
+                            if tt_rect and r.intersects(tt_rect):
+                                continue
+                            _add_violation(
+                                violations, p, [r.x0, r.y0, r.x1, r.y1],
+                                "1.1.4", f"На поле присутствует '{element}', но в ТТ отсутствует",
+                                {"token": element}
+                            )
+                            marked_114.add((p, element))
     except Exception:
         pass
 
         # --- 1.1.3: на поле обнаружены лишние буквенные обозначения (extra_on_field) — обводим эти буквы ---
     rep_113 = out.get("1.1.3") or {}
-    rep_112 = out.get("1.1.2") or {}
     
     # Для корректной обработки обозначений сечений, нужно проверить все строки на всех страницах
-    all_lines_by_page = extract_lines_with_bbox(pdf_path)
+    all_lines_by_page = extract_lines_with_bbox(drawing)
     
     try:
-        doc = fitz.open(pdf_path)
-        try:
-            # Находим все обозначения сечений во всем документе (например, "А-А", "Б-Б")
-            all_section_letters = set()
-            for page_num, page_lines in all_lines_by_page.items():
-                for line in page_lines:
-                    text = line["text"].strip()
-                    # Проверяем форматы обозначений сечений: "А-А", "Б-Б", "В-В" и т.д.
-                    section_match = re.match(r'^[А-Яа-яA-Za-z]-[А-Яа-яA-Za-z]$', text)
-                    if section_match:
-                        # Извлекаем буквы из обозначения сечения
-                        letters_in_section = re.findall(r'[А-Яа-яA-Za-z]', text)
-                        all_section_letters.update(letters_in_section)
+        # Находим все обозначения сечений во всем документе (например, "А-А", "Б-Б")
+        all_section_letters = set()
+        for page_num, page_lines in all_lines_by_page.items():
+            for line in page_lines:
+                text = line["text"].strip()
+                # Проверяем форматы обозначений сечений: "А-А", "Б-Б", "В-В" и т.д.
+                section_match = SECTION_PAIR_RE.match(text)
+                if section_match:
+                    # Извлекаем буквы из обозначения сечения
+                    letters_in_section = LETTER_RE.findall(text)
+                    all_section_letters.update(letters_in_section)
+        
+        for page_idx, page_info in (rep_113.get("pages") or {}).items():
+            p = int(page_idx)
+            extra_letter_bboxes = page_info.get("extra_letter_bboxes") or []
+            if not extra_letter_bboxes:
+                continue
+
+            page = drawing.page(p).page
+            tt_rect = drawing.page(p).layout.tt_rect
             
-            for page_idx, page_info in (rep_113.get("pages") or {}).items():
-                p = int(page_idx)
-                extra_letter_bboxes = page_info.get("extra_letter_bboxes") or []
-                if not extra_letter_bboxes:
-                    continue
+            # Получаем все строки на текущей странице
+            all_page_lines = all_lines_by_page.get(p, [])
 
-                page = doc[p - 1]
-                tt_rect = _union_tt_bbox(rep_112, p)
+            # используем точные координаты из extra_letter_bboxes
+            for letter_info in extra_letter_bboxes:
+                text = letter_info["text"]
+                bbox = letter_info["bbox"]
                 
-                # Получаем все строки на текущей странице
-                all_page_lines = all_lines_by_page.get(p, [])
-
-                # используем точные координаты из extra_letter_bboxes
-                for letter_info in extra_letter_bboxes:
-                    text = letter_info["text"]
-                    bbox = letter_info["bbox"]
-                    
-                    # Если буква является частью обозначения сечения в документе, 
-                    # не отмечаем её как ошибку
-                    if text in all_section_letters:
-                        continue
-                    
-                    r = fitz.Rect(*bbox)
-                    # исключаем ТТ
-                    if tt_rect and r.intersects(tt_rect):
-                        continue
+                # Если буква является частью обозначения сечения в документе, 
+                # не отмечаем её как ошибку
+                if text in all_section_letters:
+                    continue
+                
+                r = fitz.Rect(*bbox)
+                # исключаем ТТ
+                if tt_rect and r.intersects(tt_rect):
+                    continue
 
-                    _add_violation(
-                        violations, p, [r.x0, r.y0, r.x1, r.y1],
-                        "1.1.3", f"Буква «{text}» присутствует на поле, но в ТТ не используется",
-                        {"letter": text}
-                    )
-        finally:
-            doc.close()
+                _add_violation(
+                    violations, p, [r.x0, r.y0, r.x1, r.y1],
+                    "1.1.3", f"Буква «{text}» присутствует на поле, но в ТТ не используется",
+                    {"letter": text}
+                )
     except Exception:
         pass
 
@@ -336,38 +444,112 @@ def collect_violations(pdf_path: str, out: dict) -> list[dict]:
     # --- 1.1.8: отсутствующие базы в рамках ---
     rep_118 = out.get("1.1.8") or {}
     try:
-        doc = fitz.open(pdf_path)
-        try:
-            for page_idx, page_info in (rep_118.get("pages") or {}).items():
-                p = int(page_idx)
-                missing_bases = page_info.get("missing_bases") or []
-                if not missing_bases:
-                    continue
+        for page_idx, page_info in (rep_118.get("pages") or {}).items():
+            p = int(page_idx)
+            missing_bases = page_info.get("missing_bases") or []
+            if not missing_bases:
+                continue
 
-                page = doc[p - 1]
-                frames_found = page_info.get("frames_found") or []
-                
-                # Для каждой отсутствующей базы ищем соответствующую рамку
-                for base in missing_bases:
-                    # Ищем текст с этой базой в рамках
-                    for frame_text in frames_found:
-                        if base in frame_text:
-                            # Ищем координаты этого текста на странице
-                            search_results = page.search_for(frame_text) or []
-                            for r in search_results:
-                                _add_violation(
-                                    violations, p, [r.x0, r.y0, r.x1, r.y1],
-                                    "1.1.8", f"База «{base}» отсутствует, но используется в рамке «{frame_text}»",
-                                    {"base": base, "frame": frame_text}
-                                )
-        finally:
-            doc.close()
+            page = drawing.page(p)
+            frames_found = page_info.get("frames_found") or []
+            
+            # Для каждой отсутствующей базы ищем соответствующую рамку
+            for base in missing_bases:
+                # Ищем текст с этой базой в рамках
+                for frame_text in frames_found:
+                    if base in frame_text:
+                        # Ищем координаты этого текста на странице
+                        for r in page.search(frame_text):
+                            _add_violation(
+                                violations, p, [r.x0, r.y0, r.x1, r.y1],
+                                "1.1.8", f"База «{base}» отсутствует, но используется в рамке «{frame_text}»",
+                                {"base": base, "frame": frame_text}
+                            )
     except Exception:
         pass
 
     return violations
 
 
+_SEPARATE_CRITS = ("1.1.3", "1.1.8")
+_CLUSTER_CHUNK = 64
+
+
+def _cluster_page(items: List[Dict[str, Any]], iou_threshold: float,
+                  dist_threshold: float) -> List[tuple[List[int], fitz.Rect]]:
+    """
+    Жадная кластеризация нарушений одной страницы: кластер начинается с первого
+    свободного элемента и проходами по возрастанию индекса поглощает элементы,
+    близкие к растущему объединённому прямоугольнику, пока проход что-то добавляет.
+    Кандидаты берутся из сетки (GridIndex): элемент вне расширенного на dist_threshold
+    прямоугольника кластера не проходит ни по IoU, ни по расстоянию, поэтому
+    результат (и порядок элементов) тот же, что у полного перебора.
+    IoU/расстояния считаются пачками по _CLUSTER_CHUNK кандидатов (geometry).
+    """
+    n = len(items)
+    boxes = geometry.as_boxes([it["bbox"] for it in items])
+    grid = GridIndex()
+    for j in range(n):
+        grid.insert(j, boxes[j])
+    margin = max(dist_threshold, 0.0)
+    scan_all = iou_threshold <= 0  # IoU >= 0 выполняется для любых пар
+
+    crit_names = sorted({it["criterion"] for it in items})
+    crit_code = np.array([crit_names.index(it["criterion"]) for it in items], dtype=np.int64)
+    separate = np.array([it["criterion"] in _SEPARATE_CRITS for it in items], dtype=bool)
+    # used: элемент уже в каком-то кластере (в т.ч. в строящемся)
+    used = np.zeros(n, dtype=bool)
+
+    clusters = []
+    for i, v in enumerate(items):
+        if used[i]:
+            continue
+        used[i] = True
+        cluster_box = tuple(float(c) for c in boxes[i])
+        cluster_idx = [i]
+        # Не объединяем 1.1.3 и 1.1.8 в один кластер (сравнивается с первым элементом кластера)
+        v_separate = v["criterion"] in _SEPARATE_CRITS
+        changed = True
+        while changed:
+            changed = False
+            # проход: кандидаты по возрастанию индекса; когда прямоугольник растёт,
+            # к очереди добавляются элементы из новых задетых ячеек с индексом дальше текущего
+            if scan_all:
+                rng, cand = None, np.arange(n)
+            else:
+                rng = grid.cell_range(cluster_box, margin)
+                cand = np.array(sorted(grid.keys_in(rng)), dtype=np.int64)
+            pos = 0
+            while pos < len(cand):
+                chunk = cand[pos:pos + _CLUSTER_CHUNK]
+                chunk = chunk[~used[chunk]]
+                if v_separate and chunk.size:
+                    chunk = chunk[~(separate[chunk] & (crit_code[chunk] != crit_code[i]))]
+                if chunk.size:
+                    ok = geometry.iou(cluster_box, boxes[chunk]) >= iou_threshold
+                    ok |= geometry.rect_distance(cluster_box, boxes[chunk]) < dist_threshold
+                    hits = np.flatnonzero(ok)
+                    if hits.size:
+                        j = int(chunk[hits[0]])
+                        cluster_idx.append(j)
+                        used[j] = True
+                        cluster_box = geometry.include(cluster_box, boxes[j])
+                        changed = True
+                        rest = cand[np.searchsorted(cand, j, side="right"):]
+                        if not scan_all:
+                            new_rng = grid.cell_range(cluster_box, margin)
+                            if new_rng != rng:
+                                fresh = [k for k in grid.keys_in(new_rng, exclude=rng) if k > j]
+                                if fresh:
+                                    rest = np.union1d(rest, np.array(fresh, dtype=np.int64))
+                                rng = new_rng
+                        cand, pos = rest, 0
+                        continue
+                pos += _CLUSTER_CHUNK
+        clusters.append((cluster_idx, fitz.Rect(*cluster_box)))
+    return clusters
+
+
 def merge_violations(violations: List[Dict[str, Any]],
                      iou_threshold: float = 0.30,
                      dist_threshold: float = 8.0) -> List[Dict[str, Any]]:
@@ -382,32 +564,7 @@ def merge_violations(violations: List[Dict[str, Any]],
     merged_all: List[Dict[str, Any]] = []
 
     for page, items in by_page.items():
-        used = [False] * len(items)
-        for i, v in enumerate(items):
-            if used[i]:
-                continue
-            cluster_rect = fitz.Rect(*v["bbox"])
-            cluster_idx = [i]
-            changed = True
-            while changed:
-                changed = False
-                for j, w in enumerate(items):
-                    if used[j] or j in cluster_idx:
-                        continue
-                    r2 = fitz.Rect(*w["bbox"])
-                    # Не объединяем 1.1.3 и 1.1.8 в один кластер
-                    is_113_or_118_v = v["criterion"] in ["1.1.3", "1.1.8"]
-                    is_113_or_118_w = w["criterion"] in ["1.1.3", "1.1.8"]
-                    if is_113_or_118_v and is_113_or_118_w and v["criterion"] != w["criterion"]:
-                        # Это нарушения 1.1.3 и 1.1.8 - не объединяем их
-                        continue
-                    if _iou(cluster_rect, r2) >= iou_threshold or _rect_distance(cluster_rect, r2) < dist_threshold:
-                        cluster_idx.append(j)
-                        cluster_rect = cluster_rect | r2
-                        changed = True
-            for idx in cluster_idx:
-                used[idx] = True
-
+        for cluster_idx, cluster_rect in _cluster_page(items, iou_threshold, dist_threshold):
             # --- внутри кластера собираем элементы и схлопываем дубли ---
             # 1) сначала сгруппируем 1.1.5/1.1.6 по объекту (тексту)
             groups_by_obj: Dict[tuple, List[dict]] = {}
@@ -461,174 +618,54 @@ def merge_violations(violations: List[Dict[str, Any]],
     merged_all.sort(key=lambda x: (x["page"], x["bbox"][1], x["bbox"][0]))
     return merged_all
 
-def make_report_files(pdf_path: str, pipeline_out: dict) -> tuple[Path, Path]:
+
+# 0 — не писать аннотированный PDF при анализе: фронтенд подсвечивает нарушения по violations.json
+WRITE_ANNOTATED_PDF = os.getenv("WRITE_ANNOTATED_PDF", "1").lower() in ("1", "true", "yes")
+
+
+def make_report_files(pdf_path: str, pipeline_out: dict, drawing: DrawingDocument | None = None,
+                      write_annotated: bool | None = None) -> tuple[Path, Path]:
     """
     Делает PDF с обводкой (после объединения) и TXT-реестр (без дублей).
     Номера и пункты выводятся максимально явно.
-    Также создает отдельные PDF отчеты для каждого критерия.
+    Нарушения каждого критерия — отдельный слой того же PDF (вместо отдельных файлов).
+    Объединённые нарушения сохраняются в {stem}.violations.json — из них по запросу
+    строятся PDF отдельных ошибок (artifacts.py).
+    drawing — уже открытый документ из pipeline, чтобы не извлекать текст повторно.
+    write_annotated=False (по умолчанию WRITE_ANNOTATED_PDF) — PDF не пишется, возвращаемый
+    путь к нему — место, где он был бы; подсветку фронтенд берёт из violations.json.
     """
-    base_violations = collect_violations(pdf_path, pipeline_out)
+    base_violations = collect_violations(drawing or pdf_path, pipeline_out)
     merged = merge_violations(base_violations)
 
     src = Path(pdf_path)
     annotated_path = src.with_suffix(".annotated.pdf")
     txt_path = src.with_suffix(".report.txt")
 
-    # --- Создание общего PDF ---
-    doc = fitz.open(pdf_path)
-    try:
-        for num, v in enumerate(merged, start=1):
-            p = v["page"]
-            r = fitz.Rect(*v["bbox"])
-            label = f"No {num}: n." + ", ".join(v["criteria"])
-            page = doc[p - 1]
-            
-            # Используем красный цвет для всех нарушений
-            color = (1, 0, 0)  # Красный
-            
-            # Улучшенная отрисовка с учетом положения на странице
-            # Используем красный цвет и увеличенную толщину линии
-            page.draw_rect(r, color=color, width=3)  # Увеличена толщина линии
-            
-            # Позиционируем текст над прямоугольником, учитывая края страницы
-            text_height = 12  # Высота текста
-            text_rect = page.rect  # Границы страницы
-            
-            # Проверяем, достаточно ли места над прямоугольником для текста
-            if r.y0 - text_height >= 0:
-                # Текст над прямоугольником
-                text_pos = (r.x0, r.y0 - 2)
-            else:
-                # Текст под прямоугольником
-                text_pos = (r.x0, r.y1 + text_height + 2)
-            
-            # Дополнительная проверка: если текст выходит за пределы страницы, сдвигаем его внутрь
-            if text_pos[1] < 0:
-                text_pos = (r.x0, r.y1 + text_height + 2)
-            elif text_pos[1] > text_rect.height:
-                text_pos = (r.x0, r.y0 - 2)
-            
-            # Вставляем текст красного цвета с улучшенным шрифтом
-            page.insert_text(text_pos, label, fontsize=12, color=color, fontname="helv")
-            
-            v["num"] = num
-    finally:
-        doc.save(annotated_path)
-        doc.close()
+    for num, v in enumerate(merged, start=1):
+        v["num"] = num
+        # описания — в порядке пунктов кластера (так они идут и в отчёте, и в violations.json);
+        # уникальность уже обеспечена на этапе merge_violations
+        order = {c: i for i, c in enumerate(v["criteria"])}
+        v["items"].sort(key=lambda it: (order.get(it["criterion"], 999), it["note"]))
 
-    # --- Создание отдельных PDF отчетов для каждого критерия ---
-    for criterion in ["1.1.1", "1.1.2", "1.1.3", "1.1.4", "1.1.5", "1.1.6", "1.1.8"]:
-        # Найдем все нарушения, содержащие данный критерий, с сохранением оригинальной нумерации
-        criterion_violations = []
-        for v in merged:
-            if criterion in v["criteria"]:
-                # Сохраняем оригинальный номер из общего отчета
-                v_with_original_num = v.copy()
-                criterion_violations.append(v_with_original_num)
-        
-        if criterion_violations:  # Создаем файл только если есть нарушения по критерию
-            criterion_pdf_path = src.with_name(f"{src.stem}.{criterion}.pdf")
-            doc = fitz.open(pdf_path)
-            try:
-                for v in criterion_violations:
-                    p = v["page"]
-                    r = fitz.Rect(*v["bbox"])
-                    # Используем оригинальный номер из общего отчета
-                    label = f"No {v['num']:03d}: {criterion}"
-                    page = doc[p - 1]
-                    
-                    # Используем красный цвет для всех критериев
-                    color = (1, 0, 0)  # Красный
-                    
-                    page.draw_rect(r, color=color, width=3)
-                    
-                    # Позиционируем текст над прямоугольником, учитывая края страницы
-                    text_height = 12  # Высота текста
-                    text_rect = page.rect  # Границы страницы
-                    
-                    # Проверяем, достаточно ли места над прямоугольником для текста
-                    if r.y0 - text_height >= 0:
-                        # Текст над прямоугольником
-                        text_pos = (r.x0, r.y0 - 2)
-                    else:
-                        # Текст под прямоугольником
-                        text_pos = (r.x0, r.y1 + text_height + 2)
-                    
-                    # Дополнительная проверка: если текст выходит за пределы страницы, сдвигаем его внутрь
-                    if text_pos[1] < 0:
-                        text_pos = (r.x0, r.y1 + text_height + 2)
-                    elif text_pos[1] > text_rect.height:
-                        text_pos = (r.x0, r.y0 - 2)
-                    
-                    # Вставляем текст с улучшенным шрифтом
-                    page.insert_text(text_pos, label, fontsize=12, color=color, fontname="helv")
-            finally:
-                doc.save(criterion_pdf_path)
-                doc.close()
-
-    # --- Создание отдельных PDF отчетов для каждой конкретной ошибки ---
-    for v in merged:
-        error_num = v["num"]
-        page_num = v["page"]
-        criteria = v["criteria"]
-        
-        # Создаем отдельный PDF для каждой ошибки
-        error_pdf_path = src.with_name(f"{src.stem}.error_{error_num:03d}.pdf")
+    # --- Создание общего PDF: все нарушения + слой на каждый критерий ---
+    # при WRITE_ANNOTATED_PDF=0 PDF строится по запросу из violations.json (artifacts.annotated_pdf)
+    if write_annotated is None:
+        write_annotated = WRITE_ANNOTATED_PDF
+    if write_annotated:
         doc = fitz.open(pdf_path)
         try:
-            p = page_num
-            r = fitz.Rect(*v["bbox"])
-            # Формируем метку с перечислением критериев
-            criteria_str = ", ".join(criteria)
-            label = f"No {error_num:03d}: {criteria_str}"
-            page = doc[p - 1]
-            
-            # Используем красный цвет для всех ошибок
-            color = (1, 0, 0)  # Красный
-            
-            page.draw_rect(r, color=color, width=3)
-            
-            # Позиционируем текст над прямоугольником, учитывая края страницы
-            text_height = 12  # Высота текста
-            text_rect = page.rect  # Границы страницы
-            
-            # Проверяем, достаточно ли места над прямоугольником для текста
-            if r.y0 - text_height >= 0:
-                # Текст над прямоугольником
-                text_pos = (r.x0, r.y0 - 2)
-            else:
-                # Текст под прямоугольником
-                text_pos = (r.x0, r.y1 + text_height + 2)
-            
-            # Дополнительная проверка: если текст выходит за пределы страницы, сдвигаем его внутрь
-            if text_pos[1] < 0:
-                text_pos = (r.x0, r.y1 + text_height + 2)
-            elif text_pos[1] > text_rect.height:
-                text_pos = (r.x0, r.y0 - 2)
-            
-            # Вставляем текст с улучшенным шрифтом
-            page.insert_text(text_pos, label, fontsize=12, color=color, fontname="helv")
+            draw_layered(doc, merged)
         finally:
-            doc.save(error_pdf_path)
+            doc.save(annotated_path)
             doc.close()
 
-    # --- TXT ---
-    lines: List[str] = []
-    lines.append(f"Файл: {src.name}")
-    lines.append(f"Всего нарушений (кластеров): {len(merged)}")
-    lines.append("")
-
-    for v in merged:
-        bbox = v["bbox"]
-        lines.append(f"[#{v['num']:03d}] страница {v['page']}")
-        lines.append(f"  Пункты: " + ",".join(v["criteria"]))
-        lines.append("  Описания:")
-        order = {c: i for i, c in enumerate(v["criteria"])}
-        v["items"].sort(key=lambda it: (order.get(it["criterion"], 999), it["note"]))
-        # уникальность уже обеспечена на этапе merge_violations
-        for it in v["items"]:
-            lines.append(f"   - ({it['criterion']}) {it['note']}")
-        lines.append("")
+    # PDF отдельных ошибок строятся по запросу (artifacts.py) из сохранённого списка нарушений
+    save_violations(src, merged)
+
+    # --- Отчёт: канонический JSON + TXT как его текстовое представление ---
+    lines: List[str] = []  # строки [инфо] / [GLOBAL] после кластеров
 
     # инфо про отсутствия (1.1.4)
     rep_114 = pipeline_out.get("1.1.4") or {}
@@ -668,7 +705,11 @@ def make_report_files(pdf_path: str, pipeline_out: dict) -> tuple[Path, Path]:
             lines.append(f"[инфо] {rule}: {comment}")
 
 
-    Path(txt_path).write_text("\n".join(lines).rstrip() + "\n", encoding="utf-8")
+    report = build_report(src.name, merged, lines)
+    Path(report_json_path(str(txt_path))).write_text(
+        json.dumps(report, ensure_ascii=False, separators=(",", ":")), encoding="utf-8"
+    )
+    Path(txt_path).write_text(render_report_txt(report), encoding="utf-8")
     return annotated_path, txt_path
 # ---------- CLI ----------
 if __name__ == "__main__":
@@ -7,9 +7,17 @@ import dotenv
 import fitz  # PyMuPDF
 from PIL import Image
 import io
+from concurrent.futures import ThreadPoolExecutor
 
 dotenv.load_dotenv()
 
+# Сколько запросов к VLM выполняется одновременно (страницы × критерии)
+VLM_WORKERS = int(os.getenv("VLM_WORKERS", "4"))
+DEFAULT_MODEL = "qwen/qwen2.5-vl-32b-instruct"
+
+# Комментарии check_gost, означающие сбой запроса, а не вердикт модели
+FAILURE_COMMENT_PREFIXES = ("Ошибка API", "Нет ответа от API", "Ошибка при анализе изображения")
+
 # --- Pydantic класс под JSON, остается без изменений ---
 class GostResult(BaseModel):
     ok: bool
@@ -61,7 +69,7 @@ def check_gost(
     gost_rule: GostRuleType, # <-- ИЗМЕНЕНИЕ: принимаем номер правила
     candidate_image: str,
     api_key: str,
-    model: str = "qwen/qwen2.5-vl-32b-instruct",
+    model: str = DEFAULT_MODEL,
 ) -> dict:
     """
     Проверяет чертёж на соответствие указанному правилу ГОСТ.
@@ -123,6 +131,17 @@ def check_gost(
         return {"ok": False, "comment": f"Ошибка API: {str(e)}"}
 
 
+def has_transient_failure(criterion_result: dict | None) -> bool:
+    """True, если хотя бы одна страница не получила ответа модели (результат нельзя кэшировать)."""
+    if not criterion_result:
+        return True
+    for page in (criterion_result.get("pages") or {}).values():
+        comment = ((page or {}).get("result") or {}).get("comment") or ""
+        if comment.startswith(FAILURE_COMMENT_PREFIXES):
+            return True
+    return False
+
+
 def convert_pdf_to_images(pdf_path: str, dpi: int = 150) -> list:
     """
     Конвертирует PDF в список изображений (по одному на страницу).
@@ -154,77 +173,150 @@ def save_image_to_temp_file(image: Image.Image, prefix: str = "temp_page") -> st
         return temp_file.name
 
 
-def check_gost_multi_page(
-    gost_rule: GostRuleType,
-    pdf_path: str,
-    api_key: str,
-    model: str = "qwen/qwen2.5-vl-32b-instruct",
-    dpi: int = 150
-) -> dict:
+def _render_pages_to_temp_files(pdf_path: str, dpi: int, pages: list[int] | None = None) -> dict[int, str]:
     """
-    Проверяет многостраничный PDF на соответствие указанному правилу ГОСТ.
-    Возвращает словарь в формате как в test.py, где если хотя бы на одной странице результат false,
-    то весь результат для критерия будет false.
+    Рендерит страницы PDF во временные PNG (один раз на все критерии).
+    pages — индексы страниц с 0 (None — все). Возвращает {индекс: путь}.
+    """
+    doc = fitz.open(pdf_path)
+    paths = {}
+    try:
+        for page_num in (range(len(doc)) if pages is None else pages):
+            page = doc.load_page(page_num)
+            mat = fitz.Matrix(dpi / 72, dpi / 72)  # 72 - стандартный DPI для PDF
+            img = Image.open(io.BytesIO(page.get_pixmap(matrix=mat).tobytes("png")))
+            paths[page_num] = save_image_to_temp_file(img, f"page_{page_num+1}_")
+    finally:
+        doc.close()
+    return paths
+
+
+def _is_transient(page_result: dict) -> bool:
+    return (page_result.get("comment") or "").startswith(FAILURE_COMMENT_PREFIXES)
+
+
+def _page_digests(pdf_path: str) -> list[str]:
+    from .document import DrawingDocument
+    with DrawingDocument(pdf_path) as drawing:
+        return [page.content_digest for page in drawing]
+
+
+def _collect_page_results(gost_rule: GostRuleType, page_results: list[dict]) -> dict:
+    """
+    Собирает результаты по страницам в формате как в test.py, где если хотя бы на одной
+    странице результат false, то весь результат для критерия будет false.
     """
-    # Конвертируем PDF в изображения
-    images = convert_pdf_to_images(pdf_path, dpi)
-    
     results = {
         "ok": True,  # Начальное значение True
         "comment": f"Критерий {gost_rule} пройден на всех страницах PDF",
-        "pages_count": len(images),
+        "pages_count": len(page_results),
         "pages": {}
     }
-    
+
     all_comments = []
-    
-    for i, img in enumerate(images):
-        # Сохраняем изображение во временный файл
-        temp_img_path = save_image_to_temp_file(img, f"page_{i+1}_")
-        
-        try:
-            # Проверяем страницу
-            page_result = check_gost(gost_rule, temp_img_path, api_key, model)
-            results["pages"][i+1] = {
-                "page_number": i+1,
-                "result": page_result
-            }
-            
-            # Если хотя бы одна страница не прошла проверку, общий результат - False
-            if not page_result["ok"]:
-                results["ok"] = False
-                all_comments.append(f"Стр. {i+1}: {page_result['comment']}")
-                
-        finally:
-            # Удаляем временный файл
-            os.unlink(temp_img_path)
-    
+
+    for i, page_result in enumerate(page_results):
+        results["pages"][i+1] = {
+            "page_number": i+1,
+            "result": page_result
+        }
+
+        # Если хотя бы одна страница не прошла проверку, общий результат - False
+        if not page_result["ok"]:
+            results["ok"] = False
+            all_comments.append(f"Стр. {i+1}: {page_result['comment']}")
+
     # Если были ошибки, формируем общий комментарий
     if not results["ok"]:
         results["comment"] = f"Критерий {gost_rule} не пройден: {', '.join(all_comments)}"
-    
+
     return results
 
 
+def _remove_temp_files(paths):
+    for path in paths:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def _check_criteria(
+    criteria: list[GostRuleType],
+    pdf_path: str,
+    api_key: str,
+    model: str,
+    dpi: int,
+    max_workers: int | None,
+    page_cache=None,
+) -> dict:
+    """
+    Общая часть проверок: страницы рендерятся один раз, запросы (критерий × страница)
+    выполняются параллельно. С page_cache (PageCache) страницы, чьё содержимое уже
+    проверялось, берутся из кэша и не рендерятся; ответы с ошибкой API не кэшируются.
+    """
+    with fitz.open(pdf_path) as doc:
+        n_pages = len(doc)
+    digests = _page_digests(pdf_path) if page_cache is not None else None
+
+    resolved: dict = {criterion: [None] * n_pages for criterion in criteria}
+    if page_cache is not None:
+        for criterion in criteria:
+            for i, digest in enumerate(digests):
+                hit, value = page_cache.get(f"vlm|{criterion}|{model}|{dpi}", digest)
+                if hit:
+                    resolved[criterion][i] = value
+
+    missed = sorted({i for criterion in criteria for i in range(n_pages) if resolved[criterion][i] is None})
+    page_paths = _render_pages_to_temp_files(pdf_path, dpi, missed) if missed else {}
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers or VLM_WORKERS) as executor:
+            futures = {
+                (criterion, i): executor.submit(check_gost, criterion, page_paths[i], api_key, model)
+                for criterion in criteria
+                for i in range(n_pages)
+                if resolved[criterion][i] is None
+            }
+            for (criterion, i), fut in futures.items():
+                page_result = fut.result()
+                resolved[criterion][i] = page_result
+                if page_cache is not None and not _is_transient(page_result):
+                    page_cache.put(f"vlm|{criterion}|{model}|{dpi}", digests[i], page_result)
+    finally:
+        _remove_temp_files(page_paths.values())
+
+    return {criterion: _collect_page_results(criterion, resolved[criterion]) for criterion in criteria}
+
+
+def check_gost_multi_page(
+    gost_rule: GostRuleType,
+    pdf_path: str,
+    api_key: str,
+    model: str = DEFAULT_MODEL,
+    dpi: int = 150,
+    max_workers: int | None = None,
+    page_cache=None,
+) -> dict:
+    """
+    Проверяет многостраничный PDF на соответствие указанному правилу ГОСТ.
+    Страницы отправляются в API параллельно (max_workers запросов одновременно).
+    """
+    return _check_criteria([gost_rule], pdf_path, api_key, model, dpi, max_workers, page_cache)[gost_rule]
+
+
 def check_both_criteria_multi_page(
     pdf_path: str,
     api_key: str,
-    model: str = "qwen/qwen2.5-vl-32b-instruct",
-    dpi: int = 150
+    model: str = DEFAULT_MODEL,
+    dpi: int = 150,
+    max_workers: int | None = None,
+    page_cache=None,
 ) -> dict:
     """
     Проверяет многостраничный PDF по критериям 1.1.7 и 1.1.9.
-    Возвращает словарь в формате как в test.py, где если хотя бы на одной странице результат false,
-    то весь результат для критерия будет false.
+    Страницы рендерятся один раз, запросы (критерий × страница) выполняются параллельно.
     """
-    results = {}
-    
-    for criterion in ["1.1.7", "1.1.9"]:
-        results[criterion] = check_gost_multi_page(
-            criterion, pdf_path, api_key, model, dpi
-        )
-    
-    return results
+    return _check_criteria(["1.1.7", "1.1.9"], pdf_path, api_key, model, dpi, max_workers, page_cache)
 
 
 # === Пример использования ===
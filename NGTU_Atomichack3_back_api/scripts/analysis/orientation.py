@@ -0,0 +1,273 @@
+"""
+Общий этап «ориентация текста» для критериев 1.1.5 и 1.1.6.
+
+Оба критерия оценивают наклон размерных надписей, и раньше каждый сам проходил
+по страницам и по одним и тем же извлечениям. Здесь страница разбирается один раз:
+каждая строка textpage.extractDICT() даёт элемент 1.1.5 (угол по направлению строки),
+каждый её спан — элемент 1.1.6 (угол по матрице спана, иначе по строке);
+слова и аннотации читаются один раз и попадают в оба набора.
+Результат кэшируется в PageTextIndex, поэтому 1.1.5 и 1.1.6 на одном документе
+разделяют одно извлечение, а check() выдаёт отчёты обоих критериев за один проход.
+
+rawdict не используется: у его спанов нет поля "text" (только "chars"),
+и прежние версии критериев не получали из него ни одного элемента.
+"""
+import math
+from collections import defaultdict
+
+from .document import as_drawing, text_index
+from .patterns import DIMENSION_PATTERNS, is_dimension_note  # noqa: F401 — реэкспорт для 1.1.5/1.1.6
+
+# --- Работа с углами ---
+def angle_from_dir(dir_vec):
+    try:
+        dx, dy = dir_vec
+        return math.degrees(math.atan2(dy, dx))
+    except Exception:
+        return None
+
+
+def angle_from_matrix(m):
+    """Угол базовой оси X из матрицы (a,b,c,d, e,f)."""
+    try:
+        a = float(m[0]); b = float(m[1])
+        return math.degrees(math.atan2(b, a))
+    except Exception:
+        return None
+
+
+def tilt_from_horizontal(angle_deg: float) -> float:
+    """Наклон относительно горизонтали (0..90], 0 и 180 считаются 0."""
+    a = angle_deg % 180.0
+    if a > 90.0:
+        a = 180.0 - a
+    return abs(a)
+
+
+# --- Один проход по странице ---
+def _collect_dict(struct, page_rot: float, items_115: list, items_116: list):
+    tag = "text:dict"
+    for block in struct.get("blocks", []):
+        if block.get("type", 0) != 0:
+            continue
+        for line in block.get("lines", []):
+            spans = line.get("spans", []) or []
+            if not spans:
+                continue
+            line_angle = angle_from_dir(line.get("dir")) if "dir" in line else None
+
+            # 1.1.5: строка целиком, угол по направлению строки
+            text = "".join((s.get("text") or "") for s in spans).strip()
+            if text:
+                x0s = [float(s["bbox"][0]) for s in spans]
+                y0s = [float(s["bbox"][1]) for s in spans]
+                x1s = [float(s["bbox"][2]) for s in spans]
+                y1s = [float(s["bbox"][3]) for s in spans]
+                angle = angle_from_dir(line.get("dir", (1.0, 0.0)))
+                items_115.append({
+                    "kind": tag,
+                    "text": text,
+                    "bbox": [round(min(x0s), 2), round(min(y0s), 2), round(max(x1s), 2), round(max(y1s), 2)],
+                    "size": round(max(float(s.get("size", 0)) for s in spans), 2),
+                    "angle_deg": round(angle, 2),
+                    "tilt_deg": round(tilt_from_horizontal(angle), 2),
+                    "is_dimension": is_dimension_note(text),
+                })
+
+            # 1.1.6: каждый спан, угол по матрице спана (если есть) с поправкой на поворот страницы
+            for s in spans:
+                text = (s.get("text") or "").strip()
+                if not text:
+                    continue
+                x0, y0, x1, y1 = map(float, s.get("bbox", [0, 0, 0, 0]))
+                size = float(s.get("size", 0.0) or 0.0)
+                mat = s.get("matrix") or s.get("Matrix") or None  # PyMuPDF версии по-разному именуют
+                span_angle = angle_from_matrix(mat) if mat else None
+                angle = span_angle if span_angle is not None else line_angle
+                if angle is None:
+                    angle = 0.0
+                angle_corr = angle - page_rot
+                items_116.append({
+                    "kind": tag,
+                    "text": text,
+                    "bbox": [round(x0, 2), round(y0, 2), round(x1, 2), round(y1, 2)],
+                    "size": round(size, 2) if size else None,
+                    "raw_angle_deg": round(angle, 2),
+                    "page_rot_deg": page_rot,
+                    "angle_deg": round(angle_corr, 2),
+                    "tilt_deg": round(tilt_from_horizontal(angle_corr), 2),
+                    "is_dimension": is_dimension_note(text),
+                    "source": "span-matrix" if span_angle is not None else ("line-dir" if line_angle is not None else "fallback-0")
+                })
+
+
+def _word_lines(page) -> list[tuple[str, list[float]]]:
+    """Строки, собранные из words по (block, line): (текст, bbox)."""
+    lines = defaultdict(list)
+    for (x0, y0, x1, y1, wtext, b, l, wno) in page.words:
+        lines[(b, l)].append((x0, y0, x1, y1, wtext))
+    out = []
+    for ws in lines.values():
+        ws.sort(key=lambda t: t[0])
+        text = " ".join(w[-1] for w in ws).strip()
+        if not text:
+            continue
+        x0 = min(w[0] for w in ws); y0 = min(w[1] for w in ws)
+        x1 = max(w[2] for w in ws); y1 = max(w[3] for w in ws)
+        out.append((text, [round(x0, 2), round(y0, 2), round(x1, 2), round(y1, 2)]))
+    return out
+
+
+def _annotations(page) -> list[tuple[str, str, list[float], float]]:
+    """Аннотации страницы: (тип, текст, bbox, поворот)."""
+    out = []
+    annot = page.first_annot
+    while annot:
+        try:
+            text = (annot.info.get("content") or "").strip()
+        except Exception:
+            text = ""
+        try:
+            rotation = float(annot.rotation or 0.0)
+        except Exception:
+            rotation = 0.0
+        r = annot.rect
+        out.append((annot.type[1], text, [round(r.x0, 2), round(r.y0, 2), round(r.x1, 2), round(r.y1, 2)], rotation))
+        annot = annot.next
+    return out
+
+
+def _dedup_sorted(items: list, key) -> list:
+    seen = set()
+    uniq = []
+    for it in items:
+        k = key(it)
+        if k in seen:
+            continue
+        seen.add(k)
+        uniq.append(it)
+    uniq.sort(key=lambda it: (it["bbox"][1], it["bbox"][0], it["kind"]))
+    return uniq
+
+
+def _extract(page) -> dict:
+    page_rot = float(page.rotation or 0.0)
+    items_115: list[dict] = []
+    items_116: list[dict] = []
+
+    try:
+        _collect_dict(page.textpage_dict, page_rot, items_115, items_116)
+    except Exception:
+        pass
+
+    try:
+        word_lines = _word_lines(page)
+    except Exception:
+        word_lines = []
+    try:
+        annots = _annotations(page.page)
+    except Exception:
+        annots = []
+
+    # words: наклон не известен, считаем горизонтальными
+    words_115 = []
+    words_116 = []
+    for text, bbox in word_lines:
+        is_dim = is_dimension_note(text)
+        words_115.append({
+            "kind": "text:words", "text": text, "bbox": bbox, "size": None,
+            "angle_deg": 0.0, "tilt_deg": 0.0, "is_dimension": is_dim,
+        })
+        words_116.append({
+            "kind": "text:words", "text": text, "bbox": list(bbox), "size": None,
+            "raw_angle_deg": 0.0, "page_rot_deg": page_rot, "angle_deg": 0.0, "tilt_deg": 0.0,
+            "is_dimension": is_dim, "source": "words-fallback"
+        })
+
+    annots_115 = []
+    annots_116 = []
+    for a_type, text, bbox, rotation in annots:
+        is_dim = is_dimension_note(text)
+        annots_115.append({
+            "kind": f"annot:{a_type}", "text": text, "bbox": bbox, "size": None,
+            "angle_deg": round(rotation, 2), "tilt_deg": round(tilt_from_horizontal(rotation), 2),
+            "is_dimension": is_dim,
+        })
+        annots_116.append({
+            "kind": f"annot:{a_type}", "text": text, "bbox": list(bbox), "size": None,
+            "raw_angle_deg": round(rotation, 2), "page_rot_deg": page_rot,
+            "angle_deg": round(rotation - page_rot, 2),
+            "tilt_deg": round(tilt_from_horizontal(rotation - page_rot), 2),
+            "is_dimension": is_dim, "source": "annotation"
+        })
+
+    # порядок источников и ключи дедупликации — как в прежних extract_items каждого критерия
+    return {
+        "1.1.5": _dedup_sorted(
+            items_115 + words_115 + annots_115,
+            key=lambda it: (it["text"], tuple(it["bbox"])),
+        ),
+        "1.1.6": _dedup_sorted(
+            items_116 + annots_116 + words_116,
+            key=lambda it: (it["text"], tuple(it["bbox"]), it.get("source")),
+        ),
+    }
+
+
+def page_items(page) -> dict:
+    """{"1.1.5": [...], "1.1.6": [...]} — элементы страницы для обоих критериев (кэш на странице)."""
+    page = text_index(page)
+    return page._cached("orientation", lambda: _extract(page))
+
+
+# --- Отчёты критериев ---
+def check_page(items: list[dict], angle_threshold: float, include_all_kinds: bool, verbose: bool,
+               by_source: bool = False) -> dict:
+    """Блок страницы отчёта; by_source — добавить в диагностику счётчики по источнику угла (1.1.6)."""
+    if include_all_kinds:
+        candidates = [it for it in items if it["text"]]
+    else:
+        candidates = [it for it in items if it["is_dimension"]]
+    bad = [it for it in candidates if it["tilt_deg"] > angle_threshold]
+    page_block = {
+        "dimension_items": candidates,
+        "violations": bad,
+        "page_ok": len(bad) == 0
+    }
+    if verbose:
+        diagnostics = {"counts_by_kind": {}}
+        for it in items:
+            diagnostics["counts_by_kind"][it["kind"]] = diagnostics["counts_by_kind"].get(it["kind"], 0) + 1
+        if by_source:
+            sources = {}
+            for it in items:
+                sources[it["source"]] = sources.get(it["source"], 0) + 1
+            diagnostics["counts_by_source"] = sources
+        diagnostics["total_items_seen"] = len(items)
+        page_block["diagnostics"] = diagnostics
+    return page_block
+
+
+def check(pdf_path, angle_threshold: float = 30.0, include_all_kinds=False, verbose=False,
+          criteria=("1.1.5", "1.1.6")) -> dict:
+    """
+    Отчёты 1.1.5 и 1.1.6 за один проход по документу: {"1.1.5": report, "1.1.6": report}.
+    pdf_path — путь к PDF или уже открытый DrawingDocument.
+    """
+    flags = f"{angle_threshold}|{int(bool(include_all_kinds))}|{int(bool(verbose))}"
+    with as_drawing(pdf_path) as drawing:
+        reports = {
+            crit: {"pdf": drawing.path, "threshold_deg": angle_threshold, "pages": {}, "ok": True}
+            for crit in criteria
+        }
+        for page in drawing:
+            for crit in criteria:
+                page_block = drawing.page_result(
+                    page, f"{crit}|{flags}",
+                    lambda p: check_page(page_items(p)[crit], angle_threshold, include_all_kinds, verbose,
+                                         by_source=crit == "1.1.6")
+                )
+                if not page_block["page_ok"]:
+                    reports[crit]["ok"] = False
+                reports[crit]["pages"][page.number] = page_block
+    return reports
@@ -0,0 +1,65 @@
+"""
+Постраничный кэш результатов проверок.
+
+Ключ — (digest содержимого страницы, id критерия с параметрами, соль версии).
+Соль — CHECKER_VERSION + digest конфига: при их изменении старые записи не находятся.
+Между версиями чертежа обычно меняется один лист из многих — остальные листы
+берутся из кэша во всех постраничных критериях и VLM-проверках.
+"""
+import hashlib
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", "data/cache/pages")
+
+
+class PageCache:
+    """Записи — JSON-файлы в root; общий каталог можно делить между воркерами."""
+
+    def __init__(self, root: str, salt: str):
+        self.root = Path(root)
+        self.salt = salt
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def _path(self, criterion: str, digest: str) -> Path:
+        key = hashlib.sha256(f"{self.salt}|{criterion}|{digest}".encode("utf-8")).hexdigest()
+        return self.root / key[:2] / f"{key}.json"
+
+    def _count(self, what: str):
+        with self._lock:
+            self.stats[what] += 1
+
+    def get(self, criterion: str, digest: str):
+        """(True, значение) при попадании, иначе (False, None)."""
+        path = self._path(criterion, digest)
+        try:
+            value = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self._count("misses")
+            return False, None
+        self._count("hits")
+        return True, value
+
+    def put(self, criterion: str, digest: str, value) -> None:
+        path = self._path(criterion, digest)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+            tmp.write_text(json.dumps(value, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError):
+            pass  # кэш — необязательная оптимизация, ошибки записи не роняют анализ
+
+    def get_or_compute(self, page, criterion: str, compute):
+        digest = page.content_digest
+        hit, value = self.get(criterion, digest)
+        if hit:
+            return value
+        value = compute(page)
+        self.put(criterion, digest, value)
+        return value
@@ -0,0 +1,121 @@
+"""
+Регулярные выражения и классификаторы текста, общие для критериев.
+
+Каждое выражение компилируется один раз при импорте. Где раньше строка проверялась
+несколькими регексами подряд (размерные надписи, строки ТТ в 1.1.4, ключевые слова
+основной надписи), здесь один регекс-альтернация: он совпадает ровно тогда, когда
+совпала бы хотя бы одна из веток, поэтому ответы классификаторов не меняются.
+Сверка с прежними поштучными проверками и замеры — `python -m scripts.analysis.bench patterns`.
+"""
+import re
+
+# =========================
+# Размерные надписи (1.1.5 / 1.1.6)
+# =========================
+
+DIMENSION_PATTERNS = [
+    r"[⌀ØO]\s*\d+(?:[.,]\d+)?",
+    r"\bR\s*\d+(?:[.,]\d+)?",
+    r"\bM\s*\d+(?:[×xX]\d+(?:[.,]\d+)?)?",
+    r"\d+\s*±\s*\d+(?:[.,]\d+)?",
+    r"[+−\-]\s*\d+(?:[.,]\d+)?",
+    r"\b\d+(?:[.,]\d+)?\s*мм\b",
+    r"\b\d+(?:[.,]\d+)?\s*mm\b",
+    r"\b\d+(?:[.,]\d+)?\s*°\b",
+    r"\b\d+(?:[.,]\d+)?\b"
+]
+DIMENSION_RE = re.compile("|".join(f"(?:{p})" for p in DIMENSION_PATTERNS), re.IGNORECASE)
+DIGIT_RE = re.compile(r"\d")
+
+
+def is_dimension_note(text: str) -> bool:
+    t = (text or "").strip()
+    if len(t) > 60 or len(t) < 1:
+        return False
+    if not DIGIT_RE.search(t):
+        return False
+    return DIMENSION_RE.search(t) is not None
+
+
+# =========================
+# Строки технических требований
+# =========================
+
+# 1.1.2, 1.1.3: пункт ТТ начинается с номера ("1 ", "2.", "3)")
+TT_NUMBERED_RE = re.compile(r"^\s*\d+\s*[.)-]?\s+")
+# 1.1.3: текст пункта после номера
+TT_ITEM_RE = re.compile(r"^\s*\d+\s*[.)-]?\s*(.*)")
+# 1.1.4: номер + (точка/скобка/дефис и пробел | звёздочки, пробел и текст | пробел и текст),
+# строка из одного номера пунктом не считается
+TT_STAR_LINE_RE = re.compile(
+    r"^\s*\d+\s*[.)-]\s+"
+    r"|^\s*\d+\s*\*{1,3}\s+.+"
+    r"|^(?!\s*\d+\s*$)\s*\d+\s+.+"
+)
+# 1.1.4: *, **, *** после числа или отдельно
+STARS_RE = re.compile(r"\d+\s*(\*{1,3})|(\b\*{1,3}\b)")
+
+
+# =========================
+# Основная надпись (1.1.2)
+# =========================
+
+TB_KEYWORDS = [
+    "Масштаб", "Масса", "Лит", "Разраб", "Пров", "Т.контр", "Н.контр",
+    "Утв", "Лист", "Листов", "Изм.", "№ докум", "Подп.", "Дата"
+]
+# все ключевые слова одним проходом по строке вместо поиска подстроки для каждого
+TB_KEYWORDS_RE = re.compile("|".join(re.escape(k.lower()) for k in TB_KEYWORDS))
+
+
+def has_tb_keyword(low: str) -> bool:
+    """low — строка в нижнем регистре с ё → е."""
+    return TB_KEYWORDS_RE.search(low) is not None
+
+
+# =========================
+# Буквенные обозначения (1.1.3, 1.1.8, collect_violations)
+# =========================
+
+LETTER_RE = re.compile(r"[A-Za-zА-Яа-я]")
+CYR_LETTER_RE = re.compile(r"[А-Яа-я]")
+CYR_LETTER_YO_RE = re.compile(r"[А-Яа-яЁё]")
+# 1.1.8: метка базы — 1–2 буквы
+BASE_TOKEN_RE = re.compile(r"[A-Za-zА-Яа-я]{1,2}")
+# "А-А", "А А", "A-A"
+SECTION_DESIGNATION_RE = re.compile(r"^[А-Яа-яA-Za-z]\s*[-]?\s*[А-Яа-яA-Za-z]$")
+# строго "А-А" (collect_violations)
+SECTION_PAIR_RE = re.compile(r"^[А-Яа-яA-Za-z]-[А-Яа-яA-Za-z]$")
+# обозначение сечения где-либо в строке: "Сечение А-А", "А-А"
+SECTION_IN_TEXT_RE = re.compile(r"(?:[Сс]ечение\s+)?[А-Яа-яA-Za-z]\s*[-]?\s*[А-Яа-яA-Za-z](?:\s+[Сс]ечение)?")
+# обозначения шероховатости (латиница)
+ROUGHNESS_RE = re.compile(r"^(Ra|Rz|Rt)\b", re.IGNORECASE)
+# буква в конце размерной надписи: '⌀20 +0,2 А'
+TRAILING_LETTER_RE = re.compile(r"\s([A-Za-zА-Яа-я])$")
+# "No 1", "No 2: n.1.1.3" — подписи стрелок на размеченном чертеже
+ARROW_RE = re.compile(r"^No\s+\d+", re.IGNORECASE)
+
+# 1.1.3: буквы в тексте пункта ТТ
+SURFACE_RE = re.compile(
+    r"поверхн(?:ость|ности|.)?\.?\s*([A-Za-zА-Яа-я,\s]+?)(?:\s+(?:не\s+|покр|штамп|шлиф|окраш|лакир|фосф|грунт|и\s+т\.д\.|и\s+др\.|и\s+т\.п\.|[,;\.]\s*|$))",
+    re.IGNORECASE,
+)
+SURFACE_ALT_RE = re.compile(
+    r"поверхн(?:ость|ности|.)?\.?\s+([A-Za-zА-Яа-я]+(?:\s*,\s*[A-Za-zА-Яа-я]+)*)", re.IGNORECASE
+)
+TT_LETTER_LIST_RES = [
+    re.compile(r"(?:Размеры|Поверхности|Обозначения|Обозначение)\s+([A-Za-zА-Яа-я]+(?:\s*,\s*[A-Za-zА-Яа-я]+)*)",
+               re.IGNORECASE),
+    # для формата "А, Б в сборке"
+    re.compile(r"([A-Za-zА-Яа-я])\s*,\s*([A-Za-zА-Яа-я](?:\s*,\s*[A-Za-zА-Яа-я])*)\s+(?:в|на|по)\s+\w",
+               re.IGNORECASE),
+]
+LIST_SPLIT_RE = re.compile(r"[,\s]+")
+
+
+# =========================
+# Нормализация названий (1.1.1)
+# =========================
+
+WHITESPACE_RE = re.compile(r"\s+")
+NAME_SPLIT_RE = re.compile(r"[^\w\-]+")
@@ -0,0 +1,138 @@
+"""
+Кэш результатов анализа для побайтно одинаковых PDF.
+
+Ключ — (sha256 файла, digest config.yaml, CHECKER_VERSION, модель VLM).
+В записи хранятся выход pipeline() и все артефакты make_report_files
+(аннотированный PDF, JSON- и TXT-отчёт, список нарушений для просмотров по запросу).
+При попадании артефакты копируются рядом с новым файлом под его именем.
+"""
+import glob
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+from .config_registry import config_digest
+from .main import CHECKER_VERSION
+from .multi_page_gost_checker import DEFAULT_MODEL, has_transient_failure
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "data/cache/results")
+
+# суффиксы артефактов make_report_files относительно stem исходного PDF
+ARTIFACT_PATTERNS = (".annotated.pdf", ".report.json", ".report.txt", ".violations.json")
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_key(content_sha256: str) -> str:
+    raw = f"{content_sha256}:{config_digest()}:{CHECKER_VERSION}:{DEFAULT_MODEL}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _entry_dir(key: str) -> Path:
+    return Path(RESULT_CACHE_DIR) / key[:2] / key
+
+
+def _restore_int_keys(obj):
+    """JSON превращает номера страниц в строки — возвращаем int, как у pipeline()."""
+    if isinstance(obj, dict):
+        return {
+            (int(k) if isinstance(k, str) and k.isdigit() else k): _restore_int_keys(v)
+            for k, v in obj.items()
+        }
+    if isinstance(obj, list):
+        return [_restore_int_keys(v) for v in obj]
+    return obj
+
+
+def _artifact_paths(pdf_path: str) -> list[Path]:
+    src = Path(pdf_path)
+    stem = glob.escape(src.stem)
+    found = []
+    for suffix in ARTIFACT_PATTERNS:
+        found.extend(Path(p) for p in glob.glob(str(src.parent / f"{stem}{suffix}")))
+    return sorted(set(found))
+
+
+def lookup(content_sha256: str) -> dict | None:
+    """Возвращает {"key", "dir", "pipeline_out"} или None."""
+    if not RESULT_CACHE_ENABLED or not content_sha256:
+        return None
+    key = cache_key(content_sha256)
+    entry = _entry_dir(key)
+    meta_path = entry / "pipeline_out.json"
+    if not meta_path.exists():
+        return None
+    try:
+        pipeline_out = json.loads(meta_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return {"key": key, "dir": entry, "pipeline_out": _restore_int_keys(pipeline_out)}
+
+
+def store(content_sha256: str, pdf_path: str, pipeline_out: dict) -> bool:
+    """
+    Сохраняет результат анализа pdf_path. Результаты с временной ошибкой VLM не кэшируются.
+    Запись собирается во временном каталоге и переименовывается целиком, поэтому
+    параллельные воркеры не увидят недописанную запись.
+    """
+    if not RESULT_CACHE_ENABLED or not content_sha256:
+        return False
+    if has_transient_failure(pipeline_out.get("1.1.7")) or has_transient_failure(pipeline_out.get("1.1.9")):
+        return False
+
+    key = cache_key(content_sha256)
+    entry = _entry_dir(key)
+    if entry.exists():
+        return True
+
+    stem = Path(pdf_path).stem
+    tmp = entry.parent / f".{key}.{uuid.uuid4().hex[:8]}.tmp"
+    tmp.mkdir(parents=True, exist_ok=True)
+    try:
+        for art in _artifact_paths(pdf_path):
+            shutil.copyfile(art, tmp / art.name[len(stem) + 1:])
+        (tmp / "pipeline_out.json").write_text(
+            json.dumps(pipeline_out, ensure_ascii=False, default=str), encoding="utf-8"
+        )
+        os.rename(tmp, entry)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return entry.exists()
+    return True
+
+
+def restore(hit: dict, pdf_path: str) -> tuple[Path, Path]:
+    """
+    Копирует артефакты из кэша рядом с pdf_path под его именем.
+    Возвращает (annotated_path, txt_path) — как make_report_files.
+    """
+    src = Path(pdf_path)
+    for cached in sorted(Path(hit["dir"]).iterdir()):
+        if cached.name == "pipeline_out.json":
+            continue
+        dst = src.with_name(f"{src.stem}.{cached.name}")
+        if cached.name == "report.txt":
+            # в отчёте указано имя исходного файла — подставляем текущее
+            lines = cached.read_text(encoding="utf-8").split("\n")
+            for i, ln in enumerate(lines):
+                if ln.startswith("Файл: "):
+                    lines[i] = f"Файл: {src.name}"
+                    break
+            dst.write_text("\n".join(lines), encoding="utf-8")
+        elif cached.name == "report.json":
+            report = json.loads(cached.read_text(encoding="utf-8"))
+            report["file"] = src.name
+            dst.write_text(json.dumps(report, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+        else:
+            shutil.copyfile(cached, dst)
+    return src.with_suffix(".annotated.pdf"), src.with_suffix(".report.txt")
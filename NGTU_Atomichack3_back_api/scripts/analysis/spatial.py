@@ -0,0 +1,106 @@
+"""
+Равномерная сетка для поиска прямоугольников рядом с заданной областью.
+
+Используется при объединении нарушений (merge_violations): вместо перебора всех
+bbox страницы проверяются только те, что лежат в ячейках, задетых областью запроса.
+"""
+import math
+from collections import defaultdict
+
+# ячейка сетки в пунктах PDF: порядка размера типичной надписи на чертеже
+DEFAULT_CELL_SIZE = 64.0
+# прямоугольники, задевающие больше ячеек, хранятся отдельно и возвращаются всегда
+MAX_CELLS_PER_ITEM = 256
+
+
+class GridIndex:
+    def __init__(self, cell_size: float = DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self._cells: dict[tuple[int, int], list[int]] = defaultdict(list)
+        self._always: list[int] = []
+
+    def _cell_range(self, x0: float, y0: float, x1: float, y1: float):
+        if not all(math.isfinite(v) for v in (x0, y0, x1, y1)):
+            return None
+        c = self.cell_size
+        return (
+            math.floor(min(x0, x1) / c), math.floor(min(y0, y1) / c),
+            math.floor(max(x0, x1) / c), math.floor(max(y0, y1) / c),
+        )
+
+    def insert(self, key: int, bbox) -> None:
+        rng = self._cell_range(*bbox)
+        if rng is None or (rng[2] - rng[0] + 1) * (rng[3] - rng[1] + 1) > MAX_CELLS_PER_ITEM:
+            self._always.append(key)
+            return
+        cx0, cy0, cx1, cy1 = rng
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                self._cells[(cx, cy)].append(key)
+
+    def cell_range(self, bbox, margin: float = 0.0):
+        """Диапазон ячеек (cx0, cy0, cx1, cy1), задетых bbox, расширенным на margin; None — bbox не конечен."""
+        x0, y0, x1, y1 = bbox
+        return self._cell_range(x0 - margin, y0 - margin, x1 + margin, y1 + margin)
+
+    def keys_in(self, rng, exclude=None) -> set[int]:
+        """
+        Ключи из ячеек диапазона rng, кроме ячеек диапазона exclude (уже просмотренных).
+        Прямоугольники «вне сетки» возвращаются только при exclude=None.
+        """
+        if rng is None:
+            return self.all_keys()
+        cx0, cy0, cx1, cy1 = rng
+        found = set(self._always) if exclude is None else set()
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self._cells):
+            # диапазон больше заполненной части сетки — проще пройти по занятым ячейкам
+            cells = [
+                (cell, keys) for cell, keys in self._cells.items()
+                if cx0 <= cell[0] <= cx1 and cy0 <= cell[1] <= cy1
+            ]
+        else:
+            cells = [
+                ((cx, cy), self._cells.get((cx, cy)))
+                for cx in range(cx0, cx1 + 1)
+                for cy in range(cy0, cy1 + 1)
+            ]
+        for (cx, cy), keys in cells:
+            if not keys:
+                continue
+            if exclude is not None and exclude[0] <= cx <= exclude[2] and exclude[1] <= cy <= exclude[3]:
+                continue
+            found.update(keys)
+        return found
+
+    def query(self, bbox, margin: float = 0.0) -> set[int]:
+        """
+        Ключи всех прямоугольников, которые могут пересекать bbox, расширенный на margin
+        (с запасом: возвращаются все из задетых ячеек, точную проверку делает вызывающий).
+        """
+        return self.keys_in(self.cell_range(bbox, margin))
+
+    def all_keys(self) -> set[int]:
+        found = set(self._always)
+        for keys in self._cells.values():
+            found.update(keys)
+        return found
+
+
+class PointIndex:
+    """Точки с запросом «есть ли точка не дальше radius» (сетка с ячейкой порядка radius)."""
+
+    def __init__(self, points, cell_size: float = DEFAULT_CELL_SIZE):
+        self.points = [(float(x), float(y)) for x, y in points]
+        self._grid = GridIndex(cell_size)
+        for k, (x, y) in enumerate(self.points):
+            self._grid.insert(k, (x, y, x, y))
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def any_within(self, x: float, y: float, radius: float) -> bool:
+        for k in self._grid.query((x, y, x, y), radius):
+            px, py = self.points[k]
+            if ((x - px) ** 2 + (y - py) ** 2) ** 0.5 <= radius:
+                return True
+        return False
@@ -0,0 +1,166 @@
+"""
+Замеры эндпоинтов API на синтетической истории документа (временная SQLite-база).
+
+Запуск из корня бэкенда:
+    python -m scripts.bench_api result --versions 5 10 20 40 --errors 50 --decisions 20
+    python -m scripts.bench_api history --docs 10 50 200 --versions 3 --page 50
+
+Число SQL-запросов эндпоинта не должно зависеть от объёма истории: если оно растёт
+(вернулся N+1), замер завершается с ошибкой — команду можно запускать как проверку.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from statistics import median
+
+# база — до импорта scripts.db
+_TMP = tempfile.mkdtemp(prefix="bench_api_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP, 'bench.db')}"
+
+from sqlalchemy import event  # noqa: E402
+
+from scripts import crud  # noqa: E402
+from scripts.db import SessionLocal, engine  # noqa: E402
+from scripts.models import Base, Decision, Document, DocumentVersion, Occurrence  # noqa: E402
+
+CRITERIA = ["1.1.1", "1.1.2", "1.1.3", "1.1.4", "1.1.5", "1.1.6", "1.1.7", "1.1.8", "1.1.9"]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.n = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.n += 1
+
+
+def check_constant(name: str, queries: dict):
+    """queries: размер -> число запросов; SystemExit, если оно зависит от размера."""
+    if len(set(queries.values())) > 1:
+        raise SystemExit(f"{name}: число SQL-запросов растёт с объёмом истории (N+1): {queries}")
+
+
+def make_history(db, login: str, n_versions: int, n_errors: int, n_decisions: int, user=None) -> int:
+    """Документ с n_versions версиями: в каждой n_errors срабатываний и n_decisions решений."""
+    user = user or crud.create_user(db, login, "bench")
+    doc = Document(user_id=user.id, filename="bench.pdf", upload_date=datetime(2025, 1, 1), status="rejected")
+    db.add(doc); db.commit()
+    t0 = datetime(2025, 1, 1)
+    for v in range(1, n_versions + 1):
+        ver = DocumentVersion(document_id=doc.id, filename="bench.pdf", upload_date=t0 + timedelta(days=v),
+                              version_number=v, verdict_status="rejected")
+        db.add(ver); db.flush()
+        # половина ошибок переходит из версии в версию (те же occ_id), половина новые
+        occ_ids = []
+        for i in range(n_errors):
+            oid = f"{i:06x}{(v if i % 2 else 0):06x}"
+            occ_ids.append(oid)
+            db.add(Occurrence(version_id=ver.id, position=i, criterion=CRITERIA[i % len(CRITERIA)], occ_id=oid,
+                              cluster_num=i // 3 + 1, page=1, bbox=[0, 0, 10, 10], description=f"ошибка {i}"))
+        for k in range(n_decisions):
+            oid = occ_ids[k % len(occ_ids)] if occ_ids else None
+            db.add(Decision(version_id=ver.id, error_point=CRITERIA[k % len(CRITERIA)] if k % 2 else "",
+                            status="fixed" if k % 3 else "rejected",
+                            author="bench", author_role="developer" if k % 3 else "norm_controller",
+                            comment=f"[occ:{oid}] bench" if oid else "", timestamp=t0 + timedelta(days=v, minutes=k)))
+    db.commit()
+    return doc.id
+
+
+def bench_result(sizes: list[int], n_errors: int, n_decisions: int, repeat: int):
+    from routers.result import get_result
+
+    Base.metadata.create_all(bind=engine)
+    counter = QueryCounter()
+    print(f"/result: {n_errors} срабатываний и {n_decisions} решений на версию")
+    print(f"{'версий':>7} {'запросов':>9} {'мс':>9} {'мс/версию':>10}")
+    by_size = {}
+    for n in sizes:
+        db = SessionLocal()
+        login = f"bench{n}"
+        doc_id = make_history(db, login, n, n_errors, n_decisions)
+        times, queries = [], 0
+        for _ in range(repeat):
+            db.expire_all()
+            counter.n = 0
+            t = time.perf_counter()
+            get_result(doc_id, db=db, current_user=login)
+            times.append(time.perf_counter() - t)
+            queries = counter.n
+        ms = median(times) * 1000
+        print(f"{n:>7} {queries:>9} {ms:>9.1f} {ms / n:>10.2f}")
+        by_size[n] = queries
+        db.close()
+    check_constant("/result", by_size)
+
+
+def bench_history(sizes: list[int], n_versions: int, n_errors: int, page: int, repeat: int):
+    """
+    /history разработчика и нормоконтроллера целиком и страницей (limit=page, summary=true):
+    sizes — число документов у разработчика. У страницы размер ответа не зависит от архива.
+    """
+    from routers.history import get_history
+
+    Base.metadata.create_all(bind=engine)
+    counter = QueryCounter()
+    print(f"/history: {n_versions} версии на документ, {n_errors} срабатываний на версию")
+    print(f"{'документов':>10} {'запрос':>22} {'запросов':>9} {'мс':>9} {'КБ':>9}")
+    by_size = {}
+    for n in sizes:
+        db = SessionLocal()
+        dev = crud.create_user(db, f"dev{n}", "bench")
+        nc = crud.create_user(db, f"nc{n}", "bench", role="norm_controller")
+        for _ in range(n):
+            make_history(db, dev.login, n_versions, n_errors, 2, user=dev)
+        cases = (
+            ("developer", dev.login, {}),
+            ("norm_controller", nc.login, {}),
+            ("norm_controller page", nc.login, {"limit": page, "summary": True}),
+        )
+        for name, login, params in cases:
+            times, queries = [], 0
+            for _ in range(repeat):
+                db.expire_all()
+                counter.n = 0
+                t = time.perf_counter()
+                body = get_history(db=db, current_user=login, **params)
+                times.append(time.perf_counter() - t)
+                queries = counter.n
+            kb = len(json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")) / 1024
+            print(f"{n:>10} {name:>22} {queries:>9} {median(times) * 1000:>9.1f} {kb:>9.1f}")
+            by_size[(n, name)] = queries
+        db.close()
+    for _, name, _ in cases:
+        check_constant(f"/history ({name})", {n: q for (n, r), q in by_size.items() if r == name})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_res = sub.add_parser("result", help="/result: время и число SQL-запросов от длины истории")
+    p_res.add_argument("--versions", type=int, nargs="+", default=[5, 10, 20, 40])
+    p_res.add_argument("--errors", type=int, default=50)
+    p_res.add_argument("--decisions", type=int, default=20)
+    p_res.add_argument("-n", "--repeat", type=int, default=3)
+
+    p_hist = sub.add_parser("history", help="/history: время и число SQL-запросов от числа документов")
+    p_hist.add_argument("--docs", type=int, nargs="+", default=[10, 50, 200])
+    p_hist.add_argument("--versions", type=int, default=3)
+    p_hist.add_argument("--errors", type=int, default=20)
+    p_hist.add_argument("--page", type=int, default=50, help="limit для постраничного запроса")
+    p_hist.add_argument("-n", "--repeat", type=int, default=3)
+
+    args = parser.parse_args(argv)
+    if args.cmd == "result":
+        bench_result(args.versions, args.errors, args.decisions, args.repeat)
+    elif args.cmd == "history":
+        bench_history(args.docs, args.versions, args.errors, args.page, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+Проверки API на синтетических документах (временная SQLite-база и каталог data/).
+
+Запуск из корня бэкенда:
+    python -m scripts.check_api            # все проверки
+    python -m scripts.check_api links      # только перечисленные
+
+Завершается с ошибкой, если хотя бы одна проверка не прошла.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# база и кэши — до импорта приложения
+_TMP = tempfile.mkdtemp(prefix="check_api_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP, 'check.db')}"
+os.environ["ARTIFACT_CACHE_DIR"] = os.path.join(_TMP, "artifacts")
+
+import fitz  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+import app as api  # noqa: E402
+from scripts import crud  # noqa: E402
+from scripts.analysis import artifacts  # noqa: E402
+from scripts.db import SessionLocal  # noqa: E402
+from scripts import jobs, metrics  # noqa: E402
+from scripts.jobs import enqueue_analysis_job  # noqa: E402
+from scripts.models import AnalysisJob, DataMigration, Occurrence  # noqa: E402
+from scripts.parse_report import build_report, render_report_txt, report_json_path  # noqa: E402
+
+CLUSTERS = [
+    {"num": 1, "page": 1, "bbox": [60, 60, 220, 90], "criteria": ["1.1.3"],
+     "items": [{"criterion": "1.1.3", "note": "выноска без стрелки"}]},
+    {"num": 2, "page": 1, "bbox": [60, 300, 220, 330], "criteria": ["1.1.4"],
+     "items": [{"criterion": "1.1.4", "note": "нет обозначения, масштаба"}]},
+]
+
+
+def make_document(db, owner, clusters=CLUSTERS):
+    """Документ с одной проанализированной версией: исходный PDF, violations.json и отчёт."""
+    doc = crud.create_document(db, owner.id, "check.pdf", datetime(2025, 1, 1))
+    ver = crud.list_versions_for_document(db, doc.id)[0]   # create_document создаёт первую версию
+    base = os.path.join("data", "original", str(doc.id), f"v{ver.version_number}")
+    os.makedirs(base, exist_ok=True)
+    src = os.path.join(base, "check.pdf")
+    pdf = fitz.open()
+    pdf.new_page().insert_text((72, 72), "check")
+    pdf.save(src)
+    artifacts.draw_layered(pdf, clusters)   # как make_report_files: слой на каждый критерий
+    pdf.save(os.path.join(base, "check.annotated.pdf"))
+    pdf.close()
+    artifacts.save_violations(src, clusters)
+    report = build_report("check.pdf", clusters, [])
+    txt = os.path.join(base, "check.report.txt")
+    with open(report_json_path(txt), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False)
+    with open(txt, "w", encoding="utf-8") as f:
+        f.write(render_report_txt(report))
+    crud.update_version_analysis(db, ver.id, os.path.join(base, "check.annotated.pdf"), txt)
+    return doc, ver
+
+
+def auth(login: str) -> dict:
+    return {"Authorization": "Bearer " + crud.create_access_token({"sub": login})}
+
+
+def expect(cond: bool, message: str):
+    if not cond:
+        raise AssertionError(message)
+
+
+def check_links(client, db):
+    """Ссылки на PDF ошибок из /result и /requirements-stats открываются без заголовка, в т.ч. нормоконтроллером."""
+    dev = crud.create_user(db, "links_dev", "check")
+    nc = crud.create_user(db, "links_nc", "check", role="norm_controller")
+    other = crud.create_user(db, "links_other", "check")
+    doc, ver = make_document(db, dev)
+    occ = crud.list_version_occurrences(db, ver.id)[0]
+    crud.add_decision(db, ver.id, occ.criterion, "rejected", "NC", "norm_controller",
+                      f"[occ:{occ.occ_id}] не исправлено", datetime(2025, 1, 2))
+
+    r = client.get(f"/result/{doc.id}", headers=auth(nc.login))
+    expect(r.status_code == 200, f"/result для нормоконтроллера: {r.status_code}")
+    link = r.json()["decisions"][0]["file_fix_url_annotated"]
+    expect("/error/" in link and "token=" in link, f"ссылка решения: {link!r}")
+    r = client.get(link)
+    expect(r.status_code == 200 and r.headers["content-type"] == "application/pdf",
+           f"ссылка решения без заголовка: {r.status_code}")
+
+    stats = client.get("/requirements-stats", headers=auth(nc.login)).json()
+    link = stats["violationDocuments"][0]["violationDetails"]["pdfAnnotationUrl"]
+    expect(client.get(link).status_code == 200, "pdfAnnotationUrl без заголовка")
+    expect(client.get(link.split("?")[0] + "/png", headers=auth(nc.login)).status_code == 200,
+           "PNG ошибки для нормоконтроллера")
+
+    # токен ссылки действует только для своего пути и не заменяет JWT сессии
+    token = link.split("token=")[1]
+    expect(client.get(f"/download_annotated/{doc.id}/error/2?token={token}").status_code == 401,
+           "токен ссылки принят для другого пути")
+    expect(client.get("/history", headers={"Authorization": "Bearer " + token}).status_code == 401,
+           "токен ссылки принят как JWT сессии")
+    expect(client.get(f"/download_annotated/{doc.id}/error/1", headers=auth(other.login)).status_code == 404,
+           "чужой разработчик открыл PDF ошибки")
+
+
+def check_jobs(client, db):
+    """
+    ANALYSIS_WORKER_MODE=inline: задачи, оставшиеся от прошлого запуска API, подбираются при старте;
+    исчерпавшие попытки показываются в /result и /history как processing_status "error".
+    """
+    user = crud.create_user(db, "jobs_dev", "check")
+    stale_doc = crud.create_document(db, user.id, "stale.pdf", datetime(2025, 1, 1))
+    queued_doc = crud.create_document(db, user.id, "queued.pdf", datetime(2025, 1, 1))
+    # прерванная задача с истёкшей арендой и последней попыткой
+    stale = enqueue_analysis_job(db, crud.list_versions_for_document(db, stale_doc.id)[0].id, "missing/stale.pdf")
+    stale.status, stale.attempts, stale.max_attempts = "running", 1, 1
+    stale.lease_owner, stale.lease_expires_at = "gone:1:000000", datetime.utcnow() - timedelta(seconds=1)
+    # задача в очереди, которую прошлый запуск не успел начать (файла нет — анализ упадёт)
+    queued = enqueue_analysis_job(db, crud.list_versions_for_document(db, queued_doc.id)[0].id, "missing/queued.pdf")
+    queued.max_attempts = 1
+    db.commit()
+
+    with TestClient(api.app) as started:   # lifespan: start_inline_recovery
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            db.expire_all()
+            if {j.status for j in db.query(AnalysisJob).filter(AnalysisJob.id.in_([stale.id, queued.id]))} == {"failed"}:
+                break
+            time.sleep(0.5)
+        statuses = {j.id: j.status for j in db.query(AnalysisJob).filter(AnalysisJob.id.in_([stale.id, queued.id]))}
+        expect(set(statuses.values()) == {"failed"}, f"задачи после старта API: {statuses}")
+
+        for doc in (stale_doc, queued_doc):
+            r = started.get(f"/result/{doc.id}", headers=auth(user.login)).json()
+            expect(r["processing_status"] == "error", f"/result {doc.filename}: {r['processing_status']}")
+        history = {h["id"]: h for h in started.get("/history", headers=auth(user.login)).json()}
+        for doc in (stale_doc, queued_doc):
+            item = history[doc.id]
+            expect(item["processing_status"] == "error" and item["versions"][0]["processing_status"] == "error",
+                   f"/history {doc.filename}: {item['processing_status']}")
+
+
+def check_lease(client, db):
+    """Потеряв аренду, воркер не пишет результат анализа в версию и не отмечает задачу done."""
+    user = crud.create_user(db, "lease_dev", "check")
+    _, ver = make_document(db, user)
+    saved = jobs.run_analysis, jobs.update_version_analysis, jobs.JOB_LEASE_SECONDS
+    updated = []
+
+    def steal(job_id):
+        db.query(AnalysisJob).filter(AnalysisJob.id == job_id).update(
+            {AnalysisJob.lease_owner: "thief:1:000000"}, synchronize_session=False)
+        db.commit()
+
+    try:
+        jobs.update_version_analysis = lambda *a, **kw: updated.append(a)
+        jobs.JOB_LEASE_SECONDS = 3   # heartbeat раз в секунду
+        for name, analysis in [
+            # аренду перехватили, запись в БД — через check_lease перед update_version_analysis
+            ("перед записью", lambda job_id: lambda *a, check_lease=None: (steal(job_id), check_lease(),
+                                                                        jobs.update_version_analysis(*a))),
+            # аренду перехватили посреди анализа — её теряет heartbeat, анализ доходит до конца сам
+            ("во время анализа", lambda job_id: lambda *a, check_lease=None: (steal(job_id), time.sleep(1.5))),
+        ]:
+            job = enqueue_analysis_job(db, ver.id, "check.pdf")
+            jobs.run_analysis = analysis(job.id)
+            ok = jobs.run_next_job("lease:1:000000", job.id)
+            db.expire_all()
+            job = db.query(AnalysisJob).filter(AnalysisJob.id == job.id).first()
+            expect(ok and job.status == "running" and job.lease_owner == "thief:1:000000",
+                   f"{name}: задача {job.status}, аренда {job.lease_owner}")
+            expect(not updated, f"{name}: update_version_analysis вызван после потери аренды")
+    finally:
+        jobs.run_analysis, jobs.update_version_analysis, jobs.JOB_LEASE_SECONDS = saved
+
+
+def check_inline_slots(client, db):
+    """Режим inline: без свободного слота INLINE_SLOTS задача не выполняется, а остаётся в очереди."""
+    user = crud.create_user(db, "slots_dev", "check")
+    doc = crud.create_document(db, user.id, "slots.pdf", datetime(2025, 1, 1))
+    job = enqueue_analysis_job(db, crud.list_versions_for_document(db, doc.id)[0].id, "missing/slots.pdf")
+    job.max_attempts = 1
+    db.commit()
+
+    held = 0
+    while jobs.INLINE_SLOTS.acquire(blocking=False):
+        held += 1
+    try:
+        jobs.run_job_inline(job.id)
+        db.expire_all()
+        expect(held == max(1, jobs.WORKER_CONCURRENCY), f"слотов {held}, WORKER_CONCURRENCY={jobs.WORKER_CONCURRENCY}")
+        expect(job.status == "queued" and not job.attempts, f"без слота: {job.status}, попыток {job.attempts}")
+    finally:
+        for _ in range(held):
+            jobs.INLINE_SLOTS.release()
+    jobs.run_job_inline(job.id)   # слот есть — задача выполняется (файла нет, единственная попытка)
+    db.expire_all()
+    expect(job.status == "failed" and job.attempts == 1, f"со слотом: {job.status}, попыток {job.attempts}")
+
+
+def check_history_status(client, db):
+    """Фильтр /history?status= совпадает со статусом, который показывает сам ответ."""
+    user = crud.create_user(db, "status_dev", "check")
+    # анализ завершён, вердикта нет (verdict_status="processing"): статус — по срабатываниям
+    for clusters in (CLUSTERS, []):
+        _, ver = make_document(db, user, clusters)
+        ver.verdict_status = "processing"
+    db.commit()
+    crud.create_document(db, user.id, "new.pdf", datetime(2025, 1, 1))   # анализ не завершён
+    full = client.get("/history", headers=auth(user.login)).json()
+    expect(sorted(h["status"] for h in full) == ["", "approved", "rejected"], f"статусы: {[h['status'] for h in full]}")
+    for status in ("approved", "rejected", "removed", "processing"):
+        page = client.get("/history", params={"status": status, "limit": 10}, headers=auth(user.login)).json()
+        expected = [h["id"] for h in full if (h["status"] or "processing") == status]
+        expect([h["id"] for h in page["items"]] == expected, f"status={status}: {page['items']}")
+
+
+def check_backfill(client, db):
+    """Версии без строк в occurrences индексируются при старте API один раз, в т.ч. отчёты без нарушений."""
+    user = crud.create_user(db, "backfill_dev", "check")
+    _, dirty = make_document(db, user)
+    _, clean = make_document(db, user, clusters=[])
+    # как до таблицы occurrences
+    db.query(Occurrence).filter(Occurrence.version_id.in_([dirty.id, clean.id])).delete(synchronize_session=False)
+    db.query(DataMigration).delete()
+    db.commit()
+
+    indexed = []
+    index = crud.index_version_occurrences
+    crud.index_version_occurrences = lambda db_, ver: indexed.append(ver.id) or index(db_, ver)
+    try:
+        with TestClient(api.app):
+            pass
+        expect(dirty.id in indexed and clean.id in indexed, f"первый старт проиндексировал {indexed}")
+        expect(len(crud.list_version_occurrences(db, dirty.id)) == len(CLUSTERS), "срабатывания не восстановлены")
+        indexed.clear()
+        with TestClient(api.app):
+            pass
+        expect(not indexed, f"повторный старт снова читает отчёты: {indexed}")
+    finally:
+        crud.index_version_occurrences = index
+
+
+def check_metrics(client, db):
+    """/metrics читается без JWT пользователя: по METRICS_TOKEN, без него — только с localhost."""
+    from routers import metrics as metrics_router
+
+    saved = metrics_router.METRICS_TOKEN
+    try:
+        metrics_router.METRICS_TOKEN = "scrape-secret"
+        r = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+        expect(r.status_code == 200 and "analysis_result_cache_hits_total" in r.text, f"со статическим токеном: {r.status_code}")
+        expect(client.get("/metrics").status_code == 401, "без токена")
+        expect(client.get("/metrics", headers=auth("metrics_user")).status_code == 401, "JWT пользователя вместо токена")
+
+        metrics_router.METRICS_TOKEN = ""
+        expect(client.get("/metrics").status_code == 403, "без METRICS_TOKEN — не с localhost")
+        local = TestClient(api.app, client=("127.0.0.1", 50000))
+        expect(local.get("/metrics").status_code == 200, "без METRICS_TOKEN — с localhost")
+    finally:
+        metrics_router.METRICS_TOKEN = saved
+
+    # счётчик на пути анализа: ошибка БД не должна ронять анализ
+    def locked():
+        raise OperationalError("UPDATE metric_counters", {}, Exception("database is locked"))
+
+    saved_session = metrics.SessionLocal
+    metrics.SessionLocal = locked
+    try:
+        metrics.incr_safe(metrics.RESULT_CACHE_HITS)
+    except Exception as e:
+        raise AssertionError(f"incr_safe пробросил {e!r}")
+    finally:
+        metrics.SessionLocal = saved_session
+
+
+def check_layers(client, db):
+    """final_pdf_url в /result открывает аннотированный PDF, где по умолчанию включён только слой пункта."""
+    dev = crud.create_user(db, "layers_dev", "check")
+    nc = crud.create_user(db, "layers_nc", "check", role="norm_controller")
+    doc, _ = make_document(db, dev)
+    points = client.get(f"/result/{doc.id}", headers=auth(nc.login)).json()["error_points"]
+    link = next(p["final_pdf_url"] for p in points if p["point"] == "1.1.3")
+    expect("#" not in link and "layer=1.1.3" in link, f"final_pdf_url: {link!r}")
+    r = client.get(link)
+    expect(r.status_code == 200 and r.headers["content-type"] == "application/pdf", f"final_pdf_url: {r.status_code}")
+    pdf = fitz.open(stream=r.content, filetype="pdf")
+    try:
+        text = pdf[0].get_text()
+    finally:
+        pdf.close()
+    expect("No 001: 1.1.3" in text and "1.1.4" not in text and "n.1.1.3" not in text,
+           f"видимые подписи: {text.split()}")
+
+
+CHECKS = {
+    "links": check_links,
+    "jobs": check_jobs,
+    "lease": check_lease,
+    "inline_slots": check_inline_slots,
+    "history_status": check_history_status,
+    "backfill": check_backfill,
+    "metrics": check_metrics,
+    "layers": check_layers,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("checks", nargs="*", help=f"по умолчанию — все: {', '.join(CHECKS)}")
+    args = parser.parse_args(argv)
+    unknown = set(args.checks) - set(CHECKS)
+    if unknown:
+        parser.error(f"неизвестные проверки: {', '.join(sorted(unknown))}")
+
+    os.chdir(_TMP)
+    client = TestClient(api.app)
+    failed = []
+    for name in args.checks or list(CHECKS):
+        db = SessionLocal()
+        try:
+            CHECKS[name](client, db)
+            print(f"ok      {name}")
+        except AssertionError as e:
+            print(f"FAILED  {name}: {e}")
+            failed.append(name)
+        finally:
+            db.close()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,19 @@ from dotenv import load_dotenv
 from jose import jwt
 from datetime import datetime, timedelta, timezone
 from sqlalchemy.orm import Session
-from .models import User, Document, DocumentVersion, Decision
+from .models import User, Document, DocumentVersion, Decision, Occurrence, DataMigration
 import hashlib
 from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 import shutil
-from .parse_report import parse_report
+from .parse_report import report_json_path, report_occurrences, report_result
 
 load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 9999
+# ссылки на файлы, которые фронтенд открывает через window.open (без заголовка Authorization)
+LINK_TOKEN_EXPIRE_MINUTES = int(os.getenv("LINK_TOKEN_EXPIRE_MINUTES", "60"))
 
 def get_password_hash(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
@@ -60,6 +63,18 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def sign_link(url: str, login: str) -> str:
+    """
+    Ссылка на маршрут API с ?token= — короткоживущим JWT, действующим только для этого пути
+    (scope "link"); такую ссылку можно открыть в новой вкладке. Пути к файлам на диске — как есть.
+    """
+    if not url or not url.startswith("/"):
+        return url
+    path = url.split("?", 1)[0]
+    token = create_access_token({"sub": login, "scope": "link", "path": path},
+                                timedelta(minutes=LINK_TOKEN_EXPIRE_MINUTES))
+    return f"{url}{'&' if '?' in url else '?'}token={token}"
+
 def create_document(db: Session, user_id: int, filename: str, upload_date: datetime):
     doc = Document(user_id=user_id, filename=filename, upload_date=upload_date, status="processing")
     db.add(doc); db.commit(); db.refresh(doc)
@@ -123,6 +138,18 @@ def update_version_analysis(db: Session, version_id: int, ann_pdf_path: str, rep
     except Exception:
         if report_path and os.path.exists(report_path):
             shutil.copyfile(report_path, final_rep)
+    # канонический JSON-отчёт лежит рядом с TXT
+    if report_path:
+        rep_json, final_rep_json = report_json_path(report_path), report_json_path(final_rep)
+        if os.path.exists(rep_json) and os.path.abspath(rep_json) != os.path.abspath(final_rep_json):
+            shutil.move(rep_json, final_rep_json)
+
+    # список нарушений (для PDF по критериям/ошибкам по запросу) лежит рядом с аннотированным PDF
+    if ann_pdf_path and ann_pdf_path.endswith(".annotated.pdf"):
+        viol_path = ann_pdf_path[:-len(".annotated.pdf")] + ".violations.json"
+        final_viol = final_ann[:-len(".annotated.pdf")] + ".violations.json"
+        if os.path.exists(viol_path) and os.path.abspath(viol_path) != os.path.abspath(final_viol):
+            shutil.move(viol_path, final_viol)
 
     ver.ann_pdf_path = final_ann
     ver.report_path = final_rep
@@ -134,12 +161,11 @@ def update_version_analysis(db: Session, version_id: int, ann_pdf_path: str, rep
     doc.description = ver.report_path
     db.commit()
 
-    # ---- парсим текущий отчёт ----
+    # ---- срабатывания текущего отчёта → таблица occurrences ----
+    index_version_occurrences(db, ver)
     error_counts, total_violations, occ_map = {}, 0, {}
     if ver.report_path and os.path.exists(ver.report_path):
-        with open(ver.report_path, "r", encoding="utf-8") as f:
-            rc = f.read()
-        parsed = parse_report(rc, doc_id=doc.id)
+        parsed = version_report(db, ver, doc_id=doc.id)
         error_counts = parsed.get("error_counts", {}) or {}
         total_violations = int(parsed.get("total_violations", 0) or 0)
         for occ in parsed.get("occurrences", []) or []:
@@ -200,16 +226,7 @@ def update_version_analysis(db: Session, version_id: int, ann_pdf_path: str, rep
         if not occ_prev:
             return None
         if dec.version_id not in version_occ_cache:
-            vprev = db.query(DocumentVersion).filter(DocumentVersion.id == dec.version_id).first()
-            mp = {}
-            if vprev and vprev.report_path and os.path.exists(vprev.report_path):
-                with open(vprev.report_path, "r", encoding="utf-8") as f2:
-                    rc2 = f2.read()
-                parsed_prev = parse_report(rc2, doc_id=doc.id)
-                for o in parsed_prev.get("occurrences", []) or []:
-                    if o.get("id") and o.get("point"):
-                        mp[o["id"]] = o["point"]
-            version_occ_cache[dec.version_id] = mp
+            version_occ_cache[dec.version_id] = version_occ_points(db, dec.version_id)
         return version_occ_cache[dec.version_id].get(occ_prev)
 
     # ---- главная проверка: текущие + исторические fixed против текущего отчёта ----
@@ -317,6 +334,15 @@ def list_versions_for_document(db: Session, document_id: int):
              .order_by(DocumentVersion.version_number.desc(), DocumentVersion.upload_date.desc()) \
              .all()
 
+def list_versions_with_decisions(db: Session, document_id: int):
+    """Как list_versions_for_document, но решения всех версий загружены сразу (ver.decisions)."""
+    from sqlalchemy.orm import selectinload
+    return db.query(DocumentVersion) \
+             .options(selectinload(DocumentVersion.decisions)) \
+             .filter(DocumentVersion.document_id == document_id) \
+             .order_by(DocumentVersion.version_number.desc(), DocumentVersion.upload_date.desc()) \
+             .all()
+
 def list_all_documents(db: Session):
     from .models import Document
     return db.query(Document).all()
@@ -330,6 +356,113 @@ def get_document(db: Session, doc_id: int):
 def get_version(db: Session, version_id: int):
     return db.query(DocumentVersion).filter(DocumentVersion.id == version_id).first()
 
+# ---------- срабатывания (таблица occurrences) ----------
+def index_version_occurrences(db: Session, ver: DocumentVersion) -> int:
+    """
+    Переписывает срабатывания версии по её отчёту (report.json, для старых версий — TXT).
+    Страница и bbox — из violations.json по номеру кластера, если он сохранён.
+    """
+    from .analysis.artifacts import load_violations, version_source_pdf
+
+    db.query(Occurrence).filter(Occurrence.version_id == ver.id).delete(synchronize_session=False)
+    clusters = {}
+    if ver.ann_pdf_path:
+        for v in load_violations(version_source_pdf(ver)) or []:
+            clusters[v.get("num")] = v
+    rows = []
+    for pos, (pt, desc, oid, error_num) in enumerate(report_occurrences(ver.report_path)):
+        num = int(error_num) if error_num else None
+        cl = clusters.get(num) or {}
+        rows.append(Occurrence(
+            version_id=ver.id, position=pos, criterion=pt, occ_id=oid, cluster_num=num,
+            page=cl.get("page"), bbox=cl.get("bbox"), description=desc,
+        ))
+    db.add_all(rows)
+    db.commit()
+    return len(rows)
+
+OCCURRENCES_BACKFILL = "occurrences_backfill"
+
+def backfill_occurrences(db: Session) -> int:
+    """
+    Однократно индексирует версии с отчётом, проанализированные до таблицы occurrences.
+    Выполнение отмечается в data_migrations, поэтому следующие запуски не перечитывают
+    отчёты (в том числе без нарушений, у которых строк в occurrences нет).
+    """
+    if db.get(DataMigration, OCCURRENCES_BACKFILL):
+        return 0
+    indexed = db.query(Occurrence.version_id).distinct()
+    pending = db.query(DocumentVersion).filter(
+        DocumentVersion.report_path.isnot(None),
+        DocumentVersion.id.notin_(indexed),
+    ).all()
+    n = 0
+    for ver in pending:
+        if os.path.exists(ver.report_path):
+            index_version_occurrences(db, ver)
+            n += 1
+    try:
+        db.add(DataMigration(name=OCCURRENCES_BACKFILL, done_at=datetime.utcnow()))
+        db.commit()
+    except IntegrityError:
+        db.rollback()   # параллельно запущенный процесс API уже отметил
+    return n
+
+def list_version_occurrences(db: Session, version_id: int):
+    return db.query(Occurrence).filter(Occurrence.version_id == version_id).order_by(Occurrence.position).all()
+
+def occurrence_error_num(occ: Occurrence) -> str | None:
+    """Номер ошибки в виде, как в отчёте: [#013] → "013"."""
+    return f"{occ.cluster_num:03d}" if occ.cluster_num is not None else None
+
+def version_report(db: Session, ver: DocumentVersion, doc_id: int = None, full_report: str = "") -> dict:
+    """То же, что load_report(ver.report_path), но из таблицы occurrences (full_report — по запросу)."""
+    occs = list_version_occurrences(db, ver.id) if ver else []
+    return report_result(
+        [(o.criterion, o.description, o.occ_id, occurrence_error_num(o)) for o in occs],
+        full_report, doc_id,
+    )
+
+def version_reports(db: Session, versions) -> dict:
+    """
+    version_id -> version_report(...) для нескольких версий (в т.ч. разных документов)
+    одним запросом; full_report пустой.
+    """
+    by_version = {v.id: [] for v in versions}
+    if by_version:
+        occs = db.query(Occurrence).filter(Occurrence.version_id.in_(list(by_version))) \
+                 .order_by(Occurrence.version_id, Occurrence.position).all()
+        for o in occs:
+            by_version[o.version_id].append((o.criterion, o.description, o.occ_id, occurrence_error_num(o)))
+    return {v.id: report_result(by_version[v.id], "", v.document_id) for v in versions}
+
+def version_violation_counts(db: Session, version_ids) -> dict:
+    """version_id -> число срабатываний (один GROUP BY); версий без срабатываний в ответе нет."""
+    if not version_ids:
+        return {}
+    rows = db.query(Occurrence.version_id, func.count(Occurrence.id)) \
+             .filter(Occurrence.version_id.in_(list(version_ids))) \
+             .group_by(Occurrence.version_id).all()
+    return {vid: n for vid, n in rows}
+
+def list_versions_for_documents(db: Session, document_ids) -> dict:
+    """document_id -> версии (порядок как у list_versions_for_document) одним запросом."""
+    by_doc = {doc_id: [] for doc_id in document_ids}
+    if by_doc:
+        rows = db.query(DocumentVersion) \
+                 .filter(DocumentVersion.document_id.in_(list(by_doc))) \
+                 .order_by(DocumentVersion.document_id,
+                           DocumentVersion.version_number.desc(), DocumentVersion.upload_date.desc()) \
+                 .all()
+        for v in rows:
+            by_doc[v.document_id].append(v)
+    return by_doc
+
+def version_occ_points(db: Session, version_id: int) -> dict:
+    """occ_id -> пункт для срабатываний версии."""
+    rows = db.query(Occurrence.occ_id, Occurrence.criterion).filter(Occurrence.version_id == version_id).all()
+    return {oid: pt for oid, pt in rows}
+
 # --- Back-compat для analysis (ВАЖНО: поправить авторов) ---
 def update_document_analysis(db: Session, doc_id: int, ann_pdf_path: str, description: str):
     """
@@ -340,7 +473,7 @@ def update_document_analysis(db: Session, doc_id: int, ann_pdf_path: str, descri
     """
     import os, re, shutil
     from datetime import datetime as datetime
-    from .parse_report import parse_report
+    from .parse_report import report_json_path
     from .models import Decision, Document, DocumentVersion  # локальные модели
 
     # ---------- helpers ----------
@@ -352,16 +485,7 @@ def update_document_analysis(db: Session, doc_id: int, ann_pdf_path: str, descri
 
     def _map_occ_to_point_from_version(vobj: DocumentVersion) -> dict:
         """Построить карту occ_id -> point из отчёта конкретной версии."""
-        mp = {}
-        rp = getattr(vobj, "report_path", None)
-        if rp and os.path.exists(rp):
-            with open(rp, "r", encoding="utf-8") as f2:
-                rc2 = f2.read()
-            parsed_prev = parse_report(rc2, doc_id=doc_id)
-            for o in parsed_prev.get("occurrences", []) or []:
-                if o.get("id") and o.get("point"):
-                    mp[o["id"]] = o["point"]
-        return mp
+        return version_occ_points(db, vobj.id)
 
     # ---------- документ и целевая версия ----------
     doc = db.query(Document).filter(Document.id == doc_id).first()
@@ -406,6 +530,10 @@ def update_document_analysis(db: Session, doc_id: int, ann_pdf_path: str, descri
     except Exception:
         if report_input_path and os.path.exists(report_input_path):
             shutil.copyfile(report_input_path, final_rep)
+    if report_input_path:
+        rep_json, final_rep_json = report_json_path(report_input_path), report_json_path(final_rep)
+        if os.path.exists(rep_json) and os.path.abspath(rep_json) != os.path.abspath(final_rep_json):
+            shutil.move(rep_json, final_rep_json)
 
     # фиксируем пути и момент завершения анализа
     target.ann_pdf_path = final_ann
@@ -420,10 +548,9 @@ def update_document_analysis(db: Session, doc_id: int, ann_pdf_path: str, descri
 
     # ---------- парсинг отчёта текущей версии ----------
     error_counts, total_violations, occ_map = {}, 0, {}
+    index_version_occurrences(db, target)
     if target.report_path and os.path.exists(target.report_path):
-        with open(target.report_path, "r", encoding="utf-8") as f:
-            rc = f.read()
-        parsed = parse_report(rc, doc_id=doc_id)
+        parsed = version_report(db, target, doc_id=doc_id)
         error_counts = parsed.get("error_counts", {}) or {}
         total_violations = int(parsed.get("total_violations", 0) or 0)
         for occ in parsed.get("occurrences", []) or []:
@@ -0,0 +1,456 @@
+"""
+Очередь анализа в БД (таблица analysis_jobs).
+
+Загрузка ставит задачу в очередь, воркер (python -m worker) забирает её под аренду (lease),
+продлевает аренду, пока идёт анализ, и по завершении отмечает done/failed.
+Задачи с истёкшей арендой (воркер упал/перезапустился) возвращаются в очередь.
+Несколько воркеров на разных машинах могут работать с одной БД: захват задачи —
+условный UPDATE по статусу, поэтому одну задачу получит только один воркер.
+"""
+import glob
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal
+from .models import AnalysisJob, DocumentVersion
+from .crud import update_version_analysis
+from . import metrics
+
+# "inline" — API само выполняет задачу в BackgroundTasks (как раньше, но через очередь);
+# "queue"  — API только ставит задачу, выполняют отдельные воркеры.
+ANALYSIS_WORKER_MODE = os.getenv("ANALYSIS_WORKER_MODE", "inline").lower()
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY_SECONDS = int(os.getenv("JOB_RETRY_DELAY_SECONDS", "30"))
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "1"))
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "2"))
+
+# режим inline: не больше WORKER_CONCURRENCY анализов одновременно на процесс API
+# (BackgroundTasks загрузок и поток start_inline_recovery делят эти слоты)
+INLINE_SLOTS = threading.BoundedSemaphore(max(1, WORKER_CONCURRENCY))
+
+
+class LeaseLost(Exception):
+    """Аренду задачи перехватил другой воркер — результаты этой попытки не сохраняем."""
+
+
+def make_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+# ---------- ОЧЕРЕДЬ ----------
+def enqueue_analysis_job(db: Session, version_id: int, pdf_path: str,
+                         content_sha256: str | None = None) -> AnalysisJob:
+    now = datetime.utcnow()
+    job = AnalysisJob(
+        version_id=version_id,
+        pdf_path=pdf_path,
+        content_sha256=content_sha256,
+        status="queued",
+        attempts=0,
+        max_attempts=JOB_MAX_ATTEMPTS,
+        available_at=now,
+        created_at=now,
+    )
+    db.add(job); db.commit(); db.refresh(job)
+    return job
+
+
+def claim_job(db: Session, worker_id: str, job_id: int | None = None) -> AnalysisJob | None:
+    """
+    Забирает первую доступную задачу (или конкретную job_id) под аренду.
+    Возвращает None, если задач нет или их успел забрать другой воркер.
+    """
+    now = datetime.utcnow()
+    q = db.query(AnalysisJob.id).filter(
+        AnalysisJob.status == "queued",
+        or_(AnalysisJob.available_at.is_(None), AnalysisJob.available_at <= now),
+    )
+    if job_id is not None:
+        q = q.filter(AnalysisJob.id == job_id)
+    candidates = [row.id for row in q.order_by(AnalysisJob.id).limit(10).all()]
+
+    for cid in candidates:
+        updated = db.query(AnalysisJob).filter(
+            AnalysisJob.id == cid,
+            AnalysisJob.status == "queued",
+        ).update({
+            AnalysisJob.status: "running",
+            AnalysisJob.attempts: AnalysisJob.attempts + 1,
+            AnalysisJob.lease_owner: worker_id,
+            AnalysisJob.lease_expires_at: now + timedelta(seconds=JOB_LEASE_SECONDS),
+            AnalysisJob.started_at: now,
+        }, synchronize_session=False)
+        db.commit()
+        if updated:
+            return db.query(AnalysisJob).filter(AnalysisJob.id == cid).first()
+    return None
+
+
+def heartbeat(db: Session, job_id: int, worker_id: str) -> bool:
+    """Продлевает аренду. False — задачу у нас забрали (аренда истекла и её перехватили)."""
+    updated = db.query(AnalysisJob).filter(
+        AnalysisJob.id == job_id,
+        AnalysisJob.status == "running",
+        AnalysisJob.lease_owner == worker_id,
+    ).update({
+        AnalysisJob.lease_expires_at: datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS),
+    }, synchronize_session=False)
+    db.commit()
+    return bool(updated)
+
+
+def complete_job(db: Session, job_id: int, worker_id: str):
+    db.query(AnalysisJob).filter(
+        AnalysisJob.id == job_id,
+        AnalysisJob.lease_owner == worker_id,
+    ).update({
+        AnalysisJob.status: "done",
+        AnalysisJob.lease_owner: None,
+        AnalysisJob.lease_expires_at: None,
+        AnalysisJob.last_error: None,
+        AnalysisJob.finished_at: datetime.utcnow(),
+    }, synchronize_session=False)
+    db.commit()
+
+
+def fail_job(db: Session, job_id: int, worker_id: str, error: str):
+    """Неудачная попытка: назад в очередь с паузой, либо failed после max_attempts."""
+    job = db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
+    if not job or job.lease_owner != worker_id:
+        return
+    now = datetime.utcnow()
+    job.last_error = error
+    job.lease_owner = None
+    job.lease_expires_at = None
+    if (job.attempts or 0) >= (job.max_attempts or JOB_MAX_ATTEMPTS):
+        job.status = "failed"
+        job.finished_at = now
+        _mark_version_failed(db, job)
+    else:
+        job.status = "queued"
+        job.available_at = now + timedelta(seconds=JOB_RETRY_DELAY_SECONDS * job.attempts)
+    db.commit()
+
+
+def _mark_version_failed(db: Session, job: AnalysisJob):
+    """Попытки исчерпаны: версия получает verdict_status="failed" (/result и /history — processing_status "error")."""
+    ver = db.query(DocumentVersion).filter(DocumentVersion.id == job.version_id).first()
+    if ver:
+        last_line = (job.last_error or "").strip().splitlines()[-1:] or [""]
+        ver.verdict_comment = f"Ошибка анализа после {job.attempts} попыток: {last_line[0]}"
+        if ver.verdict_status in (None, "processing"):
+            ver.verdict_status = "failed"
+
+
+def release_job(db: Session, job_id: int, worker_id: str):
+    """Воркер останавливается посреди задачи — возвращаем её в очередь без ожидания аренды."""
+    db.query(AnalysisJob).filter(
+        AnalysisJob.id == job_id,
+        AnalysisJob.lease_owner == worker_id,
+        AnalysisJob.status == "running",
+    ).update({
+        AnalysisJob.status: "queued",
+        AnalysisJob.lease_owner: None,
+        AnalysisJob.lease_expires_at: None,
+        AnalysisJob.available_at: datetime.utcnow(),
+    }, synchronize_session=False)
+    db.commit()
+
+
+def release_worker_jobs(db: Session, worker_ids) -> int:
+    """Возвращает в очередь все задачи, которые ещё держат воркеры worker_ids (остановка воркера)."""
+    updated = db.query(AnalysisJob).filter(
+        AnalysisJob.lease_owner.in_(list(worker_ids)),
+        AnalysisJob.status == "running",
+    ).update({
+        AnalysisJob.status: "queued",
+        AnalysisJob.lease_owner: None,
+        AnalysisJob.lease_expires_at: None,
+        AnalysisJob.available_at: datetime.utcnow(),
+    }, synchronize_session=False)
+    db.commit()
+    return updated
+
+
+def recover_jobs(db: Session) -> int:
+    """
+    Возвращает в очередь задачи, чья аренда истекла (воркер упал или был перезапущен).
+    Если попытки исчерпаны — помечает failed. Возвращает число обработанных задач.
+    """
+    now = datetime.utcnow()
+    stale = db.query(AnalysisJob).filter(
+        AnalysisJob.status == "running",
+        or_(AnalysisJob.lease_expires_at.is_(None), AnalysisJob.lease_expires_at < now),
+    ).all()
+    for job in stale:
+        job.last_error = job.last_error or f"Аренда истекла (воркер {job.lease_owner})"
+        job.lease_owner = None
+        job.lease_expires_at = None
+        if (job.attempts or 0) >= (job.max_attempts or JOB_MAX_ATTEMPTS):
+            job.status = "failed"
+            job.finished_at = now
+            _mark_version_failed(db, job)
+        else:
+            job.status = "queued"
+            job.available_at = now
+    db.commit()
+    return len(stale)
+
+
+# ---------- ВЫПОЛНЕНИЕ ----------
+def normalize_analysis_result(result, original_path: str):
+    """
+    Возвращает (ann_pdf_path, report_path) из результата make_report_files.
+    Поддерживает tuple/list, dict с разными ключами и fallback-поиск рядом с файлом.
+    """
+    # tuple/list
+    if isinstance(result, (list, tuple)) and len(result) >= 2:
+        return str(result[0]), str(result[1])
+
+    # dict
+    if isinstance(result, dict):
+        ann_keys = ("ann_pdf_path", "annotated_path", "annotated_pdf", "annotated")
+        rep_keys = ("report_path", "report", "report_txt", "analysis_report", "txt")
+        ann = next((result[k] for k in ann_keys if k in result), None)
+        rep = next((result[k] for k in rep_keys if k in result), None)
+        if ann and rep:
+            return str(ann), str(rep)
+
+    # fallback: ищем *.annotated.pdf и *.report.* в каталоге исходника
+    base_dir = os.path.dirname(original_path)
+    base_name = os.path.splitext(os.path.basename(original_path))[0]
+
+    cand_ann = os.path.join(base_dir, f"{base_name}.annotated.pdf")
+    if not os.path.exists(cand_ann):
+        found = glob.glob(os.path.join(base_dir, "*.annotated.pdf"))
+        cand_ann = found[0] if found else ""
+
+    rep_glob = glob.glob(os.path.join(base_dir, f"{base_name}.report.*")) or \
+               glob.glob(os.path.join(base_dir, "*.report.*")) or \
+               glob.glob(os.path.join(base_dir, "*.txt"))
+    cand_rep = rep_glob[0] if rep_glob else ""
+
+    return cand_ann, cand_rep
+
+
+def run_analysis(version_id: int, original_path: str, content_sha256: str | None = None,
+                 check_lease=None):
+    """
+    Запускает анализ и сохраняет результаты в БД (собственная сессия).
+    Если такой же PDF (sha256) уже анализировался с тем же конфигом и версией проверок —
+    берём артефакты из кэша результатов и сразу переходим к update_version_analysis.
+    check_lease() вызывается перед записью в БД и бросает LeaseLost, если задача уже не наша.
+    """
+    # импорт здесь: постановка в очередь и recover не тянут за собой анализатор
+    from .analysis.main import make_report_files, pipeline
+    from .analysis.document import DrawingDocument
+    from .analysis import result_cache
+
+    content_sha256 = content_sha256 or result_cache.file_sha256(original_path)
+    hit = result_cache.lookup(content_sha256)
+    if hit:
+        metrics.incr_safe(metrics.RESULT_CACHE_HITS)
+        result = result_cache.restore(hit, original_path)
+    else:
+        metrics.incr_safe(metrics.RESULT_CACHE_MISSES)
+        # 1) запускаем анализатор: сначала pipeline, затем make_report_files
+        # PDF открывается один раз: критерии и построение отчёта используют общий кэш извлечений
+        with DrawingDocument(original_path) as drawing:
+            # Запускаем анализ
+            pipeline_out = pipeline(drawing)
+            # Затем создаем отчеты
+            result = make_report_files(original_path, pipeline_out, drawing=drawing)
+        result_cache.store(content_sha256, original_path, pipeline_out)
+
+    ann_pdf_path, report_path = normalize_analysis_result(result, original_path)
+
+    # 2) сохраняем в БД и перекладываем файлы в правильную папку v{version_number}
+    if check_lease:
+        check_lease()
+    db = SessionLocal()
+    try:
+        update_version_analysis(db, version_id, ann_pdf_path, report_path)
+    finally:
+        db.close()
+
+
+def _heartbeat_loop(job_id: int, worker_id: str, stop: threading.Event, lost: threading.Event):
+    """Продлевает аренду, пока не выставлен stop; потеря аренды — lost (анализ не сохранит результат)."""
+    interval = max(1.0, JOB_LEASE_SECONDS / 3)
+    while not stop.wait(interval):
+        db = SessionLocal()
+        try:
+            if not heartbeat(db, job_id, worker_id):
+                print(f"[job {job_id}] аренда потеряна воркером {worker_id}")
+                lost.set()
+                return
+        except Exception:
+            traceback.print_exc()
+        finally:
+            db.close()
+
+
+def process_job(job_id: int, version_id: int, pdf_path: str, worker_id: str,
+                content_sha256: str | None = None) -> bool:
+    """
+    Выполняет уже захваченную задачу, держа аренду. True — успешно.
+    Если аренда потеряна (задачу перехватил другой воркер), результаты в БД не пишутся,
+    задача не отмечается ни done, ни failed — ею владеет новый воркер.
+    """
+    stop, lost = threading.Event(), threading.Event()
+    hb = threading.Thread(target=_heartbeat_loop, args=(job_id, worker_id, stop, lost), daemon=True)
+    hb.start()
+
+    def check_lease():
+        # продление перед записью: держим аренду ещё JOB_LEASE_SECONDS и заодно проверяем, что она наша
+        if not lost.is_set():
+            db = SessionLocal()
+            try:
+                if heartbeat(db, job_id, worker_id):
+                    return
+            finally:
+                db.close()
+            lost.set()
+        raise LeaseLost(job_id)
+
+    try:
+        run_analysis(version_id, pdf_path, content_sha256, check_lease=check_lease)
+    except LeaseLost:
+        print(f"[job {job_id}] аренда потеряна, результат анализа не сохранён")
+        return False
+    except (KeyboardInterrupt, SystemExit):
+        db = SessionLocal()
+        try:
+            release_job(db, job_id, worker_id)
+        finally:
+            db.close()
+        raise
+    except Exception:
+        error = traceback.format_exc()
+        print(f"[job {job_id}] ошибка анализа:\n{error}")
+        db = SessionLocal()
+        try:
+            fail_job(db, job_id, worker_id, error)
+        finally:
+            db.close()
+        return False
+    finally:
+        stop.set()
+        hb.join()
+
+    if lost.is_set():
+        print(f"[job {job_id}] аренда потеряна, задача не отмечается выполненной")
+        return False
+    db = SessionLocal()
+    try:
+        complete_job(db, job_id, worker_id)
+    finally:
+        db.close()
+    return True
+
+
+def run_next_job(worker_id: str, job_id: int | None = None) -> bool:
+    """Забирает и выполняет одну задачу. False — брать нечего."""
+    db = SessionLocal()
+    try:
+        job = claim_job(db, worker_id, job_id)
+        if job is None:
+            return False
+        job_id, version_id, pdf_path, sha = job.id, job.version_id, job.pdf_path, job.content_sha256
+    finally:
+        db.close()
+    process_job(job_id, version_id, pdf_path, worker_id, sha)
+    return True
+
+
+def run_job_inline(job_id: int):
+    """
+    Режим ANALYSIS_WORKER_MODE=inline: API само выполняет свою задачу в BackgroundTasks.
+    Задача идёт через ту же очередь, поэтому после перезапуска API её подхватит
+    start_inline_recovery (или воркер).
+    Повторные попытки — сразу, без паузы.
+    Если все INLINE_SLOTS заняты, задача остаётся в очереди — её выполнит start_inline_recovery,
+    когда освободится слот.
+    """
+    if not INLINE_SLOTS.acquire(blocking=False):
+        print(f"[job {job_id}] все {WORKER_CONCURRENCY} слота анализа заняты, задача ждёт в очереди")
+        return
+    try:
+        worker_id = make_worker_id()
+        for _ in range(JOB_MAX_ATTEMPTS):
+            db = SessionLocal()
+            try:
+                db.query(AnalysisJob).filter(
+                    AnalysisJob.id == job_id, AnalysisJob.status == "queued"
+                ).update({AnalysisJob.available_at: datetime.utcnow()}, synchronize_session=False)
+                db.commit()
+            finally:
+                db.close()
+            if not run_next_job(worker_id, job_id):
+                return
+    finally:
+        INLINE_SLOTS.release()
+
+
+def worker_loop(worker_id: str | None = None, stop: threading.Event | None = None, once: bool = False,
+                poll_seconds: float | None = None, slots: threading.Semaphore | None = None):
+    """
+    Цикл воркера: забирает задачи по одной, при пустой очереди ждёт poll_seconds
+    (по умолчанию WORKER_POLL_SECONDS). Раз в JOB_LEASE_SECONDS возвращает в очередь
+    задачи упавших воркеров. slots — общий с другими потоками лимит одновременных анализов:
+    без свободного слота задача не берётся.
+    """
+    worker_id = worker_id or make_worker_id()
+    stop = stop or threading.Event()
+    print(f"[worker {worker_id}] запущен")
+    next_recover = 0.0
+    while not stop.is_set():
+        try:
+            if time.monotonic() >= next_recover:
+                db = SessionLocal()
+                try:
+                    recovered = recover_jobs(db)
+                finally:
+                    db.close()
+                if recovered:
+                    print(f"[worker {worker_id}] возвращено в очередь задач: {recovered}")
+                next_recover = time.monotonic() + JOB_LEASE_SECONDS
+            if slots is None or slots.acquire(blocking=False):
+                try:
+                    if run_next_job(worker_id):
+                        continue
+                finally:
+                    if slots is not None:
+                        slots.release()
+        except Exception:
+            traceback.print_exc()
+        if once:
+            break
+        stop.wait(WORKER_POLL_SECONDS if poll_seconds is None else poll_seconds)
+
+
+def start_inline_recovery() -> threading.Event | None:
+    """
+    Режим inline: фоновый поток API, который подбирает задачи, оставшиеся от прошлого запуска
+    (queued — сразу, running — когда истечёт аренда), и повторы после паузы. Опрос — раз в
+    JOB_RETRY_DELAY_SECONDS, в пределах INLINE_SLOTS. Возвращает событие остановки
+    (None в режиме queue — там это делают воркеры).
+    """
+    if ANALYSIS_WORKER_MODE != "inline":
+        return None
+    stop = threading.Event()
+    threading.Thread(
+        target=worker_loop,
+        kwargs={"stop": stop, "poll_seconds": max(1, JOB_RETRY_DELAY_SECONDS), "slots": INLINE_SLOTS},
+        name="inline-jobs", daemon=True,
+    ).start()
+    return stop
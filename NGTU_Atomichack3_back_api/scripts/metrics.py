@@ -0,0 +1,77 @@
+"""
+Счётчики в БД: API и воркеры (в т.ч. на других машинах) пишут в одну таблицу,
+/metrics отдаёт их в текстовом формате Prometheus.
+"""
+import traceback
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal
+from .models import MetricCounter
+
+RESULT_CACHE_HITS = "analysis_result_cache_hits_total"
+RESULT_CACHE_MISSES = "analysis_result_cache_misses_total"
+# кэш отчётов (parse_report) — свой в каждом процессе API, в БД не пишется
+REPORT_CACHE_HITS = "report_cache_hits_total"
+REPORT_CACHE_MISSES = "report_cache_misses_total"
+
+METRIC_HELP = {
+    RESULT_CACHE_HITS: "Анализы, взятые из кэша результатов (побайтно одинаковый PDF)",
+    RESULT_CACHE_MISSES: "Анализы, выполненные полностью (в кэше результатов не найдено)",
+    REPORT_CACHE_HITS: "Отчёты, взятые из кэша отчётов этого процесса",
+    REPORT_CACHE_MISSES: "Отчёты, прочитанные с диска (в кэше отчётов этого процесса не найдено)",
+}
+
+
+def incr(name: str, amount: int = 1, db: Session | None = None):
+    """Атомарно увеличивает счётчик; создаёт его при первом обращении."""
+    own = db is None
+    db = db or SessionLocal()
+    try:
+        for _ in range(2):
+            updated = db.query(MetricCounter).filter(MetricCounter.name == name).update(
+                {MetricCounter.value: MetricCounter.value + amount}, synchronize_session=False
+            )
+            if updated:
+                db.commit()
+                return
+            try:
+                db.add(MetricCounter(name=name, value=amount))
+                db.commit()
+                return
+            except IntegrityError:
+                # счётчик только что создал другой процесс — повторяем UPDATE
+                db.rollback()
+    finally:
+        if own:
+            db.close()
+
+
+def incr_safe(name: str, amount: int = 1):
+    """
+    incr для критичного пути (анализ): ошибка записи счётчика (например, SQLite занята)
+    печатается и игнорируется, а не роняет вызывающий код.
+    """
+    try:
+        incr(name, amount)
+    except Exception:
+        print(f"[metrics] не удалось увеличить {name}:")
+        traceback.print_exc()
+
+
+def get_counters(db: Session) -> dict[str, int]:
+    counters = {name: 0 for name in METRIC_HELP}
+    for row in db.query(MetricCounter).all():
+        counters[row.name] = int(row.value or 0)
+    return counters
+
+
+def render_prometheus(counters: dict[str, int]) -> str:
+    lines = []
+    for name, value in sorted(counters.items()):
+        if name in METRIC_HELP:
+            lines.append(f"# HELP {name} {METRIC_HELP[name]}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, JSON
 from sqlalchemy.orm import relationship
 from .db import Base
 
@@ -13,9 +13,9 @@ class User(Base):
 class Document(Base):
     __tablename__ = "documents"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     filename = Column(String)
-    upload_date = Column(DateTime)
+    upload_date = Column(DateTime, index=True)   # сортировка и фильтр по дате в /history
     status = Column(String, default="processing")
     ann_pdf_path = Column(String, nullable=True)
     description = Column(String, nullable=True)
@@ -53,3 +53,54 @@ class Decision(Base):
     author_role = Column(String)       # 'developer' | 'norm_controller' | 'admin' | 'system'
     comment = Column(Text)
     timestamp = Column(DateTime)
+
+
+class Occurrence(Base):
+    """
+    Срабатывание критерия в отчёте версии (одна строка описания × один пункт кластера).
+    Заполняется при сохранении анализа (crud.index_version_occurrences); статистика
+    и эндпоинты читают отсюда, а не разбирают отчёты с диска.
+    """
+    __tablename__ = "occurrences"
+    id = Column(Integer, primary_key=True, index=True)
+    version_id = Column(Integer, ForeignKey("document_versions.id"), index=True)
+    position = Column(Integer)                      # порядок в отчёте
+    criterion = Column(String, index=True)          # пункт, например "1.1.3"
+    occ_id = Column(String, index=True)             # тот же id, что [occ:...] в решениях
+    cluster_num = Column(Integer, nullable=True)    # номер ошибки [#NNN] = номер кластера
+    page = Column(Integer, nullable=True)
+    bbox = Column(JSON, nullable=True)              # [x0, y0, x1, y1] в пунктах PDF (violations.json)
+    description = Column(Text)
+
+
+class AnalysisJob(Base):
+    """Очередь анализа: задачу забирает воркер (python -m worker) под аренду (lease)."""
+    __tablename__ = "analysis_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    version_id = Column(Integer, ForeignKey("document_versions.id"), index=True)
+    pdf_path = Column(String)
+    status = Column(String, default="queued", index=True)  # 'queued' | 'running' | 'done' | 'failed'
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    available_at = Column(DateTime, nullable=True)    # не раньше этого времени (пауза между попытками)
+    lease_owner = Column(String, nullable=True)       # id воркера, который держит задачу
+    lease_expires_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    content_sha256 = Column(String, nullable=True, index=True)  # sha256 загруженного PDF (ключ кэша результатов)
+
+
+class DataMigration(Base):
+    """Однократные обновления данных (например, индексация старых отчётов): строка — шаг выполнен."""
+    __tablename__ = "data_migrations"
+    name = Column(String, primary_key=True)
+    done_at = Column(DateTime)
+
+
+class MetricCounter(Base):
+    """Счётчики для /metrics, общие для API и всех воркеров."""
+    __tablename__ = "metric_counters"
+    name = Column(String, primary_key=True)
+    value = Column(Integer, default=0)
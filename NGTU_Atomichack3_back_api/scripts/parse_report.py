@@ -1,7 +1,28 @@
 # scripts/parse_report.py
 import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
 
-def _natkey(point: str):
+# Канонический отчёт анализа — {stem}.report.json рядом с {stem}.report.txt.
+# TXT — его текстовое представление (render_report_txt); срабатывания (occurrences),
+# их occ_id и номера кластеров вычисляются один раз при анализе (build_report),
+# а чтение отчёта сводится к одной десериализации (load_report).
+# Для версий, проанализированных раньше, load_report по-прежнему разбирает TXT.
+REPORT_JSON_VERSION = 1
+
+# Кэш загруженных отчётов на процесс (LRU по числу записей). Ключ — (вид, путь, mtime/размер
+# JSON и TXT, doc_id): перезаписанный отчёт даёт новый ключ, старая запись вытесняется.
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "256"))
+
+_cache_lock = threading.Lock()
+_cache: OrderedDict = OrderedDict()
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def natkey(point: str):
     parts = []
     for p in point.split("."):
         try:
@@ -14,27 +35,16 @@ def _occ_id(point: str, desc: str) -> str:
     h = hashlib.sha1(f"{point}|{desc}".encode("utf-8")).hexdigest()
     return h[:12]
 
-def parse_report(report_content: str, doc_id: int = None):
+def _parse_occurrences(report_content: str) -> list[tuple]:
     """
-    Возвращает:
-      - error_points: список по КАЖДОМУ срабатыванию (по одному элементу на ошибку)
-          { point, description, pdf_url, occ_id, error_num }
-      - error_counts: dict(point -> count)
-      - total_violations: общее число срабатываний
-      - full_report: исходный текст
-      - occurrences: [{id, point, description}] — вспомогательное (можно игнорировать на фронте)
-    Формат входного отчёта прежний:
-        [# ...]
-        Пункты: 1.1, 1.1.1
-        - (описание/контекст; часто содержит страницу/лист)
-        - ...
+    Срабатывания TXT-отчёта в порядке строк: [(point, desc, occ_id, error_num)].
+    Нужен только для версий без report.json; новые отчёты — _cluster_occurrences.
     """
     lines = report_content.splitlines()
 
     current_points = []
     current_error_num = None  # Номер текущей ошибки
     occurrences = []   # [(point, desc, occ_id, error_num)]
-    error_counts = {}
 
     for raw in lines:
         line = raw.rstrip("\n")
@@ -42,7 +52,6 @@ def parse_report(report_content: str, doc_id: int = None):
         if line.startswith("[#"):
             current_points = []
             # Извлекаем номер ошибки из формата [#013]
-            import re
             match = re.search(r"\[#(\d+)\]", line)
             current_error_num = match.group(1) if match else None
 
@@ -63,10 +72,16 @@ def parse_report(report_content: str, doc_id: int = None):
             for pt in current_points:
                 oid = _occ_id(pt, desc)
                 occurrences.append((pt, desc, oid, current_error_num))
-                error_counts[pt] = error_counts.get(pt, 0) + 1
+    return occurrences
+
+def report_result(occurrences: list[tuple], report_content: str, doc_id: int = None):
+    """Ответ parse_report по срабатываниям в порядке отчёта: [(point, desc, occ_id, error_num)]."""
+    error_counts = {}
+    for pt, _, _, _ in occurrences:
+        error_counts[pt] = error_counts.get(pt, 0) + 1
 
     # сортируем: по критерию «натурально»
-    occurrences.sort(key=lambda x: (_natkey(x[0]), ))
+    occurrences = sorted(occurrences, key=lambda x: (natkey(x[0]), ))
 
     error_points = []
     occ_list = []
@@ -90,3 +105,176 @@ def parse_report(report_content: str, doc_id: int = None):
         "full_report": report_content,
         "occurrences": occ_list,
     }
+
+def parse_report(report_content: str, doc_id: int = None):
+    """
+    Возвращает:
+      - error_points: список по КАЖДОМУ срабатыванию (по одному элементу на ошибку)
+          { point, description, pdf_url, occ_id, error_num }
+      - error_counts: dict(point -> count)
+      - total_violations: общее число срабатываний
+      - full_report: исходный текст
+      - occurrences: [{id, point, description}] — вспомогательное (можно игнорировать на фронте)
+    Формат входного отчёта прежний:
+        [# ...]
+        Пункты: 1.1, 1.1.1
+        - (описание/контекст; часто содержит страницу/лист)
+        - ...
+    """
+    return report_result(_parse_occurrences(report_content), report_content, doc_id)
+
+
+# ---------- канонический JSON-отчёт ----------
+def report_json_path(report_path: str) -> str:
+    """{stem}.report.txt → {stem}.report.json"""
+    return os.path.splitext(report_path)[0] + ".json"
+
+def render_report_txt(report: dict) -> str:
+    """TXT-отчёт из канонического: кластеры нарушений, затем строки [инфо]/[GLOBAL]."""
+    lines = [
+        f"Файл: {report['file']}",
+        f"Всего нарушений (кластеров): {len(report['clusters'])}",
+        "",
+    ]
+    for v in report["clusters"]:
+        lines.append(f"[#{v['num']:03d}] страница {v['page']}")
+        lines.append(f"  Пункты: " + ",".join(v["criteria"]))
+        lines.append("  Описания:")
+        for it in v["items"]:
+            lines.append(f"   - ({it['criterion']}) {it['note']}")
+        lines.append("")
+    lines.extend(report["notes"])
+    return "\n".join(lines).rstrip() + "\n"
+
+def _cluster_occurrences(clusters: list[dict]) -> list[tuple]:
+    """
+    Срабатывания по кластерам, как их давал разбор TXT: каждая строка описания — на каждый
+    пункт кластера, описание — "(criterion) note" (без внешних скобок, если ими обёрнуто целиком),
+    номер ошибки — "013". Поэтому occ_id совпадают с версиями, разобранными из TXT.
+    """
+    occurrences = []
+    for v in clusters:
+        error_num = f"{v['num']:03d}"
+        for it in v["items"]:
+            desc = f"({it['criterion']}) {it['note']}".strip()
+            if desc.startswith("(") and desc.endswith(")"):
+                desc = desc[1:-1].strip()
+            for pt in v["criteria"]:
+                occurrences.append((pt, desc, _occ_id(pt, desc), error_num))
+    return occurrences
+
+def build_report(file_name: str, clusters: list[dict], notes: list[str]) -> dict:
+    """
+    Канонический отчёт: clusters — [{num, page, criteria, items: [{criterion, note}]}] (items уже
+    в порядке вывода), notes — строки [инфо]/[GLOBAL]. Срабатывания строятся по кластерам
+    (_cluster_occurrences), а не по TXT, occ_id совпадают с прежними.
+    """
+    report = {
+        "format": REPORT_JSON_VERSION,
+        "file": file_name,
+        "clusters": [
+            {
+                "num": v["num"],
+                "page": v["page"],
+                "criteria": list(v["criteria"]),
+                "items": [{"criterion": it["criterion"], "note": it["note"]} for it in v["items"]],
+            }
+            for v in clusters
+        ],
+        "notes": list(notes),
+    }
+    report["occurrences"] = [
+        {"point": pt, "description": desc, "occ_id": oid, "error_num": num}
+        for pt, desc, oid, num in _cluster_occurrences(report["clusters"])
+    ]
+    return report
+
+def _file_stat(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+def _cached(kind: str, report_path: str, doc_id, load):
+    """
+    Значение load() из кэша отчётов. Загрузка идёт вне блокировки: два потока с одним
+    промахом прочитают файл оба, но в кэше останется одна запись.
+    Возвращаемые объекты общие для всех запросов — их нельзя модифицировать.
+    """
+    if REPORT_CACHE_SIZE <= 0:
+        return load()
+    key = (
+        kind, os.path.abspath(report_path),
+        _file_stat(report_json_path(report_path)), _file_stat(report_path), doc_id,
+    )
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            _cache_stats["hits"] += 1
+            return _cache[key]
+    value = load()
+    with _cache_lock:
+        _cache_stats["misses"] += 1
+        _cache[key] = value
+        _cache.move_to_end(key)
+        while len(_cache) > REPORT_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return value
+
+def report_cache_stats() -> dict:
+    """{"hits", "misses", "size"} кэша отчётов этого процесса."""
+    with _cache_lock:
+        return {**_cache_stats, "size": len(_cache)}
+
+def _load_json_report(report_path: str) -> dict | None:
+    try:
+        with open(report_json_path(report_path), "r", encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return report if report and report.get("format") == REPORT_JSON_VERSION else None
+
+def _read_occurrences(report_path: str) -> list[tuple]:
+    report = _load_json_report(report_path)
+    if report:
+        return [(o["point"], o["description"], o["occ_id"], o["error_num"]) for o in report["occurrences"]]
+    if os.path.exists(report_path):
+        with open(report_path, "r", encoding="utf-8") as f:
+            return _parse_occurrences(f.read())
+    return []
+
+def report_occurrences(report_path: str | None) -> list[tuple]:
+    """Срабатывания отчёта в порядке строк [(point, desc, occ_id, error_num)]: из JSON, иначе из TXT."""
+    if not report_path:
+        return []
+    return _cached("occurrences", report_path, None, lambda: _read_occurrences(report_path))
+
+def _read_text(report_path: str) -> str:
+    report = _load_json_report(report_path)
+    if report:
+        return render_report_txt(report)
+    try:
+        with open(report_path, "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+def report_text(report_path: str | None) -> str:
+    """Текст отчёта (full_report); "" — отчёта нет."""
+    if not report_path:
+        return ""
+    return _cached("text", report_path, None, lambda: _read_text(report_path))
+
+def load_report(report_path: str | None, doc_id: int = None):
+    """
+    То же, что parse_report(текст отчёта), но из {stem}.report.json, если он есть
+    (одна десериализация); иначе — разбор TXT. Нет отчёта — пустой результат.
+    Результат кэшируется по (путь, mtime/размер, doc_id).
+    """
+    if not report_path:
+        return parse_report("", doc_id=doc_id)
+    return _cached(
+        "report", report_path, doc_id,
+        lambda: report_result(report_occurrences(report_path), report_text(report_path), doc_id),
+    )
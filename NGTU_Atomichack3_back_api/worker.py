@@ -0,0 +1,105 @@
+"""
+Воркер анализа: забирает задачи из analysis_jobs и выполняет их.
+
+    python -m worker                  # WORKER_CONCURRENCY процессов (по умолчанию 1)
+    python -m worker -c 4             # 4 задачи одновременно
+    python -m worker --once           # обработать очередь и выйти
+
+Воркеры на разных машинах могут работать с одной БД (DATABASE_URL).
+При старте возвращает в очередь задачи, прерванные перезапуском.
+"""
+import argparse
+import multiprocessing as mp
+import signal
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from scripts.models import Base
+from scripts.db import engine, SessionLocal
+from scripts.jobs import WORKER_CONCURRENCY, make_worker_id, recover_jobs, release_worker_jobs, worker_loop
+
+# сколько ждать завершения процессов-воркеров после SIGTERM, прежде чем убить их
+STOP_TIMEOUT_SECONDS = 30
+
+
+def _raise_interrupt(signum, frame):
+    # повторный сигнал во время остановки не должен прервать возврат задач в очередь
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise KeyboardInterrupt
+
+
+def _release(worker_ids) -> int:
+    db = SessionLocal()
+    try:
+        return release_worker_jobs(db, worker_ids)
+    finally:
+        db.close()
+
+
+def _run_single(once: bool, worker_id: str | None = None):
+    # SIGTERM (docker stop / systemd) — как Ctrl+C: новые задачи не берутся, текущая возвращается в очередь
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    worker_id = worker_id or make_worker_id()
+    try:
+        worker_loop(worker_id, once=once)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        _release([worker_id])
+
+
+def _stop(procs, worker_ids):
+    """Останавливает процессы-воркеры (SIGTERM, затем SIGKILL) и возвращает их задачи в очередь."""
+    for p in procs:
+        if p.is_alive():
+            p.terminate()
+    for p in procs:
+        p.join(STOP_TIMEOUT_SECONDS)
+    for p in procs:
+        if p.is_alive():
+            p.kill()
+            p.join()
+    released = _release(worker_ids)
+    if released:
+        print(f"[worker] возвращено в очередь задач остановленных процессов: {released}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воркер очереди анализа PDF")
+    parser.add_argument("-c", "--concurrency", type=int, default=WORKER_CONCURRENCY,
+                        help="Сколько задач выполнять одновременно (процессов)")
+    parser.add_argument("--once", action="store_true", help="Обработать очередь и выйти")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        recovered = recover_jobs(db)
+    finally:
+        db.close()
+    if recovered:
+        print(f"[worker] возвращено в очередь прерванных задач: {recovered}")
+
+    if args.concurrency <= 1:
+        _run_single(args.once)
+        return
+
+    # SIGTERM родителю — остановить дочерние процессы, а не оставить их сиротами с арендой задач
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    ctx = mp.get_context("spawn")
+    worker_ids = [make_worker_id() for _ in range(args.concurrency)]
+    procs = [ctx.Process(target=_run_single, args=(args.once, wid)) for wid in worker_ids]
+    try:
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        _stop(procs, worker_ids)
+
+
+if __name__ == "__main__":
+    main()